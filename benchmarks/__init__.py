@@ -0,0 +1 @@
+"""Benchmarks, not shipped with the package."""
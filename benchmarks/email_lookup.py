@@ -0,0 +1,89 @@
+"""Compare case-insensitive user lookups by email, 'ilike' against 'normalized_email'.
+
+Run from the repository root::
+
+    python -m benchmarks.email_lookup [user_count] [iterations]
+
+Uses an in-memory SQLite database (see ``TestConfig``), so absolute numbers are only
+indicative; the query plans and relative timings are what matter.
+"""
+
+
+import sys
+from datetime import datetime
+from time import perf_counter
+
+from sqlalchemy import text
+
+from xl_auth.app import create_app
+from xl_auth.extensions import db
+from xl_auth.settings import TestConfig
+from xl_auth.user.models import User
+
+#: Users inserted per statement when creating the fixture.
+INSERT_BATCH_SIZE = 10000
+
+
+def ilike_lookup(email):
+    """Baseline: 'ilike' on 'email', which no index covers."""
+    return User.query.filter(User.email.ilike(email)).first()
+
+
+def normalized_lookup(email):
+    """Shipped path: equality on the unique 'normalized_email' index."""
+    return User.get_by_email(email)
+
+
+def create_fixture(user_count):
+    """Insert 'user_count' users, bypassing the ORM and bcrypt."""
+    now = datetime.utcnow()
+    password = User('admin@example.com', 'Admin').password
+    users = User.__table__
+    for offset in range(0, user_count, INSERT_BATCH_SIZE):
+        db.session.execute(users.insert(), [
+            dict(id=i + 1, email='User{0}@Example.com'.format(i),
+                 normalized_email='user{0}@example.com'.format(i), full_name='User',
+                 password=password, is_active=True, is_deleted=False, is_admin=False,
+                 modified_at=now, modified_by_id=1, created_at=now, created_by_id=1)
+            for i in range(offset, min(offset + INSERT_BATCH_SIZE, user_count))])
+    db.session.commit()
+
+
+def get_plan(strategy, email):
+    """Return SQLite's query plan for 'strategy'."""
+    query = {ilike_lookup: User.query.filter(User.email.ilike(email)),
+             normalized_lookup: User.query.filter_by(
+                 normalized_email=User.normalize_email(email))}[strategy]
+    statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(text('EXPLAIN QUERY PLAN {0}'.format(statement))).all()
+    return '; '.join(row[-1] for row in rows)
+
+
+def run(strategy, emails):
+    """Return seconds per lookup for 'strategy'."""
+    started = perf_counter()
+    for email in emails:
+        assert strategy(email) is not None
+        db.session.expunge_all()
+    return (perf_counter() - started) / len(emails)
+
+
+def main(user_count=100000, iterations=200):
+    """Print timings and query plans for each strategy."""
+    app = create_app(TestConfig)
+    with app.test_request_context():
+        db.create_all()
+        create_fixture(user_count)
+        step = max(1, user_count // iterations)
+        emails = ['USER{0}@example.COM'.format(i) for i in range(0, user_count, step)]
+        print('{0:>7}  {1:<18} {2:>10}  {3}'.format('users', 'strategy', 'ms/lookup', 'plan'))
+        for name, strategy in (('ilike (baseline)', ilike_lookup),
+                               ('normalized_email', normalized_lookup)):
+            print('{0:>7}  {1:<18} {2:>10.3f}  {3}'.format(
+                user_count, name, run(strategy, emails) * 1000, get_plan(strategy, emails[0])))
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
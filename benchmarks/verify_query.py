@@ -0,0 +1,156 @@
+"""Compare '/oauth/verify' lookup strategies for users with many permissions.
+
+Run from the repository root::
+
+    python -m benchmarks.verify_query [iterations]
+
+Uses an in-memory SQLite database (see ``TestConfig``), so absolute numbers are only
+indicative; the statement counts and relative timings are what matter.
+"""
+
+
+import sys
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from sqlalchemy import and_, event, select
+
+from xl_auth.app import create_app
+from xl_auth.collection.models import Collection
+from xl_auth.extensions import db
+from xl_auth.oauth.client.models import Client
+from xl_auth.oauth.token.models import Token
+from xl_auth.oauth.views import _get_verify_results
+from xl_auth.permission.models import Permission
+from xl_auth.settings import TestConfig
+from xl_auth.user.models import User
+
+#: Permissions per user to benchmark with.
+PERMISSION_COUNTS = (100, 1000)
+
+
+def orm_verify(access_token):
+    """Baseline: Token ORM object, lazy-loaded User and its joined-loaded permission graph."""
+    token = Token.query.filter_by(access_token=access_token).first()
+    user = token.user
+    return {'expires_at': token.expires_at.isoformat() + 'Z',
+            'user': {'full_name': user.full_name, 'email': user.email, 'id': user.id,
+                     'permissions': [{'code': permission.collection.code,
+                                      'friendly_name': permission.collection.friendly_name,
+                                      'cataloger': permission.cataloger,
+                                      'registrant': permission.registrant,
+                                      'global_registrant': permission.global_registrant}
+                                     for permission in user.permissions
+                                     if permission.collection.is_active]}}
+
+
+def core_projection_verify(access_token):
+    """Live Core projection: tokens, users, permissions and active collections in one join."""
+    tokens, users, permissions, collections = \
+        Token.__table__, User.__table__, Permission.__table__, Collection.__table__
+    rows = db.session.execute(
+        select(tokens.c.expires_at, users.c.id, users.c.email, users.c.full_name,
+               collections.c.code, collections.c.friendly_name,
+               permissions.c.cataloger, permissions.c.registrant,
+               permissions.c.global_registrant)
+        .select_from(
+            tokens
+            .join(users, users.c.id == tokens.c.user_id)
+            .outerjoin(permissions, permissions.c.user_id == users.c.id)
+            .outerjoin(collections, and_(collections.c.id == permissions.c.collection_id,
+                                         collections.c.is_active.is_(True))))
+        .where(tokens.c.access_token == access_token)
+        .order_by(permissions.c.id)).all()
+    return {'expires_at': rows[0].expires_at.isoformat() + 'Z',
+            'user': {'full_name': rows[0].full_name, 'email': rows[0].email, 'id': rows[0].id,
+                     'permissions': [{'code': row.code,
+                                      'friendly_name': row.friendly_name,
+                                      'cataloger': row.cataloger,
+                                      'registrant': row.registrant,
+                                      'global_registrant': row.global_registrant}
+                                     for row in rows if row.code is not None]}}
+
+
+def document_verify(access_token):
+    """Shipped path: token row joined to the materialized authorization document."""
+    result = _get_verify_results([access_token])[access_token]
+    return {'expires_at': result.expires_at.isoformat() + 'Z', 'user': result.user_document}
+
+
+def create_fixture(permission_count):
+    """Create a user with 'permission_count' permissions and an access token; return the token."""
+    now = datetime.utcnow()
+    admin = User(email='admin@example.com', full_name='Admin', is_admin=True, is_active=True,
+                 tos_approved_at=now, modified_by_id=1, created_by_id=1)
+    admin.set_password('example')
+    db.session.add(admin)
+    db.session.flush()
+    user = User(email='user@example.com', full_name='User', is_active=True,
+                tos_approved_at=now, modified_by=admin, created_by=admin)
+    user.set_password('example')
+    db.session.add(user)
+    collections = [Collection(code='c{0}'.format(i), friendly_name='Collection {0}'.format(i),
+                              category='library', is_active=i % 10 != 0,
+                              modified_by=admin, created_by=admin)
+                   for i in range(permission_count)]
+    db.session.add_all(collections)
+    db.session.add_all(Permission(user=user, collection=collection, cataloger=True,
+                                  registrant=bool(i % 2), modified_by=admin, created_by=admin)
+                       for i, collection in enumerate(collections))
+    client = Client(name='Benchmark', description='Benchmark', is_confidential=True,
+                    redirect_uris='',
+                    default_scopes='read write', modified_by=admin, created_by=admin)
+    db.session.add(client)
+    db.session.add(Token(access_token='benchmarkToken', refresh_token='benchmarkRefresh',
+                         token_type='Bearer', scopes='read write',
+                         expires_at=now + timedelta(hours=1), client=client, user=user))
+    db.session.commit()
+    return 'benchmarkToken'
+
+
+def run(strategy, access_token, iterations):
+    """Return (seconds per call, statements per call) for 'strategy'."""
+    statements = []
+
+    def count(*_):
+        statements.append(None)
+
+    engine = db.engine
+    strategy(access_token)  # Warm up, e.g. build the authorization document.
+    db.session.expunge_all()
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        started = perf_counter()
+        for _ in range(iterations):
+            strategy(access_token)
+            db.session.expunge_all()
+        elapsed = perf_counter() - started
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    return elapsed / iterations, len(statements) / iterations
+
+
+def main(iterations=50):
+    """Print timings for each strategy and permission count."""
+    app = create_app(TestConfig)
+    strategies = (('ORM (baseline)', orm_verify),
+                  ('Core projection', core_projection_verify),
+                  ('Authorization document', document_verify))
+    print('{0:>11}  {1:<24} {2:>10} {3:>11}'.format('permissions', 'strategy', 'ms/call',
+                                                    'statements'))
+    for permission_count in PERMISSION_COUNTS:
+        with app.test_request_context():
+            db.create_all()
+            access_token = create_fixture(permission_count)
+            expected = orm_verify(access_token)
+            for name, strategy in strategies:
+                assert strategy(access_token) == expected, name
+                seconds, statements = run(strategy, access_token, iterations)
+                print('{0:>11}  {1:<24} {2:>10.2f} {3:>11.1f}'.format(
+                    permission_count, name, seconds * 1000, statements))
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,74 @@
+"""Add new table for AuthorizationDocument model.
+
+Revision ID: 3d5e8f0a9c21
+Revises: 14302cf25610
+Create Date: 2026-10-17 09:12:41.318205
+
+"""
+
+
+from datetime import datetime
+
+import sqlalchemy as sa
+from alembic import op
+
+# Revision identifiers, used by Alembic.
+revision = '3d5e8f0a9c21'
+down_revision = '14302cf25610'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Create 'authorization_documents' table, with a document for every user."""
+    authorization_documents = op.create_table(
+        'authorization_documents',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('document', sa.JSON(), nullable=False),
+        sa.Column('modified_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+
+    users = sa.table('users', sa.column('id'), sa.column('email'), sa.column('full_name'))
+    permissions = sa.table('permissions', sa.column('id'), sa.column('user_id'),
+                           sa.column('collection_id'), sa.column('cataloger'),
+                           sa.column('registrant'), sa.column('global_registrant'))
+    collections = sa.table('collections', sa.column('id'), sa.column('code'),
+                           sa.column('friendly_name'), sa.column('is_active'))
+    rows = op.get_bind().execute(
+        sa.select(users.c.id, users.c.email, users.c.full_name,
+                  collections.c.code, collections.c.friendly_name,
+                  permissions.c.cataloger, permissions.c.registrant,
+                  permissions.c.global_registrant)
+        .select_from(
+            users
+            .outerjoin(permissions, permissions.c.user_id == users.c.id)
+            .outerjoin(collections, sa.and_(collections.c.id == permissions.c.collection_id,
+                                            collections.c.is_active.is_(True))))
+        .order_by(users.c.id, permissions.c.id))
+
+    # Same layout as 'AuthorizationDocument.build'.
+    documents = dict()
+    for row in rows:
+        if row.id not in documents:
+            documents[row.id] = {'full_name': row.full_name, 'email': row.email, 'id': row.id,
+                                 'permissions': []}
+        if row.code is not None:
+            documents[row.id]['permissions'].append({
+                'code': row.code,
+                'friendly_name': row.friendly_name,
+                'cataloger': row.cataloger,
+                'registrant': row.registrant,
+                'global_registrant': row.global_registrant
+            })
+    if documents:
+        now = datetime.utcnow()
+        op.bulk_insert(authorization_documents, [
+            {'user_id': user_id, 'document': document, 'modified_at': now}
+            for user_id, document in documents.items()])
+
+
+def downgrade():
+    """Drop 'authorization_documents' table."""
+    op.drop_table('authorization_documents')
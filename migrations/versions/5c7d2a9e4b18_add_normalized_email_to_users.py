@@ -0,0 +1,39 @@
+"""Add column 'normalized_email' to users table.
+
+Revision ID: 5c7d2a9e4b18
+Revises: 8a1c4e7b2f90
+Create Date: 2026-10-17 14:21:40.118263
+
+"""
+
+
+import sqlalchemy as sa
+from alembic import op
+
+# Revision identifiers, used by Alembic.
+revision = '5c7d2a9e4b18'
+down_revision = '8a1c4e7b2f90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Add unique, indexed column 'normalized_email', lower-cased 'email', to users table.
+
+    Fails on the unique index if two users' emails differ only by case; merge or rename
+    them first, e.g. found with 'SELECT lower(email) FROM users GROUP BY 1 HAVING count(*) > 1'.
+    """
+    op.add_column('users', sa.Column('normalized_email', sa.String(length=255), nullable=True))
+    op.execute('UPDATE users SET normalized_email = lower(email)')
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.alter_column('normalized_email', existing_type=sa.String(length=255),
+                              nullable=False)
+        batch_op.create_index(batch_op.f('ix_users_normalized_email'), ['normalized_email'],
+                              unique=True)
+
+
+def downgrade():
+    """Remove column 'normalized_email' from users table."""
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_normalized_email'))
+        batch_op.drop_column('normalized_email')
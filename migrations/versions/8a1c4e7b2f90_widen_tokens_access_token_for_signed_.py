@@ -0,0 +1,32 @@
+"""Widen 'tokens.access_token' to fit signed access tokens.
+
+Revision ID: 8a1c4e7b2f90
+Revises: 3d5e8f0a9c21
+Create Date: 2026-10-17 11:02:17.530912
+
+"""
+
+
+import sqlalchemy as sa
+from alembic import op
+
+# Revision identifiers, used by Alembic.
+revision = '8a1c4e7b2f90'
+down_revision = '3d5e8f0a9c21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Widen 'tokens.access_token' from 256 to 2048 characters."""
+    with op.batch_alter_table('tokens', schema=None) as batch_op:
+        batch_op.alter_column('access_token', existing_type=sa.String(length=256),
+                              type_=sa.String(length=2048), existing_nullable=False)
+
+
+def downgrade():
+    """Narrow 'tokens.access_token' back to 256 characters, dropping longer (signed) tokens."""
+    op.execute('DELETE FROM tokens WHERE length(access_token) > 256')
+    with op.batch_alter_table('tokens', schema=None) as batch_op:
+        batch_op.alter_column('access_token', existing_type=sa.String(length=2048),
+                              type_=sa.String(length=256), existing_nullable=False)
@@ -0,0 +1,27 @@
+"""Add index for counting a user's active, recent password resets.
+
+Revision ID: e4a7c1d9b362
+Revises: 5c7d2a9e4b18
+Create Date: 2026-10-18 09:12:05.604417
+
+"""
+
+
+from alembic import op
+
+# Revision identifiers, used by Alembic.
+revision = 'e4a7c1d9b362'
+down_revision = '5c7d2a9e4b18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Add index on 'password_resets (user_id, is_active, created_at)'; 'code' is already unique."""
+    op.create_index('ix_password_resets_user_id_is_active_created_at', 'password_resets',
+                    ['user_id', 'is_active', 'created_at'], unique=False)
+
+
+def downgrade():
+    """Drop index on 'password_resets (user_id, is_active, created_at)'."""
+    op.drop_index('ix_password_resets_user_id_is_active_created_at', table_name='password_resets')
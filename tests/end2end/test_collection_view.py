@@ -184,3 +184,39 @@ def test_non_cataloging_admin_users_sees_only_cataloging_admins_on_unassociated_
     assert _('Permissions') not in res
     assert _('You will only see all permissions for those collections that you are '
              'cataloging admin for.') not in res
+
+
+def test_collection_overview_is_aggregated_searchable_and_paginated(user, testapp, db):
+    """List collections with and without users, filtered, a page at a time."""
+    for code in ('PAGE1', 'PAGE2', 'PAGE3'):
+        PermissionFactory(user=user, collection=CollectionFactory(code=code,
+                                                                  category='library'))
+    CollectionFactory(code='PAGE4', friendly_name='Empty 50%', category='library')
+    CollectionFactory(code='PAGE5', category='bibliography')
+    db.session.commit()
+    # Logs in.
+    res = testapp.get('/')
+    form = res.forms['loginForm']
+    form['username'] = user.email
+    form['password'] = 'myPrecious'
+    form.submit().follow()
+
+    def listed_codes(res, anchor):
+        return [code.strip() for code in res.lxml.xpath(
+            "//div[a[@id='{0}']]//tbody/tr/td[1]/a[2]/text()".format(anchor))]
+
+    res = testapp.get(url_for('collection.home', q='page', per_page=2))
+    assert listed_codes(res, 'active-collections-with-users') == ['PAGE1', 'PAGE2']
+    assert listed_codes(res, 'active-collections-without-users') == ['PAGE4', 'PAGE5']
+    assert res.lxml.xpath("//tr[td/a[contains(., 'PAGE1')]]/td[4]/text()") == ['1']
+    # Pages through the section with users, without moving the other one.
+    res = res.click(href='page=2', index=0)
+    assert listed_codes(res, 'active-collections-with-users') == ['PAGE3']
+    assert listed_codes(res, 'active-collections-without-users') == ['PAGE4', 'PAGE5']
+
+    res = testapp.get(url_for('collection.home', q='page', category='bibliography'))
+    assert listed_codes(res, 'active-collections-with-users') == []
+    assert listed_codes(res, 'active-collections-without-users') == ['PAGE5']
+    # Searches by friendly name too, taking wildcards literally.
+    res = testapp.get(url_for('collection.home', q='y 50%'))
+    assert listed_codes(res, 'active-collections-without-users') == ['PAGE4']
@@ -3,14 +3,21 @@
 
 from base64 import b64encode
 from datetime import datetime, timedelta
+from time import sleep, time
 
 from flask import url_for
+from sqlalchemy import event
 
 from xl_auth import __version__
+from xl_auth.oauth.cache import verify_cache
+from xl_auth.oauth.client.models import Client
+from xl_auth.oauth.client.registry import client_registry
 from xl_auth.oauth.grant.models import Grant
+from xl_auth.oauth.grant.store import grant_store
 from xl_auth.oauth.token.models import Token
+from xl_auth.offline_verification import dump_access_token, load_access_token
 
-from ..factories import CollectionFactory, PermissionFactory
+from ..factories import ClientFactory, CollectionFactory, PermissionFactory, TokenFactory
 
 
 def test_oauth_authorize_success(user, client, testapp):
@@ -86,15 +93,26 @@ def test_oauth_authorize_invalid_client_id(user, client, testapp):
 
 # TODO: Add tests for redirect_uri missing/invalid.
 
-def test_get_access_token(grant, testapp):
-    """Get access token using grant code."""
+def test_get_access_token(db, grant, testapp):
+    """Get access token using grant code, querying its client only once."""
     credentials = '%s:%s' % (grant.client.client_id, grant.client.client_secret)
     auth_code = str(b64encode(credentials.encode()).decode())
-    res = testapp.get(url_for('oauth.create_access_token'),
-                      params={'grant_type': 'authorization_code',
-                              'code': grant.code,
-                              'redirect_uri': grant.redirect_uri},
-                      headers={'Authorization': str('Basic ' + auth_code)})
+    client_statements = []
+
+    def count_client_statements(_, __, statement, *___):
+        if 'FROM clients' in statement:
+            client_statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count_client_statements)
+    try:
+        res = testapp.get(url_for('oauth.create_access_token'),
+                          params={'grant_type': 'authorization_code',
+                                  'code': grant.code,
+                                  'redirect_uri': grant.redirect_uri},
+                          headers={'Authorization': str('Basic ' + auth_code)})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_client_statements)
+    assert len(client_statements) == 1
 
     token = Token.query.filter_by(user_id=grant.user_id, client_id=grant.client_id).first()
     assert res.json_body['scope'] == ' '.join(grant.scopes)
@@ -105,6 +123,58 @@ def test_get_access_token(grant, testapp):
     assert res.json_body['app_version'] == __version__
 
 
+def test_get_access_token_with_cached_grant(app, user, client, testapp):
+    """Grant codes kept in the cache can be redeemed exactly once."""
+    app.config['XL_AUTH_GRANT_STORE'] = 'cache'
+    grant = grant_store.set(client_id=client.client_id, code='cachedGrantCode',
+                            redirect_uri=client.default_redirect_uri, scopes=['read', 'write'],
+                            user_id=user.id)
+    assert [listed.id for listed in grant_store.get_all_by_user(user)] == [grant.id]
+    assert Grant.query.count() == 0
+
+    credentials = '%s:%s' % (client.client_id, client.client_secret)
+    auth_code = str(b64encode(credentials.encode()).decode())
+    params = {'grant_type': 'authorization_code', 'code': grant.code,
+              'redirect_uri': grant.redirect_uri}
+    headers = {'Authorization': str('Basic ' + auth_code)}
+    res = testapp.get(url_for('oauth.create_access_token'), params=params, headers=headers)
+
+    token = Token.query.filter_by(user_id=user.id, client_id=client.client_id).first()
+    assert res.json_body['access_token'] == token.access_token
+    assert grant_store.get_all() == []
+
+    res = testapp.get(url_for('oauth.create_access_token'), params=params, headers=headers,
+                      expect_errors=True)
+    assert res.status_code == 401
+    assert res.json_body['error'] == 'invalid_grant'
+
+
+def test_client_credentials_token_reuse(app, user, testapp):
+    """Live client_credentials tokens are handed out again, when enabled."""
+    client = ClientFactory(user=user)
+    client.save()
+    credentials = '%s:%s' % (client.client_id, client.client_secret)
+    headers = {'Authorization': str('Basic ' + b64encode(credentials.encode()).decode())}
+    params = {'grant_type': 'client_credentials', 'scope': 'read'}
+
+    def get_access_token():
+        res = testapp.post(url_for('oauth.create_access_token'), params=params, headers=headers)
+        return res.json_body
+
+    assert get_access_token()['access_token'] != get_access_token()['access_token']
+    assert Token.query.count() == 2
+
+    app.config['XL_AUTH_CLIENT_CREDENTIALS_TOKEN_REUSE_MIN_LIFETIME'] = 60
+    first, second = get_access_token(), get_access_token()
+    assert first['access_token'] == second['access_token']
+    assert 0 < second['expires_in'] <= first['expires_in']
+    assert Token.query.count() == 2
+
+    app.config['XL_AUTH_CLIENT_CREDENTIALS_TOKEN_REUSE_MIN_LIFETIME'] = 36000
+    assert get_access_token()['access_token'] != first['access_token']
+    assert Token.query.count() == 3
+
+
 def test_refresh_access_token(token, testapp):
     """Get new access token using 'refresh_token'."""
     token.expires_at = datetime.utcnow() - timedelta(seconds=1)
@@ -257,3 +327,234 @@ def test_superuser_can_revoke_access_token(superuser, token, testapp):
     assert res.status_code == 401
     assert res.json_body['app_version'] == __version__
     assert res.json_body['message'] == 'Bearer token not found.'
+
+
+def test_verify_is_served_from_cache(db, token, testapp):
+    """Repeated verify calls don't need the token row."""
+    access_token, email = token.access_token, token.user.email
+    res = testapp.get(url_for('oauth.verify'),
+                      headers={'Authorization': str('Bearer ' + access_token)})
+    assert res.status_code == 200
+
+    # Bypass ORM events, so the cache isn't told about it.
+    db.session.execute(Token.__table__.delete().where(Token.id == token.id))
+    db.session.commit()
+
+    cached_res = testapp.get(url_for('oauth.verify'),
+                             headers={'Authorization': str('Bearer ' + access_token)})
+    assert cached_res.status_code == 200
+    assert cached_res.json_body == res.json_body
+    assert cached_res.headers['X-Username'] == email
+
+
+def test_verify_is_a_single_statement(db, token, testapp):
+    """Verify reads token and user details in one go, however many permissions there are."""
+    for _ in range(5):
+        PermissionFactory(user=token.user).save()
+    access_token = token.access_token
+    testapp.get(url_for('oauth.verify'),  # Builds the authorization document.
+                headers={'Authorization': str('Bearer ' + access_token)})
+    verify_cache.clear()
+    db.session.remove()
+
+    statements = []
+
+    def count(*_):
+        statements.append(None)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        res = testapp.get(url_for('oauth.verify'),
+                          headers={'Authorization': str('Bearer ' + access_token)})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    assert res.status_code == 200
+    assert len(res.json_body['user']['permissions']) == 5
+    assert len(statements) == 1
+
+
+def test_verify_cache_is_invalidated_on_permission_change(token, testapp):
+    """New permissions show up in verify response right away."""
+    res = testapp.get(url_for('oauth.verify'),
+                      headers={'Authorization': str('Bearer ' + token.access_token)})
+    assert res.json_body['user']['permissions'] == []
+
+    permission = PermissionFactory(user=token.user, registrant=True)
+    permission.save()
+
+    res = testapp.get(url_for('oauth.verify'),
+                      headers={'Authorization': str('Bearer ' + token.access_token)})
+    assert len(res.json_body['user']['permissions']) == 1
+    assert res.json_body['user']['permissions'][0]['code'] == permission.collection.code
+
+
+def test_verify_cache_is_invalidated_on_collection_change(token, testapp):
+    """Deactivated collections drop out of verify response right away."""
+    permission = PermissionFactory(user=token.user, registrant=True)
+    permission.save()
+    res = testapp.get(url_for('oauth.verify'),
+                      headers={'Authorization': str('Bearer ' + token.access_token)})
+    assert len(res.json_body['user']['permissions']) == 1
+
+    permission.collection.is_active = False
+    permission.collection.save()
+
+    res = testapp.get(url_for('oauth.verify'),
+                      headers={'Authorization': str('Bearer ' + token.access_token)})
+    assert res.json_body['user']['permissions'] == []
+
+
+def test_verify_cache_never_outlives_token(token, testapp):
+    """Entries are bounded by token expiry."""
+    token.expires_at = datetime.utcnow() + timedelta(seconds=1)
+    token.save()
+    testapp.get(url_for('oauth.verify'),
+                headers={'Authorization': str('Bearer ' + token.access_token)})
+
+    assert verify_cache.get(token.access_token) is not None
+    sleep(1)
+    assert verify_cache.get(token.access_token) is None
+
+
+def test_verify_conditional_get(token, testapp):
+    """Unchanged verify responses are revalidated with 'If-None-Match'."""
+    token.expires_at = datetime.utcnow() + timedelta(seconds=10)
+    token.save()
+    headers = {'Authorization': str('Bearer ' + token.access_token)}
+    res = testapp.get(url_for('oauth.verify'), headers=headers)
+    etag = res.headers['ETag']
+    assert res.cache_control.private
+    assert 0 < res.cache_control.max_age <= 10
+
+    for cached in (True, False):
+        if not cached:
+            verify_cache.clear()
+        not_modified_res = testapp.get(url_for('oauth.verify'),
+                                       headers=dict(headers, **{'If-None-Match': etag}))
+        assert not_modified_res.status_code == 304
+        assert not_modified_res.body == b''
+        assert not_modified_res.headers['ETag'] == etag
+        assert not_modified_res.headers['X-Username'] == token.user.email
+
+    PermissionFactory(user=token.user).save()
+    modified_res = testapp.get(url_for('oauth.verify'),
+                               headers=dict(headers, **{'If-None-Match': etag}))
+    assert modified_res.status_code == 200
+    assert modified_res.headers['ETag'] != etag
+    assert len(modified_res.json_body['user']['permissions']) == 1
+
+
+def test_verify_batch(token, testapp):
+    """Verify several tokens in one request."""
+    permission = PermissionFactory(user=token.user, registrant=True)
+    permission.save()
+    expired_token = TokenFactory(expires_at=datetime.utcnow() - timedelta(seconds=1))
+    expired_token.save()
+
+    res = testapp.post_json(url_for('oauth.verify_batch'),
+                            {'access_tokens': [token.access_token, 'IncorrectOne',
+                                               expired_token.access_token]})
+    single_res = testapp.get(url_for('oauth.verify'),
+                             headers={'Authorization': str('Bearer ' + token.access_token)})
+
+    assert res.json_body['app_version'] == __version__
+    assert len(res.json_body['results']) == 3
+    assert res.json_body['results'][0] == {'expires_at': single_res.json_body['expires_at'],
+                                           'user': single_res.json_body['user']}
+    assert res.json_body['results'][0]['user']['permissions'][0]['code'] == \
+        permission.collection.code
+    assert res.json_body['results'][1] == {'message': 'Bearer token not found.'}
+    assert res.json_body['results'][2] == {'message': 'Bearer token is expired.'}
+
+
+# noinspection PyUnusedLocal
+def test_verify_batch_with_bad_request(db, testapp, app):
+    """Attempt batch verification without a list of tokens, or with too many."""
+    res = testapp.post_json(url_for('oauth.verify_batch'), {'access_tokens': 'abc'},
+                            expect_errors=True)
+    assert res.status_code == 400
+
+    res = testapp.post_json(url_for('oauth.verify_batch'),
+                            {'access_tokens': ['abc'] * (
+                                app.config['XL_AUTH_VERIFY_BATCH_MAX_TOKENS'] + 1)},
+                            expect_errors=True)
+    assert res.status_code == 400
+
+
+def test_signed_access_token(app, db, grant, testapp):
+    """Signed access tokens verify without their Token row, until revoked."""
+    app.config['XL_AUTH_SIGNED_ACCESS_TOKENS'] = True
+    app.config['XL_AUTH_VERIFY_CACHE_SIZE'] = 0
+    verify_cache.init_app(app)
+    PermissionFactory(user=grant.user, registrant=True).save()
+
+    credentials = '%s:%s' % (grant.client.client_id, grant.client.client_secret)
+    res = testapp.get(url_for('oauth.create_access_token'),
+                      params={'grant_type': 'authorization_code',
+                              'code': grant.code,
+                              'redirect_uri': grant.redirect_uri},
+                      headers={'Authorization': str('Basic ' + b64encode(
+                          credentials.encode()).decode())})
+    access_token = res.json_body['access_token']
+    assert '.' in access_token
+    claims = load_access_token(access_token, app.config['SECRET_KEY'], scopes=['read'])
+    assert claims['sub'] == grant.user_id
+    assert claims['prm'] == [[grant.user.permissions[0].collection.code, 1]]
+
+    res = testapp.get(url_for('oauth.verify'),
+                      headers={'Authorization': str('Bearer ' + access_token)})
+    assert res.json_body['user']['id'] == grant.user_id
+
+    # Revoked once the deletion is committed, not when it's flushed.
+    Token.query.filter_by(access_token=access_token).first().delete(commit=False)
+    db.session.flush()
+    db.session.rollback()
+    res = testapp.get(url_for('oauth.verify'),
+                      headers={'Authorization': str('Bearer ' + access_token)})
+    assert res.json_body['user']['id'] == grant.user_id
+
+    Token.query.filter_by(access_token=access_token).first().delete()
+    res = testapp.get(url_for('oauth.verify'), expect_errors=True,
+                      headers={'Authorization': str('Bearer ' + access_token)})
+    assert res.status_code == 401
+    assert res.json_body['message'] == 'Bearer token not found.'
+
+
+def test_verify_signed_access_token_of_deleted_user(app, db, client, testapp):
+    """A still validly signed token of a user deleted since is treated as unknown."""
+    access_token = dump_access_token({'jti': 'abc', 'sub': 1000, 'cid': client.client_id,
+                                      'scp': ['read'], 'exp': int(time()) + 60, 'prm': []},
+                                     app.config['SECRET_KEY'])
+    res = testapp.get(url_for('oauth.verify'), expect_errors=True,
+                      headers={'Authorization': str('Bearer ' + access_token)})
+    assert res.status_code == 401
+    assert res.json_body['message'] == 'Bearer token not found.'
+
+
+def test_verify_accepts_access_token_in_query_string(token, testapp):
+    """Besides the 'Authorization' header, tokens are taken from the query string."""
+    res = testapp.get(url_for('oauth.verify'), params={'access_token': token.access_token})
+    assert res.json_body['user']['id'] == token.user_id
+    res = testapp.get(url_for('oauth.verify'), params={'access_token': 'unknown'},
+                      expect_errors=True)
+    assert res.status_code == 401
+    assert res.json_body['message'] == 'Bearer token not found.'
+
+
+def test_replaced_client_secret_is_rejected_right_away(db, grant, testapp):
+    """Client authentication doesn't trust the client registry, which may be outdated."""
+    clients = Client.__table__
+    assert client_registry.get(grant.client_id).client_secret == grant.client.client_secret
+    credentials = '%s:%s' % (grant.client_id, grant.client.client_secret)
+    # Plain table statements, like writes from other processes, don't clear the registry.
+    db.session.execute(clients.update().where(clients.c.client_id == grant.client_id)
+                       .values(client_secret='replaced'))
+    db.session.commit()
+
+    res = testapp.get(url_for('oauth.create_access_token'), expect_errors=True,
+                      params={'grant_type': 'authorization_code', 'code': grant.code,
+                              'redirect_uri': grant.redirect_uri},
+                      headers={'Authorization': str('Basic ' + b64encode(
+                          credentials.encode()).decode())})
+    assert res.status_code == 401
+    assert res.json_body['error'] == 'invalid_client'
@@ -3,6 +3,10 @@
 
 from flask import url_for
 
+from xl_auth.oauth.grant.store import grant_store
+
+from ..factories import UserFactory
+
 
 def test_superuser_can_list_existing_grant(superuser, grant, testapp):
     """List existing grants."""
@@ -43,3 +47,28 @@ def test_user_cannot_list_existing_grant(user, testapp):
 
     # Try to go there directly
     testapp.get(url_for('oauth_grant.home'), status=403)
+
+
+def test_superuser_can_filter_cached_grants(app, superuser, client, testapp):
+    """List grants kept in the cache, filtered by client and user."""
+    app.config['XL_AUTH_GRANT_STORE'] = 'cache'
+    other_user = UserFactory(email='cached.grant@example.com')
+    other_user.save()
+    for i, user_id in enumerate((superuser.id, other_user.id)):
+        grant_store.set(client_id=client.client_id, code='listedCode{0}'.format(i),
+                        redirect_uri=client.default_redirect_uri, scopes=['read'],
+                        user_id=user_id)
+    # Logs in.
+    res = testapp.get('/')
+    form = res.forms['loginForm']
+    form['username'] = superuser.email
+    form['password'] = 'myPrecious'
+    form.submit().follow()
+
+    res = testapp.get(url_for('oauth_grant.home', client=client.client_id))
+    assert len(res.lxml.xpath('//tbody/tr')) == 2
+    res = testapp.get(url_for('oauth_grant.home', user='Cached.'))
+    assert [email.strip() for email in res.lxml.xpath('//tbody/tr/td[2]/text()')] == \
+        [other_user.email]
+    res = testapp.get(url_for('oauth_grant.home', status='expired'))
+    assert res.lxml.xpath('//tbody/tr') == []
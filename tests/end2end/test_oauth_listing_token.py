@@ -1,7 +1,16 @@
 """Test listing tokens."""
 
 
+from datetime import datetime, timedelta
+
 from flask import url_for
+from flask_babel import gettext as _
+from sqlalchemy import event
+
+from xl_auth.oauth.listing import paginate_listing
+from xl_auth.oauth.token.models import Token
+
+from ..factories import ClientFactory, TokenFactory, UserFactory
 
 
 def test_superuser_can_list_existing_token(superuser, token, testapp):
@@ -43,3 +52,52 @@ def test_user_cannot_list_existing_token(user, testapp):
 
     # Try to go there directly
     testapp.get(url_for('oauth_token.home'), status=403)
+
+
+def test_superuser_can_filter_and_page_through_tokens(superuser, testapp, db):
+    """List tokens a page at a time, filtered by client, user and status."""
+    client, other_client = ClientFactory(), ClientFactory()
+    expired = datetime.utcnow() - timedelta(hours=1)
+    for i in range(3):
+        TokenFactory(client=client, user=UserFactory(email='listed{0}@example.com'.format(i)))
+    TokenFactory(client=client, user=UserFactory(email='listed.expired@example.com'),
+                 expires_at=expired)
+    TokenFactory(client=other_client, user=UserFactory(email='unlisted@example.com'))
+    db.session.commit()
+    # Logs in.
+    res = testapp.get('/')
+    form = res.forms['loginForm']
+    form['username'] = superuser.email
+    form['password'] = 'myPrecious'
+    form.submit().follow()
+
+    def listed_emails(res):
+        return [email.strip() for email in res.lxml.xpath('//tbody/tr/td[2]/text()')]
+
+    res = testapp.get(url_for('oauth_token.home', client=client.client_id, per_page=2))
+    assert listed_emails(res) == ['listed.expired@example.com', 'listed2@example.com']
+    assert _('All') + ' (4)' in res
+    res = res.click(href='page=2', index=0)
+    assert listed_emails(res) == ['listed1@example.com', 'listed0@example.com']
+
+    res = testapp.get(url_for('oauth_token.home', client=client.client_id, status='expired'))
+    assert listed_emails(res) == ['listed.expired@example.com']
+    res = testapp.get(url_for('oauth_token.home', user='Listed1@', status='active'))
+    assert listed_emails(res) == ['listed1@example.com']
+
+
+def test_token_listing_does_not_load_permissions(app, token, db):
+    """Listed tokens' users are loaded alongside, but without their permissions."""
+    statements = []
+
+    def record(_, __, statement, *___):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        with app.test_request_context():
+            pagination = paginate_listing(Token, '', '', '', 1, 10)
+            assert [listed.user.email for listed in pagination.items] == [token.user.email]
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert not [statement for statement in statements if 'permissions' in statement]
@@ -0,0 +1,65 @@
+"""Test listing and exporting permissions."""
+
+
+import csv
+from io import StringIO
+
+from flask import url_for
+
+from ..factories import CollectionFactory, PermissionFactory, UserFactory
+
+
+def _login(testapp, user):
+    """Log in as 'user'."""
+    res = testapp.get('/')
+    form = res.forms['loginForm']
+    form['username'] = user.email
+    form['password'] = 'myPrecious'
+    return form.submit().follow()
+
+
+def _listed_permissions(res):
+    """Return (email, code) pairs listed on permissions' overview page."""
+    return [(email.strip(), code.strip()) for email, code in zip(
+        res.lxml.xpath('//tbody/tr/td[1]/a/text()'), res.lxml.xpath('//tbody/tr/td[2]/a/text()'))]
+
+
+def test_permission_listing_uses_keyset_pagination(superuser, testapp, db):
+    """List permissions a page at a time, by user email and collection code."""
+    collection = CollectionFactory(code='KEYSET', category='library')
+    for email in ('b@keyset.com', 'a@keyset.com', 'c@keyset.com'):
+        PermissionFactory(user=UserFactory(email=email), collection=collection)
+    PermissionFactory(user=UserFactory(email='d@keyset.com'), cataloger=True,
+                      collection=CollectionFactory(code='OTHER', category='bibliography'))
+    db.session.commit()
+    _login(testapp, superuser)
+
+    res = testapp.get(url_for('permission.home', collection='KEYSET', per_page=2))
+    assert _listed_permissions(res) == [('a@keyset.com', 'KEYSET'), ('b@keyset.com', 'KEYSET')]
+    res = res.click(href='after_email=b%40keyset.com')
+    assert _listed_permissions(res) == [('c@keyset.com', 'KEYSET')]
+    assert res.lxml.xpath("//li[@class='next']") == []
+
+    res = testapp.get(url_for('permission.home', category='bibliography'))
+    assert _listed_permissions(res) == [('d@keyset.com', 'OTHER')]
+    res = testapp.get(url_for('permission.home', role='cataloger'))
+    assert ('d@keyset.com', 'OTHER') in _listed_permissions(res)
+    assert ('a@keyset.com', 'KEYSET') not in _listed_permissions(res)
+
+
+def test_superuser_can_export_permissions(superuser, permission, testapp, db):
+    """Export permissions as CSV, with the overview's filters."""
+    _login(testapp, superuser)
+    res = testapp.get(url_for('permission.export', collection=permission.collection.code))
+    assert res.content_type == 'text/csv'
+    rows = list(csv.DictReader(StringIO(res.text)))
+    assert len(rows) == 1
+    assert rows[0]['email'] == permission.user.email
+    assert rows[0]['collection'] == permission.collection.code
+    assert rows[0]['cataloger'] == str(permission.cataloger)
+
+
+def test_user_cannot_export_permissions(user, testapp):
+    """Refuse CSV export to non-admins."""
+    _login(testapp, user)
+    testapp.get(url_for('permission.export'), status=403)
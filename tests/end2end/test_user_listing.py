@@ -0,0 +1,93 @@
+"""Test listing users."""
+
+
+from flask import before_render_template, url_for
+
+from xl_auth.utils import stream_template
+
+from ..factories import PermissionFactory, UserFactory
+
+
+def _login(testapp, user):
+    """Log in as 'user'."""
+    res = testapp.get('/')
+    form = res.forms['loginForm']
+    form['username'] = user.email
+    form['password'] = 'myPrecious'
+    return form.submit().follow()
+
+
+def _listed_emails(res):
+    """Return emails listed on users' overview page."""
+    return [email.strip() for email in res.lxml.xpath('//tbody/tr/td[1]/a/text()')]
+
+
+def test_user_listing_is_paginated_and_sorted(superuser, testapp, db):
+    """List users a page at a time, in requested order."""
+    for i in range(5):
+        UserFactory(email='paged{0}@example.com'.format(i))
+    db.session.commit()
+    _login(testapp, superuser)
+
+    res = testapp.get(url_for('user.home', email='paged', per_page=2))
+    assert _listed_emails(res) == ['paged0@example.com', 'paged1@example.com']
+    res = res.click(href='page=3')
+    assert _listed_emails(res) == ['paged4@example.com']
+
+    res = testapp.get(url_for('user.home', email='paged', sort='-email', per_page=2))
+    assert _listed_emails(res) == ['paged4@example.com', 'paged3@example.com']
+
+
+def test_user_listing_filters(superuser, permission, testapp, db):
+    """Filter users by status, admin flag and email prefix; count their permissions."""
+    active = UserFactory(email='filtered.active@example.com')
+    UserFactory(email='filtered.inactive@example.com', is_active=False)
+    UserFactory(email='filtered.deleted@example.com', is_active=False, is_deleted=True)
+    UserFactory(email='filtered.admin@example.com', is_admin=True)
+    PermissionFactory(user=active)
+    PermissionFactory(user=active)
+    db.session.commit()
+    _login(testapp, superuser)
+
+    res = testapp.get(url_for('user.home', email='Filtered.'))
+    assert sorted(_listed_emails(res)) == ['filtered.active@example.com',
+                                           'filtered.admin@example.com',
+                                           'filtered.inactive@example.com']
+    assert res.lxml.xpath("//tbody/tr[td/a[contains(., 'filtered.active')]]/td[3]/text()") == ['2']
+
+    res = testapp.get(url_for('user.home', email='filtered.', status='inactive'))
+    assert _listed_emails(res) == ['filtered.inactive@example.com']
+    res = testapp.get(url_for('user.home', email='filtered.', status='deleted'))
+    assert _listed_emails(res) == ['filtered.deleted@example.com']
+    res = testapp.get(url_for('user.home', email='filtered.', admin='1'))
+    assert _listed_emails(res) == ['filtered.admin@example.com']
+    # Wildcards in the prefix are taken literally.
+    res = testapp.get(url_for('user.home', email='filtered%'))
+    assert _listed_emails(res) == []
+
+
+def test_user_listing_is_streamed_and_shows_flashed_messages_once(superuser, testapp, app):
+    """Stream the overview, consuming flashed messages before the session is saved."""
+    _login(testapp, superuser)
+    with app.test_request_context():
+        response = stream_template('pagination.html')
+        assert response.is_streamed
+        response.close()
+    # Registers a user, and is sent (back) to the streamed overview with a message.
+    res = testapp.get(url_for('user.register', next=url_for('user.home')))
+    form = res.forms['registerUserForm']
+    form['username'] = 'streamed@example.com'
+    form['full_name'] = 'Streamed'
+    form['send_password_reset_email'].checked = False
+    res = form.submit()
+    assert res.location.endswith(url_for('user.home'))
+    res = res.follow()
+    alerts = res.lxml.xpath("//div[contains(@class, 'alert')]")
+    assert 'streamed@example.com' in alerts[0].text_content()
+    # The message is gone on the next visit, i.e. it was taken out of the saved session.
+    rendered = []
+    with before_render_template.connected_to(lambda _, template, **__: rendered.append(
+            template.name), app):
+        res = testapp.get(url_for('user.home'))
+    assert res.lxml.xpath("//div[contains(@class, 'alert')]") == []
+    assert rendered == ['users/home.html']
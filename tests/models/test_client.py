@@ -6,6 +6,7 @@ from datetime import datetime
 import pytest
 
 from xl_auth.oauth.client.models import Client
+from xl_auth.oauth.client.registry import ClientRecord, client_registry
 from xl_auth.user.models import User
 
 from ..factories import ClientFactory, SuperUserFactory
@@ -118,3 +119,49 @@ def test_repr():
     """Check repr output."""
     client = ClientFactory(name='OAuth2 Client')
     assert repr(client) == '<Client({!r})>'.format('OAuth2 Client')
+
+
+def test_client_registry(superuser, client):
+    """Registry serves read-only records and reloads after clients are written."""
+    record = client_registry.get(client.client_id)
+    assert isinstance(record, ClientRecord)
+    assert record.redirect_uris == tuple(client.redirect_uris)
+    assert record.default_redirect_uri == client.default_redirect_uri
+    assert record.validate_redirect_uri(client.default_redirect_uri)
+    assert not record.validate_redirect_uri('https://evil.example.com')
+    assert record.validate_scopes(['read'])
+    assert not record.validate_scopes(['read', 'admin'])
+    with pytest.raises(AttributeError):
+        record.name = 'other'
+    assert client_registry.get('unknown') is None
+
+    client.update_as(superuser, commit=True, default_scopes='read')
+    assert not client_registry.get(client.client_id).validate_scopes(['write'])
+
+    new_client = ClientFactory()
+    new_client.save()
+    assert client_registry.get(new_client.client_id).name == new_client.name
+
+    client_id = client.client_id
+    client.delete()
+    assert client_registry.get(client_id) is None
+
+
+def test_client_registry_load(db, client):
+    """Loading skips cached records, e.g. still carrying a secret replaced by another process."""
+    clients = Client.__table__
+    client_id, client_secret = client.client_id, client.client_secret
+    assert client_registry.get(client_id).client_secret == client_secret
+
+    # Plain table statements, like writes from other processes, don't clear the registry.
+    db.session.execute(clients.update().where(clients.c.client_id == client_id)
+                       .values(client_secret='replaced'))
+    db.session.commit()
+    assert client_registry.get(client_id).client_secret == client_secret
+    assert client_registry.load(client_id).client_secret == 'replaced'
+    assert client_registry.get(client_id).client_secret == 'replaced'
+
+    db.session.execute(clients.delete().where(clients.c.client_id == client_id))
+    db.session.commit()
+    assert client_registry.load(client_id) is None
+    assert client_registry.get(client_id) is None
@@ -78,6 +78,17 @@ def test_get_by_email_and_code():
     assert PasswordReset.get_by_email_and_code(password_reset.user.email, '89ab' * 8) is None
 
 
+def test_count_active_and_recent_by_user(user):
+    """Count only active resets created in the last couple of hours."""
+    assert PasswordReset.count_active_and_recent_by_user(user) == 0
+    PasswordReset(user).save()
+    PasswordReset(user, is_active=False).save()
+    PasswordReset(user, created_at=dt.datetime.utcnow() - dt.timedelta(hours=3)).save()
+    PasswordReset(UserFactory()).save()
+    assert PasswordReset.count_active_and_recent_by_user(user) == 1
+    assert len(user.get_active_and_recent_password_resets()) == 1
+
+
 @pytest.mark.usefixtures('db')
 def test_repr():
     """Check repr output."""
@@ -8,7 +8,7 @@ import pytest
 from sqlalchemy.exc import IntegrityError
 
 from xl_auth.collection.models import Collection
-from xl_auth.permission.models import Permission
+from xl_auth.permission.models import AuthorizationDocument, Permission
 from xl_auth.user.models import User
 
 from ..factories import PermissionFactory, SuperUserFactory
@@ -110,3 +110,67 @@ def test_unique_constraint(user, collection):
     # noinspection PyUnusedLocal
     with pytest.raises(IntegrityError) as e_info:  # noqa
         duplicate_permission.save()
+
+
+def test_authorization_document_follows_permission_writes(superuser, user, collection):
+    """Authorization document is rebuilt when permissions are added, changed or removed."""
+    assert AuthorizationDocument.get_by_user_id(user.id).document == {
+        'full_name': user.full_name, 'email': user.email, 'id': user.id, 'permissions': []}
+
+    permission = Permission(user=user, collection=collection, registrant=True)
+    permission.save_as(superuser)
+    assert AuthorizationDocument.get_by_user_id(user.id).document['permissions'] == [{
+        'code': collection.code,
+        'friendly_name': collection.friendly_name,
+        'cataloger': False,
+        'registrant': True,
+        'global_registrant': False
+    }]
+
+    permission.update_as(superuser, cataloger=True)
+    assert AuthorizationDocument.get_by_user_id(user.id).document['permissions'][0]['cataloger']
+
+    permission.delete()
+    assert AuthorizationDocument.get_by_user_id(user.id).document['permissions'] == []
+
+
+def test_authorization_document_follows_collection_and_user_writes(superuser, user, collection):
+    """Authorization document is rebuilt when the user or one of its collections changes."""
+    Permission(user=user, collection=collection, registrant=True).save_as(superuser)
+
+    collection.update_as(superuser, friendly_name='Renamed')
+    assert AuthorizationDocument.get_by_user_id(user.id).document['permissions'][0][
+        'friendly_name'] == 'Renamed'
+
+    collection.update_as(superuser, is_active=False)
+    assert AuthorizationDocument.get_by_user_id(user.id).document['permissions'] == []
+
+    user.update_as(superuser, full_name='Someone Else')
+    assert AuthorizationDocument.get_by_user_id(user.id).document['full_name'] == 'Someone Else'
+
+
+def test_get_authorization_document_never_writes(db, user):
+    """Missing documents are built on the fly, but only stored by writes to their inputs."""
+    AuthorizationDocument.query.filter_by(user_id=user.id).delete()
+    db.session.commit()
+
+    authorization_document = AuthorizationDocument.get_by_user_id(user.id)
+    assert authorization_document.document['email'] == user.email
+    assert authorization_document not in db.session
+    assert not db.session.new
+    assert AuthorizationDocument.query.get(user.id) is None
+    assert AuthorizationDocument.get_by_user_id(user.id + 1000) is None
+
+
+def test_refresh_authorization_documents_in_place(db, user):
+    """Refreshing updates existing rows instead of deleting and inserting them again."""
+    AuthorizationDocument.query.filter_by(user_id=user.id).delete()
+    AuthorizationDocument.refresh(db.session.connection(), {user.id})
+    AuthorizationDocument.refresh(db.session.connection(), {user.id})
+    db.session.commit()
+    assert AuthorizationDocument.query.filter_by(user_id=user.id).count() == 1
+
+    User.query.filter_by(id=user.id).update({'full_name': 'Someone Else'})
+    AuthorizationDocument.refresh(db.session.connection(), {user.id, user.id + 1000})
+    db.session.commit()
+    assert AuthorizationDocument.query.get(user.id).document['full_name'] == 'Someone Else'
@@ -1,13 +1,16 @@
 """Unit tests for User model."""
 
 
-from datetime import datetime, timedelta
+from datetime import datetime
 
 import pytest
 from flask_babel import gettext as _
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 
 from xl_auth.permission.models import Permission
 from xl_auth.user.models import FailedLoginAttempt, PasswordReset, Role, User
+from xl_auth.user.snapshot import get_user_snapshot
 
 from ..factories import CollectionFactory, PermissionFactory, UserFactory
 
@@ -21,6 +24,21 @@ def test_get_by_id(superuser):
     assert retrieved == user
 
 
+def test_get_by_email_ignores_case(superuser):
+    """Get user by email, whatever the case, also after changing it."""
+    user = User('Foo@Bar.com', 'Foo Bar')
+    user.save_as(superuser)
+    assert user.normalized_email == 'foo@bar.com'
+    assert User.get_by_email('FOO@bar.COM') == user
+    assert User.get_by_email('foo_bar.com') is None
+    assert User.get_by_email(None) is None
+
+    user.set_email('Bar@Foo.com')
+    user.save_as(superuser)
+    assert User.get_by_email('bar@foo.com') == user
+    assert User.get_by_email('foo@bar.com') is None
+
+
 def test_created_by_and_modified_by_is_updated(superuser):
     """Test created/modified by."""
     user = User(email='foo@bar.com', full_name='Foo Bar')
@@ -72,6 +90,28 @@ def test_update_last_login_does_not_update_modified_at(superuser):
     assert first_modified_at == user.modified_at
 
 
+def test_preserve_modified_commits_once(db, superuser):
+    """Saving with 'preserve_modified' takes a single commit, also for expired instances."""
+    user = User('foo@kb.se', 'Hello World')
+    user.save_as(superuser)
+    first_modified_at = user.modified_at
+    db.session.expire(user)
+    commits = []
+
+    def count(_):
+        commits.append(None)
+
+    event.listen(Session, 'after_commit', count)
+    try:
+        user.set_tos_approved()
+    finally:
+        event.remove(Session, 'after_commit', count)
+
+    assert len(commits) == 1
+    assert user.tos_approved_at is not None
+    assert user.modified_at == first_modified_at
+
+
 def test_tos_approved_at_defaults_to_null(superuser):
     """Test Terms of Service datetime field is not populated automatically."""
     user = User(email='foo@bar.com', full_name='Foo Bar')
@@ -86,6 +126,20 @@ def test_password_defaults_to_a_random_one(superuser):
     assert user.password is not None
 
 
+def test_password_defaults_to_an_unusable_one(superuser):
+    """Users without a password can't log in, until one is set."""
+    user = User(email='foo@bar.com', full_name='Foo Bar')
+    user.save_as(superuser)
+    assert user.has_usable_password is False
+    assert user.check_password('') is False
+    assert user.check_password(user.password.decode('utf-8')) is False
+
+    user.set_password('myPrecious')
+    user.save_as(superuser)
+    assert user.has_usable_password is True
+    assert user.check_password('myPrecious') is True
+
+
 def test_password_can_contain_utf8_chars(superuser):
     """Test that passwords can contain utf-8 characters."""
     password = '▨☺♪∈∀∃' * 40  # test a really long password, just to make sure.
@@ -196,6 +250,25 @@ def test_is_cataloging_admin_for(user, collection, superuser):
                                         now_also_admin_permission.collection) is True
 
 
+def test_authorization_index(user, collection, superuser):
+    """Roles are indexed once, until permissions change."""
+    permission = Permission(user=user, collection=collection,
+                            cataloging_admin=False).save_as(superuser)
+    index = user.authorization_index
+    assert user.authorization_index is index
+    assert index.roles[collection.id].cataloging_admin is False
+    assert user.is_cataloging_admin is False
+
+    permission.update(cataloging_admin=True)
+    assert user.authorization_index is not index
+    assert user.is_cataloging_admin_for(collection) is True
+
+    other_collection = CollectionFactory()
+    Permission(user=user, collection=other_collection, global_registrant=True)
+    assert user.has_any_permission_for(other_collection) is True
+    assert user.is_global_registrant is True
+
+
 def test_has_any_permission_for(user, collection, superuser):
     """Test has_any_permission_for return value."""
     other_collection = CollectionFactory()
@@ -207,6 +280,47 @@ def test_has_any_permission_for(user, collection, superuser):
     assert user.has_any_permission_for(collection) is True
 
 
+def test_user_snapshot(db, superuser, user, collection):
+    """Snapshots are served from the cache until the user or their permissions change."""
+    statements = []
+
+    def count(*_):
+        statements.append(None)
+
+    snapshot = get_user_snapshot(user.id)
+    assert snapshot == user and snapshot.email == user.email
+    assert snapshot.is_cataloging_admin is False
+    assert collection.id  # Loaded now, rather than while counting.
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        snapshot = get_user_snapshot(user.id)
+        assert snapshot.is_cataloging_admin_for(collection) is False
+        assert snapshot.has_any_permission_for(collection) is False
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    assert statements == []
+
+    Permission(user=user, collection=collection, cataloging_admin=True).save_as(superuser)
+    snapshot = get_user_snapshot(user.id)
+    assert snapshot.is_cataloging_admin_for(collection) is True
+    assert snapshot.has_any_permission_for(collection) is True
+
+    # A few other things come from the ORM, and changes go there too.
+    assert [permission.collection for permission in snapshot.permissions] == [collection]
+    with pytest.raises(AttributeError):
+        snapshot.full_name = 'Changed'
+    with pytest.raises(AttributeError):
+        snapshot._sa_instance_state
+    collection.update_as(snapshot, friendly_name='Changed by snapshot')
+    assert collection.modified_by is user
+    collection.update(is_active=False)
+    assert get_user_snapshot(user.id).permissions[0].collection.is_active is False
+
+    user.update(is_active=False)
+    assert get_user_snapshot(user.id) is None
+
+
 def test_get_permissions_as_seen_by_self(user):
     """Test getting permissions for self."""
     non_admin_permission = PermissionFactory(user=user, cataloging_admin=False).save_as(user)
@@ -344,27 +458,6 @@ def test_delete_all_password_resets_by_user(db, user):
     assert [other_password_reset] == password_resets
 
 
-@pytest.mark.usefixtures('db')
-def test_login_attempt_too_many_recent_failures(app):
-    """Ensure login attempt is not allowed after too many failed attempts."""
-    username = 'foo'
-    remote_addr = '127.0.0.1'
-    app.config['XL_AUTH_FAILED_LOGIN_MAX_ATTEMPTS'] = 1
-    app.config['XL_AUTH_FAILED_LOGIN_TIMEFRAME'] = 5 * 60
-
-    assert FailedLoginAttempt.too_many_recent_failures_for(username) is False
-
-    login_attempt = FailedLoginAttempt(username, remote_addr)
-    login_attempt.save()
-
-    assert FailedLoginAttempt.too_many_recent_failures_for(username) is True
-
-    login_attempt.created_at = datetime.utcnow() - timedelta(seconds=10 * 60)
-    login_attempt.save()
-
-    assert FailedLoginAttempt.too_many_recent_failures_for(username) is False
-
-
 @pytest.mark.usefixtures('db')
 def test_login_attempt_purge(superuser):
     """Test purging login attempts for username/IP combo."""
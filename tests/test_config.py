@@ -1,8 +1,10 @@
 """Test configs."""
 
 
+import pytest
+
 from xl_auth.app import create_app
-from xl_auth.settings import DevConfig, ProdConfig
+from xl_auth.settings import DevConfig, ProdConfig, TestConfig
 
 
 def test_production_config():
@@ -18,3 +20,44 @@ def test_dev_config():
     app = create_app(DevConfig)
     assert app.config['ENV'] == 'dev'
     assert app.config['DEBUG'] is True
+
+
+def test_signed_access_tokens_require_shared_cache(tmpdir):
+    """Revoked signed tokens must be seen by every worker, not just the one revoking them."""
+    class SignedTokensConfig(TestConfig):
+        XL_AUTH_SIGNED_ACCESS_TOKENS = True
+
+    with pytest.raises(RuntimeError, match='requires a shared CACHE_TYPE'):
+        create_app(SignedTokensConfig)
+
+    SignedTokensConfig.CACHE_TYPE = 'FileSystemCache'
+    SignedTokensConfig.CACHE_DIR = str(tmpdir)
+    assert create_app(SignedTokensConfig).config['XL_AUTH_SIGNED_ACCESS_TOKENS'] is True
+
+
+def test_user_cache_requires_shared_cache(tmpdir):
+    """Cached users must be evicted in every worker, not just the one changing them."""
+    assert TestConfig.XL_AUTH_USER_CACHE_TTL == 0
+
+    class UserCacheConfig(TestConfig):
+        XL_AUTH_USER_CACHE_TTL = 60
+
+    with pytest.raises(RuntimeError, match='requires a shared CACHE_TYPE'):
+        create_app(UserCacheConfig)
+
+    UserCacheConfig.CACHE_TYPE = 'FileSystemCache'
+    UserCacheConfig.CACHE_DIR = str(tmpdir)
+    assert create_app(UserCacheConfig).config['XL_AUTH_USER_CACHE_TTL'] == 60
+
+
+def test_cached_grants_require_shared_cache(tmpdir):
+    """Codes must be redeemable at any worker, not just the one issuing them."""
+    class GrantStoreConfig(TestConfig):
+        XL_AUTH_GRANT_STORE = 'cache'
+
+    with pytest.raises(RuntimeError, match='requires a shared CACHE_TYPE'):
+        create_app(GrantStoreConfig)
+
+    GrantStoreConfig.CACHE_TYPE = 'FileSystemCache'
+    GrantStoreConfig.CACHE_DIR = str(tmpdir)
+    assert create_app(GrantStoreConfig).config['XL_AUTH_GRANT_STORE'] == 'cache'
@@ -0,0 +1,101 @@
+"""Test pooled bcrypt hashing."""
+
+
+from flask import url_for
+
+from xl_auth.commands import bcrypt_benchmark
+from xl_auth.extensions import bcrypt
+from xl_auth.hashing import calibrate, get_log_rounds
+
+
+def test_pooled_hashing(app):
+    """Hashes made in worker processes check out, and are accounted for."""
+    app.config['XL_AUTH_BCRYPT_POOL_SIZE'] = 1
+    bcrypt.init_app(app)
+    try:
+        hashes = bcrypt.get_stats()['hashes']
+        pw_hash = bcrypt.generate_password_hash('secret')
+        assert bcrypt.check_password_hash(pw_hash, 'secret')
+        assert not bcrypt.check_password_hash(pw_hash, 'wrong')
+
+        stats = bcrypt.get_stats()
+        assert stats['hashes'] == hashes + 3
+        assert stats['queue_depth'] == 0
+        assert stats['pool_size'] == 1
+        assert stats['hash_seconds_max'] > 0
+    finally:
+        app.config['XL_AUTH_BCRYPT_POOL_SIZE'] = 0
+        bcrypt.init_app(app)
+
+
+def test_login_is_turned_away_when_queue_is_full(app, user, testapp):
+    """Logins get a 429 instead of waiting for a free bcrypt worker."""
+    res = testapp.get('/')
+    form = res.forms['loginForm']
+    form['username'] = user.email
+    form['password'] = 'myPrecious'
+
+    bcrypt.queue_limit = 0
+    try:
+        res = form.submit(expect_errors=True)
+    finally:
+        bcrypt.queue_limit = app.config['XL_AUTH_BCRYPT_QUEUE_LIMIT']
+    assert res.status_code == 429
+    assert res.headers['Retry-After'] == '1'
+    assert bcrypt.get_stats()['rejected'] >= 1
+
+
+def test_bcrypt_status_is_for_admins_only(app, user, superuser, testapp):
+    """Pool statistics need an admin login."""
+    testapp.get(url_for('public.bcrypt_status'), status=302)
+
+    for visitor, status in ((user, 403), (superuser, 200)):
+        res = testapp.get('/')
+        form = res.forms['loginForm']
+        form['username'] = visitor.email
+        form['password'] = 'myPrecious'
+        form.submit()
+        res = testapp.get(url_for('public.bcrypt_status'), status=status)
+        testapp.get(url_for('public.logout'))
+    assert res.json_body['queue_limit'] == app.config['XL_AUTH_BCRYPT_QUEUE_LIMIT']
+
+
+def test_password_is_rehashed_on_login(app, user):
+    """Hashes made with a lower cost factor are upgraded once the password checks out."""
+    user.password = bcrypt.generate_password_hash('myPrecious', 4)
+    user.save()
+    bcrypt._log_rounds = 5
+    try:
+        assert not user.check_password('wrong')
+        assert get_log_rounds(user.password) == 4
+        assert user.check_password('myPrecious')
+        assert get_log_rounds(user.password) == 5
+        assert user.check_password('myPrecious')
+    finally:
+        bcrypt._log_rounds = app.config['BCRYPT_LOG_ROUNDS']
+
+
+def test_stronger_password_hash_is_kept(app, user):
+    """Hashes made with a higher cost factor are never downgraded."""
+    user.password = bcrypt.generate_password_hash('myPrecious', 5)
+    user.save()
+
+    assert user.check_password('myPrecious')
+    assert get_log_rounds(user.password) == 5
+
+
+def test_calibrate():
+    """Calibration never goes below the minimum, and picks higher costs for bigger budgets."""
+    assert calibrate(0, 4) == 4
+    assert calibrate(50, 4) > 4
+
+
+def test_bcrypt_benchmark_command(app):
+    """Prints timings per cost factor."""
+    result = app.test_cli_runner().invoke(bcrypt_benchmark,
+                                          ['--min-cost', '4', '--max-cost', '5', '-t', '1'])
+    assert result.exit_code == 0
+    assert 'cost  4:' in result.output
+    assert 'cost  5:' in result.output
+    assert 'Current cost factor: 4' in result.output
+    assert 'Calibrated cost factor for 1 ms: ' in result.output
@@ -0,0 +1,44 @@
+"""Test reporting writes to caches and derived data."""
+
+
+from xl_auth.extensions import cache, db
+from xl_auth.permission.models import AuthorizationDocument, Permission
+from xl_auth.user.snapshot import VERSION_KEY_PREFIX, get_user_snapshot
+
+from .factories import PermissionFactory
+
+
+def test_query_level_update_is_scoped_to_rows_hit(superuser):
+    """Only users owning the updated rows get rebuilt documents and new snapshot stamps."""
+    permission, other_permission = PermissionFactory(), PermissionFactory()
+    db.session.commit()
+    for user_id in (permission.user_id, other_permission.user_id):
+        get_user_snapshot(user_id)
+    stamps = cache.get_many(*(VERSION_KEY_PREFIX + str(user_id)
+                              for user_id in (permission.user_id, other_permission.user_id)))
+    other_document = AuthorizationDocument.get_by_user_id(other_permission.user_id).document
+
+    Permission.query.filter_by(id=permission.id).update({'cataloger': True})
+    db.session.commit()
+
+    assert AuthorizationDocument.get_by_user_id(
+        permission.user_id).document['permissions'][0]['cataloger'] is True
+    assert AuthorizationDocument.get_by_user_id(other_permission.user_id).document == \
+        other_document
+    new_stamps = cache.get_many(*(VERSION_KEY_PREFIX + str(user_id)
+                                  for user_id in (permission.user_id, other_permission.user_id)))
+    assert new_stamps[0] != stamps[0]
+    assert new_stamps[1] == stamps[1]
+
+
+def test_rolled_back_writes_are_not_reported(user):
+    """Commit subscribers only hear about committed transactions."""
+    get_user_snapshot(user.id)
+    stamp = cache.get(VERSION_KEY_PREFIX + str(user.id))
+
+    user.full_name = 'Rolled Back'
+    db.session.flush()
+    db.session.rollback()
+    db.session.commit()
+
+    assert cache.get(VERSION_KEY_PREFIX + str(user.id)) == stamp
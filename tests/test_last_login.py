@@ -0,0 +1,31 @@
+"""Test write-behind 'last_login_at' updates."""
+
+
+from datetime import datetime
+
+from xl_auth.extensions import db
+from xl_auth.last_login import last_login_buffer
+from xl_auth.user.models import FailedLoginAttempt, User
+
+
+def test_last_login_is_written_behind(app, user):
+    """Logins are buffered until flushed, and then written without touching 'modified_at'."""
+    app.config['XL_AUTH_LAST_LOGIN_FLUSH_INTERVAL'] = 3600
+    modified_at = user.modified_at
+    FailedLoginAttempt(user.email.upper(), '127.0.0.1').save()
+    FailedLoginAttempt(user.email, '10.0.0.1').save()
+
+    user.update_last_login_internal(remote_address='127.0.0.1')
+    assert user.last_login_at is not None
+    assert not db.session.is_modified(user)
+    db.session.expire_all()
+    assert User.get_by_id(user.id).last_login_at is None
+    assert FailedLoginAttempt.query.count() == 2
+
+    assert last_login_buffer.flush() == 1
+    db.session.expire_all()
+    user = User.get_by_id(user.id)
+    assert isinstance(user.last_login_at, datetime)
+    assert user.modified_at == modified_at
+    assert [attempt.remote_addr for attempt in FailedLoginAttempt.query.all()] == ['10.0.0.1']
+    assert last_login_buffer.flush() == 0
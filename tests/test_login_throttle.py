@@ -0,0 +1,80 @@
+"""Test failed login throttling."""
+
+
+from time import time
+
+import cachelib.simple
+import pytest
+
+from xl_auth.extensions import cache
+from xl_auth.login_throttle import login_throttle
+from xl_auth.user.models import FailedLoginAttempt
+
+
+@pytest.mark.usefixtures('db')
+def test_too_many_recent_failures(app):
+    """Logins are throttled after too many failures, until they slide out of the window."""
+    app.config['XL_AUTH_FAILED_LOGIN_MAX_ATTEMPTS'] = 2
+    app.config['XL_AUTH_FAILED_LOGIN_TIMEFRAME'] = 5 * 60
+    now = 1000 * 5 * 60  # Start of a window.
+
+    assert login_throttle.is_throttled('foo', '127.0.0.1', now) is False
+    login_throttle.record_failure('foo', '127.0.0.1', now)
+    assert login_throttle.is_throttled('foo', '127.0.0.1', now) is False
+    login_throttle.record_failure('Foo ', '127.0.0.1', now + 60)
+    assert login_throttle.is_throttled('FOO', '10.0.0.1', now + 60) is True
+    assert login_throttle.is_throttled('bar', '127.0.0.1', now + 60) is False
+
+    # Halfway into the next window, half of the previous one still counts.
+    assert login_throttle.is_throttled('foo', '127.0.0.1', now + 5 * 60) is True
+    assert login_throttle.is_throttled('foo', '127.0.0.1', now + 7.5 * 60) is False
+    assert login_throttle.is_throttled('foo', '127.0.0.1', now + 10 * 60) is False
+
+    # Failures were audited, but those from an address don't count anymore once reset for it.
+    assert FailedLoginAttempt.query.count() == 2
+    login_throttle.reset('foo', '10.0.0.1', now + 60)
+    assert login_throttle.is_throttled('foo', '127.0.0.1', now + 60) is True
+    login_throttle.reset('foo', '127.0.0.1', now + 60)
+    assert login_throttle.is_throttled('foo', '127.0.0.1', now + 60) is False
+
+
+@pytest.mark.usefixtures('db')
+def test_reset_leaves_failures_from_other_addresses(app):
+    """Logging in from one address doesn't forget failures from another."""
+    app.config['XL_AUTH_FAILED_LOGIN_MAX_ATTEMPTS'] = 2
+    app.config['XL_AUTH_FAILED_LOGIN_AUDIT'] = ''
+    now = 1000 * app.config['XL_AUTH_FAILED_LOGIN_TIMEFRAME']  # Start of a window.
+
+    login_throttle.record_failure('foo', '10.0.0.1', now)
+    login_throttle.record_failure('foo', '127.0.0.1', now)
+    login_throttle.record_failure('foo', '10.0.0.1', now)
+    login_throttle.reset('foo', '127.0.0.1', now)
+    assert login_throttle.is_throttled('foo', '127.0.0.1', now) is True
+
+
+@pytest.mark.usefixtures('db')
+def test_too_many_recent_failures_from_address(app):
+    """Failures for many usernames from one address throttle that address."""
+    app.config['XL_AUTH_FAILED_LOGIN_MAX_ATTEMPTS_PER_ADDRESS'] = 3
+    app.config['XL_AUTH_FAILED_LOGIN_AUDIT'] = ''
+
+    for username in ('foo', 'bar', 'baz'):
+        login_throttle.record_failure(username, '127.0.0.1')
+    assert login_throttle.is_throttled('qux', '127.0.0.1') is True
+    assert login_throttle.is_throttled('qux', '10.0.0.1') is False
+    assert FailedLoginAttempt.query.count() == 0
+
+
+@pytest.mark.usefixtures('db')
+def test_failures_are_counted_beyond_default_cache_timeout(app, monkeypatch):
+    """Counters last for the window, not for the cache's default timeout."""
+    app.config['XL_AUTH_FAILED_LOGIN_MAX_ATTEMPTS'] = 1
+    app.config['XL_AUTH_FAILED_LOGIN_TIMEFRAME'] = 60 * 60
+    app.config['XL_AUTH_FAILED_LOGIN_AUDIT'] = ''
+    now = 1000 * 60 * 60  # Start of a window.
+    login_throttle.record_failure('foo', '127.0.0.1', now)
+
+    # The cache expires entries by the actual clock.
+    later = time() + cache.cache.default_timeout + 60
+    monkeypatch.setattr(cachelib.simple, 'time', lambda: later)
+    assert login_throttle.is_throttled('foo', '10.0.0.1', now + 10 * 60) is True
@@ -0,0 +1,56 @@
+"""Unit tests for offline verification of signed access tokens."""
+
+
+import pytest
+
+from xl_auth.offline_verification import (InvalidAccessTokenError, compact_permissions,
+                                          dump_access_token, expand_permissions,
+                                          is_signed_access_token, load_access_token)
+
+CLAIMS = {'jti': 'abc', 'sub': 1, 'cid': 'def', 'scp': ['read', 'write'], 'exp': 1000,
+          'prm': [['c1', 3], ['c2', 4]]}
+
+
+def test_load_access_token():
+    """Valid tokens give back their claims."""
+    access_token = dump_access_token(CLAIMS, 'key')
+    assert is_signed_access_token(access_token)
+    assert load_access_token(access_token, 'key', scopes=['read'], now=999) == CLAIMS
+
+
+def test_load_access_token_with_wrong_key():
+    """Tokens signed with another key are rejected."""
+    access_token = dump_access_token(CLAIMS, 'key')
+    with pytest.raises(InvalidAccessTokenError, match='Bearer token not found.'):
+        load_access_token(access_token, 'other-key', now=999)
+
+
+def test_load_access_token_when_expired():
+    """Expired tokens are rejected."""
+    access_token = dump_access_token(CLAIMS, 'key')
+    with pytest.raises(InvalidAccessTokenError, match='Bearer token is expired.'):
+        load_access_token(access_token, 'key', now=1001)
+
+
+def test_load_access_token_with_wrong_scope():
+    """Tokens without any of the requested scopes are rejected."""
+    access_token = dump_access_token(CLAIMS, 'key')
+    with pytest.raises(InvalidAccessTokenError, match='Bearer token scope not valid.'):
+        load_access_token(access_token, 'key', scopes=['admin'], now=999)
+
+
+def test_load_access_token_when_revoked():
+    """Revoked tokens are rejected."""
+    access_token = dump_access_token(CLAIMS, 'key')
+    with pytest.raises(InvalidAccessTokenError, match='Bearer token not found.'):
+        load_access_token(access_token, 'key', now=999,
+                          is_revoked=lambda claims: claims['jti'] == 'abc')
+
+
+def test_compact_and_expand_permissions():
+    """Permission summary round-trips, sans 'friendly_name'."""
+    permissions = [{'code': 'c1', 'friendly_name': 'C1', 'registrant': True, 'cataloger': True,
+                    'global_registrant': False}]
+    assert compact_permissions(permissions) == [['c1', 3]]
+    assert expand_permissions({'prm': compact_permissions(permissions)}) == [
+        {'code': 'c1', 'registrant': True, 'cataloger': True, 'global_registrant': False}]
@@ -0,0 +1,57 @@
+"""Test purging of expired rows."""
+
+
+from datetime import datetime, timedelta
+
+from xl_auth.commands import purge_expired as purge_expired_command
+from xl_auth.oauth.grant.models import Grant
+from xl_auth.oauth.token.models import Token
+from xl_auth.purge import count_expired, delete_expired, purge_expired
+from xl_auth.user.models import FailedLoginAttempt
+
+from .factories import GrantFactory, TokenFactory
+
+
+def test_purge_expired(app, db):
+    """Only rows past their retention period are deleted, in batches."""
+    app.config['XL_AUTH_PURGE_RETENTION'] = dict(app.config['XL_AUTH_PURGE_RETENTION'], tokens=60)
+    long_ago = datetime.utcnow() - timedelta(days=365)
+    for _ in range(5):
+        TokenFactory(expires_at=long_ago)
+    recently_expired_token = TokenFactory(expires_at=datetime.utcnow() - timedelta(seconds=30))
+    live_token = TokenFactory(expires_at=datetime.utcnow() + timedelta(hours=1))
+    GrantFactory(expires_at=long_ago)
+    live_grant = GrantFactory()
+    old_attempt = FailedLoginAttempt(username='foo@example.com', remote_addr='127.0.0.1').save()
+    old_attempt.update(created_at=long_ago)
+    FailedLoginAttempt(username='foo@example.com', remote_addr='127.0.0.1').save()
+    db.session.commit()
+
+    assert count_expired() == {'tokens': 5, 'grants': 1, 'password_resets': 0,
+                               'failed_login_attempts': 1}
+    assert delete_expired('tokens', batch_size=2) == 5
+    assert set(Token.query.all()) == {recently_expired_token, live_token}
+
+    messages = []
+    assert purge_expired(echo=messages.append) == {'tokens': 0, 'grants': 1,
+                                                   'password_resets': 0,
+                                                   'failed_login_attempts': 1}
+    assert len(messages) == 4
+    assert Grant.query.all() == [live_grant]
+    assert FailedLoginAttempt.query.count() == 1
+
+
+def test_purge_expired_command_dry_run(app, db):
+    """Dry run only counts."""
+    TokenFactory(expires_at=datetime.utcnow() - timedelta(days=365))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(purge_expired_command, ['--dry-run'])
+    assert result.exit_code == 0
+    assert 'tokens: 1 rows would be deleted' in result.output
+    assert Token.query.count() == 1
+
+    result = app.test_cli_runner().invoke(purge_expired_command)
+    assert result.exit_code == 0
+    assert 'Deleted 1 rows in total.' in result.output
+    assert Token.query.count() == 0
@@ -7,7 +7,16 @@ from flask_login import current_user
 from . import collection, commands, oauth, permission, public, user
 from .extensions import (babel, bcrypt, cache, csrf_protect, db, debug_toolbar, login_manager,
                          migrate, oauth_provider, flask_static_digest)
+from .last_login import last_login_buffer
+from .login_throttle import login_throttle
+from .oauth.cache import verify_cache
+from .oauth.client.registry import client_registry
+from .oauth.grant.store import check_grant_store
+from .oauth.signed_tokens import check_revocation_list
+from .purge import purge_job
 from .settings import ProdConfig
+from .user.snapshot import check_snapshot_cache
+from .utils import url_for_page
 
 
 def create_app(config_object=ProdConfig):
@@ -24,6 +33,7 @@ def create_app(config_object=ProdConfig):
     register_after_request_funcs(app)
     register_shell_context(app)
     register_commands(app)
+    register_template_globals(app)
     return app
 
 
@@ -32,6 +42,9 @@ def register_extensions(app):
     babel.init_app(app)
     bcrypt.init_app(app)
     cache.init_app(app)
+    check_revocation_list(app)
+    check_snapshot_cache(app)
+    check_grant_store(app)
     db.init_app(app)
     csrf_protect.init_app(app)
     login_manager.init_app(app)
@@ -39,6 +52,11 @@ def register_extensions(app):
     migrate.init_app(app, db)
     oauth_provider.init_app(app)
     flask_static_digest.init_app(app)
+    verify_cache.init_app(app)
+    client_registry.init_app(app)
+    purge_job.init_app(app)
+    login_throttle.init_app(app)
+    last_login_buffer.init_app(app)
     return None
 
 
@@ -106,3 +124,10 @@ def register_commands(app):
     app.cli.add_command(commands.urls)
     app.cli.add_command(commands.import_data)
     app.cli.add_command(commands.prod_run)
+    app.cli.add_command(commands.purge_expired)
+    app.cli.add_command(commands.bcrypt_benchmark)
+
+
+def register_template_globals(app):
+    """Register functions available in all templates."""
+    app.add_template_global(url_for_page)
@@ -7,6 +7,9 @@ from flask_babel import lazy_gettext as _
 
 from ..database import Column, Model, SurrogatePK, db, or_, reference_col, relationship
 
+#: Collection categories, as stored in 'Collection.category'.
+COLLECTION_CATEGORIES = ('bibliography', 'library', 'uncategorized')
+
 
 class Collection(SurrogatePK, Model):
     """A collection of library stuff, a.k.a. 'a sigel'."""
@@ -59,7 +62,8 @@ class Collection(SurrogatePK, Model):
             return self.permissions
         else:
             def is_cataloging_admin_or_own_permissions(test_permission):
-                return test_permission.user == current_user or test_permission.cataloging_admin
+                is_own_permission = test_permission.user_id == current_user.id
+                return is_own_permission or test_permission.cataloging_admin
             return list(filter(is_cataloging_admin_or_own_permissions, self.permissions))
 
     def get_replaces_and_replaced_by_str(self):
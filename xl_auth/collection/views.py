@@ -4,25 +4,63 @@
 from flask import Blueprint, abort, flash, redirect, render_template, request, url_for
 from flask_babel import gettext as _
 from flask_login import current_user, login_required
+from sqlalchemy import func, or_
+from sqlalchemy.orm import noload
 
-from ..utils import flash_errors
+from ..extensions import db
+from ..permission.models import Permission
+from ..utils import flash_errors, get_page_args, stream_template
 from .forms import EditForm, RegisterForm
-from .models import Collection
+from .models import COLLECTION_CATEGORIES, Collection
 
 blueprint = Blueprint('collection', __name__, url_prefix='/collections', static_folder='../static')
 
 
+def get_collection_overview_query(search='', category=''):
+    """Return query for active (collection, permission count) rows, by code."""
+    permission_count = func.count(Permission.id)
+    query = (db.session.query(Collection, permission_count)
+             .outerjoin(Permission, Permission.collection_id == Collection.id)
+             .options(noload(Collection.permissions))
+             .filter(Collection.is_active.is_(True))
+             .group_by(Collection.id)
+             .order_by(Collection.code))
+    if category:
+        query = query.filter(Collection.category == category)
+    if search:
+        search = search.lower()
+        query = query.filter(or_(func.lower(Collection.code).startswith(search, autoescape=True),
+                                 func.lower(Collection.friendly_name).contains(search,
+                                                                               autoescape=True)))
+    return query, permission_count
+
+
 @blueprint.route('/')
 @login_required
 def home():
-    """Collections' overview landing page."""
-    active_collections = Collection.query.filter_by(is_active=True).order_by('code').all()
-
-    return render_template('collections/home.html',
-                           active_collections_with_users=[_ for _ in active_collections
-                                                          if len(_.permissions) > 0],
-                           active_collections_without_users=[_ for _ in active_collections
-                                                             if len(_.permissions) == 0])
+    """Collections' overview landing page.
+
+    Query arguments: 'q' (code prefix or part of name), 'category', 'page' for the section with
+    users, 'empty_page' for the one without and 'per_page'. Each section is one aggregate query,
+    split on permission count with ``HAVING``.
+    """
+    search = request.args.get('q', '').strip()
+    category = request.args.get('category', '')
+    if category not in COLLECTION_CATEGORIES:
+        category = ''
+    query, permission_count = get_collection_overview_query(search, category)
+
+    page, per_page = get_page_args()
+    with_users = (query.having(permission_count > 0)
+                  .paginate(page=page, per_page=per_page, error_out=False))
+    page, per_page = get_page_args('empty_page')
+    without_users = (query.having(permission_count == 0)
+                     .paginate(page=page, per_page=per_page, error_out=False))
+
+    return stream_template('collections/home.html',
+                           active_collections_with_users=with_users,
+                           active_collections_without_users=without_users,
+                           search=search, category=category)
 
 
 @blueprint.route('/register/', methods=['GET', 'POST'])
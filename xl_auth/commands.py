@@ -15,11 +15,14 @@ from flask import current_app
 from flask.cli import with_appcontext
 from werkzeug.exceptions import MethodNotAllowed, NotFound
 
+from xl_auth import hashing, purge
 from xl_auth.collection.models import Collection
-from xl_auth.oauth.grant.models import Grant
+from xl_auth.extensions import bcrypt
+from xl_auth.oauth.grant.store import grant_store
 from xl_auth.oauth.token.models import Token
 from xl_auth.oauth.client.models import Client
 from xl_auth.permission.models import Permission
+from xl_auth.purge import count_expired
 from xl_auth.user.models import FailedLoginAttempt, PasswordReset, User
 
 # Disable warnings on discouraged Py3 use (http://click.pocoo.org/python3/).
@@ -161,7 +164,7 @@ def forget_user(email, dry_run):
 
         if dry_run:
             tokens = Token.get_all_by_user(user)
-            grants = Grant.get_all_by_user(user)
+            grants = grant_store.get_all_by_user(user)
             failed_login_attempts = FailedLoginAttempt.get_all_by_user(user)
             permissions = user.permissions
             password_resets = user.password_resets
@@ -175,7 +178,7 @@ def forget_user(email, dry_run):
             if click.confirm('Are you sure you want to delete all information '
                              'related to user "{}"?'.format(user)):
                 Token.delete_all_by_user(user)
-                Grant.delete_all_by_user(user)
+                grant_store.delete_all_by_user(user)
                 Permission.delete_all_by_user(user)
                 PasswordReset.delete_all_by_user(user)
                 FailedLoginAttempt.delete_all_by_user(user)
@@ -204,7 +207,7 @@ def soft_delete_user(email, dry_run, admin_email):
 
         if dry_run:
             tokens = Token.get_all_by_user(user)
-            grants = Grant.get_all_by_user(user)
+            grants = grant_store.get_all_by_user(user)
             failed_login_attempts = FailedLoginAttempt.get_all_by_user(user)
             permissions = user.permissions
             password_resets = user.password_resets
@@ -218,7 +221,7 @@ def soft_delete_user(email, dry_run, admin_email):
             if click.confirm('Are you sure you want to delete all information '
                              'related to user "{}", and soft-delete the account?'.format(user)):
                 Token.delete_all_by_user(user)
-                Grant.delete_all_by_user(user)
+                grant_store.delete_all_by_user(user)
                 FailedLoginAttempt.delete_all_by_user(user)
                 user.soft_delete()
     else:
@@ -783,3 +786,35 @@ def import_data(verbose, admin_email, wipe_permissions, send_password_resets):
 def prod_run():
     """Run application with production setup."""
     execlp('gunicorn', 'gunicorn', '-c', 'gunicorn_conf.py', 'autoapp:app')
+
+
+@click.command()
+@click.option('-d', '--dry-run', default=False, is_flag=True,
+              help="Count what would be deleted, but don't actually delete anything.")
+@click.option('-b', '--batch-size', default=None, type=int,
+              help='Rows per transaction (default: XL_AUTH_PURGE_BATCH_SIZE)')
+@with_appcontext
+def purge_expired(dry_run, batch_size):
+    """Delete expired tokens, grants, password resets and old failed login attempts."""
+    if dry_run:
+        for name, count in count_expired().items():
+            click.echo('{}: {} rows would be deleted'.format(name, count))
+    else:
+        deleted = purge.purge_expired(batch_size=batch_size, echo=click.echo)
+        click.echo('Deleted {} rows in total.'.format(sum(deleted.values())))
+
+
+@click.command()
+@click.option('--min-cost', default=4, help='Lowest cost factor to time (default: 4)')
+@click.option('--max-cost', default=14, help='Highest cost factor to time (default: 14)')
+@click.option('-t', '--target-ms', default=None, type=int,
+              help='Also show the cost factor calibration would pick for this target')
+@with_appcontext
+def bcrypt_benchmark(min_cost, max_cost, target_ms):
+    """Print bcrypt hashing time per cost factor on this host."""
+    for log_rounds in range(min_cost, max_cost + 1):
+        click.echo('cost {:2d}: {:8.1f} ms'.format(log_rounds, hashing.measure(log_rounds) * 1000))
+    click.echo('Current cost factor: {}'.format(bcrypt.log_rounds))
+    if target_ms:
+        click.echo('Calibrated cost factor for {} ms: {}'.format(target_ms, hashing.calibrate(
+            target_ms, current_app.config['XL_AUTH_BCRYPT_MIN_LOG_ROUNDS'])))
@@ -4,6 +4,10 @@
 from codecs import getencoder
 from os import urandom
 
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
+
 from .extensions import db
 
 try:
@@ -19,6 +23,11 @@ relationship = db.relationship
 or_ = db.or_
 
 
+def get_user_instance(user):
+    """Return ``User`` instance for 'user', which may be a stand-in like ``UserSnapshot``."""
+    return user.get_user() if hasattr(user, 'get_user') else user
+
+
 class CRUDMixin(object):
     """Mixin that adds convenience methods for CRUD (create, read, update, delete) operations."""
 
@@ -50,6 +59,7 @@ class CRUDMixin(object):
     def save_as(self, current_user, commit=True, preserve_modified=False):
         """Save instance as 'current_user'."""
         assert hasattr(self, 'modified_by') and hasattr(self, 'created_by')
+        current_user = get_user_instance(current_user)
         # noinspection PyUnresolvedReferences
         if current_user and not self.created_at:
             # noinspection PyAttributeOutsideInit
@@ -60,13 +70,11 @@ class CRUDMixin(object):
         return self.save(commit=commit, preserve_modified=preserve_modified)
 
     def save(self, commit=True, preserve_modified=False):
-        """Save the record."""
+        """Save the record, leaving 'modified_at' alone on the next flush if 'preserve_modified'."""
         db.session.add(self)
+        if preserve_modified and hasattr(type(self), 'modified_at'):  # Not loading it (autoflush).
+            db.session.info.setdefault(_PRESERVE_MODIFIED_KEY, []).append(self)
         if commit:
-            if preserve_modified and hasattr(self, 'modified_at'):
-                modified_dt = self.modified_at
-                db.session.commit()
-                self.modified_at = modified_dt
             db.session.commit()
         return self
 
@@ -76,6 +84,27 @@ class CRUDMixin(object):
         return commit and db.session.commit()
 
 
+_PRESERVE_MODIFIED_KEY = 'preserve_modified'
+
+
+@event.listens_for(Session, 'before_flush')
+def _preserve_modified_at(session, *_):
+    """Write 'modified_at' as is for instances saved with 'preserve_modified'.
+
+    Including the column in the UPDATE keeps its 'onupdate' default from firing.
+    """
+    for instance in session.info.pop(_PRESERVE_MODIFIED_KEY, []):
+        if instance in session.dirty and session.is_modified(instance):
+            instance.modified_at  # Loads it if expired; can't be flagged otherwise.
+            flag_modified(instance, 'modified_at')
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_preserve_modified(session):
+    """Nothing was written, so nothing is left to preserve."""
+    session.info.pop(_PRESERVE_MODIFIED_KEY, None)
+
+
 class Model(CRUDMixin, db.Model):
     """Base model class that includes CRUD convenience methods."""
 
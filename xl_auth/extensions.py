@@ -2,8 +2,8 @@
 
 
 from flask_babel import Babel
-from flask_bcrypt import Bcrypt
 from flask_caching import Cache
+from flask_caching.backends import NullCache, SimpleCache
 from flask_debugtoolbar import DebugToolbarExtension
 from flask_login import LoginManager
 from flask_migrate import Migrate
@@ -12,7 +12,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_wtf.csrf import CSRFProtect
 from flask_static_digest import FlaskStaticDigest
 
-bcrypt = Bcrypt()
+from .hashing import PooledBcrypt
+
+bcrypt = PooledBcrypt()
 csrf_protect = CSRFProtect()
 login_manager = LoginManager()
 db = SQLAlchemy()
@@ -22,3 +24,8 @@ debug_toolbar = DebugToolbarExtension()
 babel = Babel()
 oauth_provider = OAuth2Provider()
 flask_static_digest = FlaskStaticDigest()
+
+
+def has_shared_cache(app):
+    """Check if 'app's ``cache`` is seen by all worker processes, unlike e.g. 'SimpleCache'."""
+    return not isinstance(app.extensions['cache'][cache], (NullCache, SimpleCache))
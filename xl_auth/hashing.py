@@ -0,0 +1,150 @@
+"""Bcrypt hashing off the request threads, in a bounded pool of worker processes."""
+
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from time import monotonic, perf_counter
+
+from flask import render_template
+from flask_bcrypt import Bcrypt
+from werkzeug.exceptions import TooManyRequests
+
+
+class PasswordHashingBusy(TooManyRequests):
+    """All bcrypt workers are busy and the queue is full; the client should retry shortly."""
+
+    description = 'Too many simultaneous password checks, please try again.'
+
+
+def _call(config, method_name, *args):
+    """Run Bcrypt 'method_name' with 'config' (rounds, prefix, long passwords), in a worker."""
+    bcrypt = Bcrypt()
+    bcrypt._log_rounds, bcrypt._prefix, bcrypt._handle_long_passwords = config
+    return getattr(Bcrypt, method_name)(bcrypt, *args)
+
+
+#: Highest cost factor calibration will consider.
+MAX_LOG_ROUNDS = 20
+
+
+def get_log_rounds(pw_hash):
+    """Return cost factor of bcrypt 'pw_hash', e.g. 12 for b'$2b$12$...'."""
+    if isinstance(pw_hash, str):
+        pw_hash = pw_hash.encode('utf-8')
+    return int(pw_hash.split(b'$')[2])
+
+
+def measure(log_rounds):
+    """Return seconds it takes to hash a password with cost factor 'log_rounds' on this host."""
+    started = perf_counter()
+    Bcrypt().generate_password_hash('calibration', log_rounds)
+    return perf_counter() - started
+
+
+def calibrate(target_ms, min_log_rounds):
+    """Return highest cost factor hashing within 'target_ms' here, but at least 'min_log_rounds'."""
+    log_rounds = min_log_rounds
+    while log_rounds < MAX_LOG_ROUNDS and measure(log_rounds + 1) * 1000 <= target_ms:
+        log_rounds += 1
+    return log_rounds
+
+
+class PooledBcrypt(Bcrypt):
+    """Drop-in ``Bcrypt`` that hashes and verifies in a process pool.
+
+    With ``XL_AUTH_BCRYPT_POOL_SIZE`` set to 0, work runs on the calling thread as before. At most
+    ``XL_AUTH_BCRYPT_QUEUE_LIMIT`` operations may be running or queued per process, anything
+    beyond that raises ``PasswordHashingBusy`` (429), instead of tying up every request thread.
+
+    If ``XL_AUTH_BCRYPT_TARGET_MS`` is set, the cost factor is calibrated at startup to the
+    highest one hashing within that many milliseconds (never below
+    ``XL_AUTH_BCRYPT_MIN_LOG_ROUNDS``), overriding ``BCRYPT_LOG_ROUNDS``.
+    """
+
+    def __init__(self, app=None):
+        """Create instance."""
+        self.pool_size = 0
+        self.queue_limit = 0
+        self._lock = Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._in_flight = 0
+        self._stats = dict(hashes=0, rejected=0, hash_seconds_total=0.0, hash_seconds_max=0.0)
+        super(PooledBcrypt, self).__init__(app)
+
+    def init_app(self, app):
+        """Configure from app settings."""
+        super(PooledBcrypt, self).init_app(app)
+        if app.config['XL_AUTH_BCRYPT_TARGET_MS']:
+            self._log_rounds = calibrate(app.config['XL_AUTH_BCRYPT_TARGET_MS'],
+                                         app.config['XL_AUTH_BCRYPT_MIN_LOG_ROUNDS'])
+            app.logger.info('Calibrated bcrypt cost factor to %d', self._log_rounds)
+        self.pool_size = app.config['XL_AUTH_BCRYPT_POOL_SIZE']
+        self.queue_limit = app.config['XL_AUTH_BCRYPT_QUEUE_LIMIT']
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = self._executor_pid = None
+        app.errorhandler(PasswordHashingBusy)(self._render_busy)
+
+    def generate_password_hash(self, password, rounds=None, prefix=None):
+        """Generate password hash, see ``Bcrypt.generate_password_hash``."""
+        return self._submit('generate_password_hash', password, rounds, prefix)
+
+    def check_password_hash(self, pw_hash, password):
+        """Check password against hash, see ``Bcrypt.check_password_hash``."""
+        return self._submit('check_password_hash', pw_hash, password)
+
+    @property
+    def log_rounds(self):
+        """Return cost factor used for new hashes."""
+        return self._log_rounds
+
+    def needs_rehash(self, pw_hash):
+        """Check if 'pw_hash' was made with a lower cost factor than the current one.
+
+        Stronger hashes are kept, so that a lower calibration on one host doesn't weaken them.
+        """
+        return get_log_rounds(pw_hash) < self._log_rounds
+
+    def get_stats(self):
+        """Return queue depth and hashing latency figures for this process, for monitoring."""
+        with self._lock:
+            return dict(self._stats, pool_size=self.pool_size, queue_limit=self.queue_limit,
+                        queue_depth=self._in_flight)
+
+    def _submit(self, method_name, *args):
+        with self._lock:
+            if self._in_flight >= self.queue_limit:
+                self._stats['rejected'] += 1
+                raise PasswordHashingBusy(retry_after=1)
+            self._in_flight += 1
+        started = monotonic()
+        try:
+            config = (self._log_rounds, self._prefix, self._handle_long_passwords)
+            if self.pool_size:
+                return self._get_executor().submit(_call, config, method_name, *args).result()
+            return _call(config, method_name, *args)
+        finally:
+            elapsed = monotonic() - started
+            with self._lock:
+                self._in_flight -= 1
+                self._stats['hashes'] += 1
+                self._stats['hash_seconds_total'] += elapsed
+                self._stats['hash_seconds_max'] = max(self._stats['hash_seconds_max'], elapsed)
+
+    def _get_executor(self):
+        with self._lock:
+            # Pools don't survive forking, e.g. by Gunicorn with 'preload_app'.
+            if self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.pool_size, mp_context=multiprocessing.get_context('spawn'))
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    @staticmethod
+    def _render_busy(error):
+        """Render 429 error template, telling the client when to retry."""
+        return render_template('429.html'), error.code, error.get_headers()
@@ -0,0 +1,227 @@
+"""Tell caches and derived data about writes, from one set of session listeners.
+
+Subscribers name the models (and optionally the attributes) they depend on, and are called
+with the matching ``Changes``:
+
+- 'on_flush' subscribers right after each flush, inside the transaction, e.g. to rewrite rows
+  that must change along with it;
+- 'on_commit' subscribers once the transaction is committed, e.g. to evict in-memory entries.
+  Nothing is reported for rolled back transactions.
+
+Query-level UPDATE and DELETE are reported too, scoped to the rows they hit: those are read
+just before (and for UPDATE, just after) the statement runs. Statements on plain tables, e.g.
+``db.session.execute(table.delete())``, are not seen.
+"""
+
+
+from itertools import chain
+
+from sqlalchemy import event, inspect, select, tuple_
+from sqlalchemy.orm import Session
+
+_CHANGES_KEY = 'invalidation_changes'
+
+_flush_subscribers = []
+_commit_subscribers = []
+
+
+class Change(object):
+    """A row written, with the users it belongs to.
+
+    'changed' holds the names of changed attributes, or None for inserted and deleted rows.
+    'old_values' holds what watched attributes no longer are, for changed and deleted rows.
+    """
+
+    __slots__ = ('model', 'key', 'user_ids', 'changed', 'old_values')
+
+    def __init__(self, model, key, user_ids, changed=None, old_values=None):
+        """Create instance."""
+        self.model = model
+        self.key = key
+        self.user_ids = user_ids
+        self.changed = changed
+        self.old_values = old_values or dict()
+
+    def __repr__(self):
+        """Represent instance as a unique string."""
+        return '<Change({model}:{key!r})>'.format(model=self.model.__name__, key=self.key)
+
+
+class Changes(list):
+    """Changes matching a subscriber's dependencies."""
+
+    def of(self, model):
+        """Return changes to rows of 'model'."""
+        return [change for change in self if issubclass(change.model, model)]
+
+    def keys(self, model):
+        """Return primary keys of changed rows of 'model'."""
+        return {change.key for change in self.of(model)}
+
+    @property
+    def user_ids(self):
+        """Return IDs of all users whose rows, or rows they own, changed."""
+        return set(chain.from_iterable(change.user_ids for change in self))
+
+
+def on_flush(dependencies):
+    """Register decorated 'callback(session, changes)' to run after flushes touching these.
+
+    :param dependencies: Mapping of model to names of attributes it depends on, or None for any.
+    """
+    def decorator(callback):
+        _flush_subscribers.append((dependencies, callback))
+        return callback
+    return decorator
+
+
+def on_commit(dependencies):
+    """Register decorated 'callback(session, changes)' to run after commits touching these.
+
+    :param dependencies: Mapping of model to names of attributes it depends on, or None for any.
+    """
+    def decorator(callback):
+        _commit_subscribers.append((dependencies, callback))
+        return callback
+    return decorator
+
+
+def _get_watched_attributes(model):
+    """Return names of attributes subscribers want old values of, or None if nobody cares."""
+    watched = None
+    for dependencies, _ in chain(_flush_subscribers, _commit_subscribers):
+        for dependency, attributes in dependencies.items():
+            if issubclass(model, dependency):
+                watched = (watched or set()) | set(attributes or ())
+    return watched
+
+
+def _matches(change, dependencies):
+    """Check if 'change' is one that 'dependencies' care about."""
+    for dependency, attributes in dependencies.items():
+        if issubclass(change.model, dependency):
+            return attributes is None or change.changed is None or \
+                bool(change.changed.intersection(attributes))
+    return False
+
+
+def _publish(session, changes, subscribers):
+    """Call each of 'subscribers' with the 'changes' it depends on, if any."""
+    for dependencies, callback in subscribers:
+        matching = Changes(change for change in changes if _matches(change, dependencies))
+        if matching:
+            callback(session, matching)
+
+
+def _get_user_ids(mapper, values):
+    """Return user IDs for a row of 'mapper', from its 'values' by attribute name."""
+    if mapper.local_table.name == 'users':
+        return set(values.get('id', ()))
+    return set(values.get('user_id', ())) - {None}
+
+
+def _get_instance_change(session, instance, watched):
+    """Return ``Change`` for flushed 'instance', or None if nothing about it changed."""
+    state = inspect(instance)
+    mapper = state.mapper
+    is_new, is_deleted = instance in session.new, instance in session.deleted
+    values, changed, old_values = dict(), set(), dict()
+    for attribute in state.attrs:
+        history = attribute.history
+        values[attribute.key] = history.sum()
+        if history.has_changes():
+            changed.add(attribute.key)
+        if attribute.key in watched and not is_new:
+            old = history.non_added() if is_deleted else history.deleted or ()
+            if old:
+                old_values[attribute.key] = old[0]
+    if not (is_new or is_deleted or changed):
+        return None
+    key = mapper.primary_key_from_instance(instance)
+    return Change(mapper.class_, key[0] if len(key) == 1 else tuple(key),
+                  _get_user_ids(mapper, values), None if is_new or is_deleted else changed,
+                  old_values)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed_changes(session, _):
+    """Report flushed instances to flush subscribers, and keep them for commit subscribers."""
+    changes = []
+    for instance in chain(session.new, session.dirty, session.deleted):
+        watched = _get_watched_attributes(type(instance))
+        if watched is not None:
+            change = _get_instance_change(session, instance, watched)
+            if change is not None:
+                changes.append(change)
+    if changes:
+        _publish(session, changes, _flush_subscribers)
+        session.info.setdefault(_CHANGES_KEY, []).extend(changes)
+
+
+def _select_rows(session, mapper, whereclause):
+    """Return mapping of primary key to column values, by attribute name, of matching rows."""
+    columns = [prop.columns[0].label(prop.key) for prop in mapper.column_attrs]
+    query = select(*columns)
+    if whereclause is not None:
+        query = query.where(whereclause)
+    keys = [mapper.get_property_by_column(column).key for column in mapper.primary_key]
+    rows = dict()
+    for row in session.execute(query).mappings():
+        key = tuple(row[name] for name in keys)
+        rows[key[0] if len(key) == 1 else key] = dict(row)
+    return rows
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_changes(orm_execute_state):
+    """Run query-level UPDATE/DELETE here, reading the rows it hits around it."""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return None
+    mapper = orm_execute_state.bind_mapper
+    watched = mapper and _get_watched_attributes(mapper.class_)
+    if watched is None:
+        return None
+
+    session = orm_execute_state.session
+    before = _select_rows(session, mapper, orm_execute_state.statement.whereclause)
+    result = orm_execute_state.invoke_statement()
+    if not before:
+        return result
+
+    changes = []
+    if orm_execute_state.is_delete:
+        for key, values in before.items():
+            changes.append(Change(mapper.class_, key,
+                                  _get_user_ids(mapper, {name: [value] for name, value
+                                                         in values.items()}),
+                                  old_values={name: values[name] for name in watched
+                                              if name in values}))
+    else:
+        primary_key = mapper.primary_key
+        after = _select_rows(session, mapper, primary_key[0].in_(before)
+                             if len(primary_key) == 1 else tuple_(*primary_key).in_(before))
+        for key, values in before.items():
+            new_values = after.get(key, values)
+            changed = {name for name in values if values[name] != new_values[name]}
+            if changed:
+                changes.append(Change(mapper.class_, key, _get_user_ids(mapper, {
+                    name: [values[name], new_values[name]] for name in values}), changed,
+                    {name: values[name] for name in watched & changed}))
+    if changes:
+        _publish(session, changes, _flush_subscribers)
+        session.info.setdefault(_CHANGES_KEY, []).extend(changes)
+    return result
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_committed_changes(session):
+    """Report changes made by the committed transaction to commit subscribers."""
+    changes = session.info.pop(_CHANGES_KEY, [])
+    if changes:
+        _publish(session, changes, _commit_subscribers)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changes(session):
+    """Nothing was written, so nothing is reported."""
+    session.info.pop(_CHANGES_KEY, None)
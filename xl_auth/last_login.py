@@ -0,0 +1,114 @@
+"""Write-behind buffering of 'last_login_at' updates, see ``XL_AUTH_LAST_LOGIN_*`` settings."""
+
+
+import atexit
+import os
+import threading
+
+from sqlalchemy import bindparam, column, func, tuple_, values
+
+from .extensions import db
+from .user.models import FailedLoginAttempt, User
+
+
+class LastLoginBuffer(object):
+    """Collect successful logins in memory and write them to the database in batches.
+
+    Each flush is one transaction that sets 'last_login_at' for every buffered user with a
+    single bulk ``UPDATE`` (``UPDATE ... FROM (VALUES ...)`` on PostgreSQL), leaving
+    'modified_at' as it was, and deletes the failed login attempts the logins cleared.
+
+    With ``XL_AUTH_LAST_LOGIN_FLUSH_INTERVAL`` set, a daemon thread per worker process flushes
+    that often, or as soon as ``XL_AUTH_LAST_LOGIN_FLUSH_SIZE`` logins are buffered, so the login
+    request never waits on these writes. Set to 0, every login is flushed right away. Logins
+    buffered by a process that dies before its next flush are lost, which for a "last seen"
+    timestamp is an acceptable trade.
+    """
+
+    def __init__(self, app=None):
+        """Create instance."""
+        self.app = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._last_logins = dict()
+        self._failed_logins = set()
+        atexit.register(self._flush_at_exit)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Remember app, for flushing outside of requests."""
+        self.app = app
+
+    def add(self, user_id, email, remote_addr, last_login_at):
+        """Buffer login by 'user_id', clearing failed attempts for 'email' from 'remote_addr'."""
+        config = self.app.config
+        with self._lock:
+            self._last_logins[user_id] = max(last_login_at,
+                                             self._last_logins.get(user_id, last_login_at))
+            self._failed_logins.add((User.normalize_email(email), remote_addr))
+            pending = len(self._last_logins)
+        if not config['XL_AUTH_LAST_LOGIN_FLUSH_INTERVAL']:
+            self.flush()
+            return
+        self._ensure_started()
+        if pending >= config['XL_AUTH_LAST_LOGIN_FLUSH_SIZE']:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write everything buffered so far; return number of users updated."""
+        with self._lock:
+            last_logins, self._last_logins = self._last_logins, dict()
+            failed_logins, self._failed_logins = self._failed_logins, set()
+        if not last_logins:
+            return 0
+
+        users, attempts = User.__table__, FailedLoginAttempt.__table__
+        with db.engine.begin() as connection:
+            if connection.dialect.name == 'postgresql':
+                batch = values(column('id', db.Integer), column('last_login_at', db.DateTime),
+                               name='last_logins').data(list(last_logins.items()))
+                connection.execute(users.update()
+                                   .values(last_login_at=batch.c.last_login_at,
+                                           modified_at=users.c.modified_at)
+                                   .where(users.c.id == batch.c.id))
+            else:  # E.g. SQLite, where SQLAlchemy can't render UPDATE ... FROM.
+                connection.execute(users.update()
+                                   .values(last_login_at=bindparam('last_login_at'),
+                                           modified_at=users.c.modified_at)
+                                   .where(users.c.id == bindparam('user_id')),
+                                   [dict(user_id=user_id, last_login_at=last_login_at)
+                                    for user_id, last_login_at in last_logins.items()])
+            connection.execute(attempts.delete().where(
+                tuple_(func.lower(attempts.c.username), attempts.c.remote_addr)
+                .in_(failed_logins)))
+        return len(last_logins)
+
+    def _ensure_started(self):
+        with self._lock:
+            # Threads don't survive forking, e.g. by Gunicorn with 'preload_app'.
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name='last-login-flush', daemon=True).start()
+
+    def _run(self):
+        interval = self.app.config['XL_AUTH_LAST_LOGIN_FLUSH_INTERVAL']
+        while True:
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            self._flush_in_app_context()
+
+    def _flush_at_exit(self):
+        if self.app is not None and self._last_logins:
+            self._flush_in_app_context()
+
+    def _flush_in_app_context(self):
+        with self.app.app_context():
+            try:
+                self.flush()
+            except Exception:  # noqa: B902  # Keep going; later logins are flushed next time.
+                self.app.logger.exception('Writing last login timestamps failed')
+
+
+last_login_buffer = LastLoginBuffer()
@@ -0,0 +1,161 @@
+"""Throttling of failed logins, counted in the ``cache`` rather than the database."""
+
+
+import hashlib
+import os
+import threading
+from queue import Empty, Full, Queue
+from time import time
+
+from flask import current_app
+from flask_caching.backends import MemcachedCache, RedisCache
+
+from .extensions import cache, db
+from .user.models import FailedLoginAttempt
+
+#: Prefix for failed login counters in the ``cache``.
+COUNTER_KEY_PREFIX = 'login_failures:'
+
+#: Cache backends whose atomic increment keeps the timeout set when the counter was added.
+#: Others (e.g. 'SimpleCache') implement it as a get and a set with the default timeout.
+TTL_KEEPING_BACKENDS = (MemcachedCache, RedisCache)
+
+#: Most failed logins waiting to be written to 'failed_login_attempts'; more are dropped.
+AUDIT_QUEUE_SIZE = 10000
+
+
+class LoginThrottle(object):
+    """Sliding-window failed login counters, per username and per remote address.
+
+    Each key uses two fixed-window counters of ``XL_AUTH_FAILED_LOGIN_TIMEFRAME`` seconds, and
+    weighs the previous one by how much of it still overlaps the sliding window. That takes
+    constant memory and two cache reads per check. Counters are bumped with the cache's atomic
+    increment where that keeps their timeout (Redis, memcached), and read and written again
+    under a lock elsewhere. With a per-process backend like the default 'SimpleCache', every worker
+    process counts on its own, so the effective limits are multiplied by the number of workers;
+    use a shared backend (e.g. Redis) for exact limits.
+
+    Failed logins are also written to 'failed_login_attempts' for auditing, depending on
+    ``XL_AUTH_FAILED_LOGIN_AUDIT``: 'async' from a background thread, 'sync' right away, or not
+    at all if empty. Throttling never reads them.
+    """
+
+    def __init__(self, app=None):
+        """Create instance."""
+        self.app = None
+        self._audit_queue = None
+        self._audit_pid = None
+        self._lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Remember app, for the audit thread."""
+        self.app = app
+
+    @staticmethod
+    def _get_keys(kind, value, now=None):
+        """Return (previous, current) counter keys for 'value', and the current window progress."""
+        window = current_app.config['XL_AUTH_FAILED_LOGIN_TIMEFRAME']
+        bucket, progress = divmod(now or time(), window)
+        digest = hashlib.sha256(value.strip().lower().encode('utf-8')).hexdigest()
+        prefix = '{}{}:{}:'.format(COUNTER_KEY_PREFIX, kind, digest)
+        return (prefix + str(int(bucket) - 1), prefix + str(int(bucket))), progress / window
+
+    def _count(self, kind, value, now=None):
+        """Return estimated number of failures for 'value' within the sliding window."""
+        (previous_key, current_key), progress = self._get_keys(kind, value, now)
+        previous, current = cache.get_many(previous_key, current_key)
+        return max(previous or 0, 0) * (1 - progress) + max(current or 0, 0)
+
+    def is_throttled(self, username, remote_addr, now=None):
+        """Check if 'username' or 'remote_addr' has failed logging in too often lately."""
+        config = current_app.config
+        if self._count('username', username, now) >= config['XL_AUTH_FAILED_LOGIN_MAX_ATTEMPTS']:
+            return True
+        max_attempts_per_address = config['XL_AUTH_FAILED_LOGIN_MAX_ATTEMPTS_PER_ADDRESS']
+        return self._count('remote_addr', remote_addr, now) >= max_attempts_per_address
+
+    def record_failure(self, username, remote_addr, now=None):
+        """Count failed login for 'username' from 'remote_addr', and audit it."""
+        timeout = 2 * current_app.config['XL_AUTH_FAILED_LOGIN_TIMEFRAME']
+        for kind, value in (('username', username), ('remote_addr', remote_addr),
+                            ('username_from', self._get_username_from(username, remote_addr))):
+            (_, current_key), _ = self._get_keys(kind, value, now)
+            self._add(current_key, 1, timeout)
+
+        audit = current_app.config['XL_AUTH_FAILED_LOGIN_AUDIT']
+        if audit == 'sync':
+            FailedLoginAttempt(username, remote_addr).save()
+        elif audit == 'async':
+            try:
+                self._get_audit_queue().put_nowait((username, remote_addr))
+            except Full:
+                current_app.logger.warning('Dropped failed login audit record for %r', username)
+
+    def _add(self, key, delta, timeout):
+        """Add 'delta' to counter 'key', which expires 'timeout' seconds after it was created."""
+        backend = cache.cache
+        if isinstance(backend, TTL_KEEPING_BACKENDS):
+            cache.add(key, 0, timeout=timeout)  # So that the counter gets a timeout.
+            if delta > 0:
+                backend.inc(key, delta)  # Not wrapped by Flask-Caching.
+            else:
+                backend.dec(key, -delta)
+        else:
+            with self._counter_lock:
+                cache.set(key, (cache.get(key) or 0) + delta, timeout=timeout)
+
+    @staticmethod
+    def _get_username_from(username, remote_addr):
+        """Return value to count failures for 'username' from 'remote_addr' by."""
+        return '{0} {1}'.format(username.strip(), remote_addr)
+
+    def reset(self, username, remote_addr, now=None):
+        """Forget failures for 'username' from 'remote_addr', e.g. after logging in from there.
+
+        Failures from other addresses keep counting, so that a user logging in doesn't lift
+        throttling caused by someone else guessing their password.
+        """
+        timeout = 2 * current_app.config['XL_AUTH_FAILED_LOGIN_TIMEFRAME']
+        username_keys, _ = self._get_keys('username', username, now)
+        username_from_keys, _ = self._get_keys(
+            'username_from', self._get_username_from(username, remote_addr), now)
+        for username_key, username_from_key in zip(username_keys, username_from_keys):
+            failures = cache.get(username_from_key)
+            if failures:
+                self._add(username_key, -failures, timeout)
+                cache.delete(username_from_key)
+
+    def _get_audit_queue(self):
+        with self._lock:
+            # Threads don't survive forking, e.g. by Gunicorn with 'preload_app'.
+            if self._audit_pid != os.getpid():
+                self._audit_queue = Queue(AUDIT_QUEUE_SIZE)
+                self._audit_pid = os.getpid()
+                threading.Thread(target=self._write_audit_records, args=(self._audit_queue,),
+                                 name='failed-login-audit', daemon=True).start()
+            return self._audit_queue
+
+    def _write_audit_records(self, audit_queue):
+        """Write queued failed logins, everything pending in one transaction."""
+        while True:
+            records = [audit_queue.get()]
+            try:
+                while len(records) < 1000:
+                    records.append(audit_queue.get_nowait())
+            except Empty:
+                pass
+            with self.app.app_context():
+                try:
+                    db.session.add_all(FailedLoginAttempt(username, remote_addr)
+                                       for username, remote_addr in records)
+                    db.session.commit()
+                except Exception:  # noqa: B902  # Auditing must never take down the thread.
+                    self.app.logger.exception('Writing failed login audit records failed')
+                finally:
+                    db.session.remove()
+
+
+login_throttle = LoginThrottle()
@@ -0,0 +1,126 @@
+"""In-process caching of OAuth2 token introspection results."""
+
+
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
+from threading import RLock
+from time import monotonic
+
+from ..collection.models import Collection
+from ..invalidation import on_commit
+from ..permission.models import Permission
+from ..user.models import User
+from .token.models import Token
+
+
+class VerifyCache(object):
+    """Bounded LRU cache of rendered '/oauth/verify' payloads, keyed by access token digest.
+
+    Every worker process holds its own instance. Entries expire after ``XL_AUTH_VERIFY_CACHE_TTL``
+    seconds or when the token itself expires, whichever comes first, and are evicted as soon as
+    a committed write touches the token owner (see 'xl_auth.invalidation'). Writes made in other
+    worker processes, including revoking tokens, are only picked up once the TTL has passed,
+    hence the short default.
+    """
+
+    def __init__(self, app=None):
+        """Create instance."""
+        self.max_size = 0
+        self.ttl = 0
+        self._lock = RLock()
+        self._entries = OrderedDict()
+        self._keys_by_user_id = dict()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure from app settings and start out empty."""
+        self.max_size = app.config['XL_AUTH_VERIFY_CACHE_SIZE']
+        self.ttl = app.config['XL_AUTH_VERIFY_CACHE_TTL']
+        self.clear()
+
+    @property
+    def is_enabled(self):
+        """Return whether caching is switched on."""
+        return self.max_size > 0 and self.ttl > 0
+
+    @staticmethod
+    def make_key(access_token):
+        """Return cache key for 'access_token', so raw tokens are never kept around."""
+        return hashlib.sha256(access_token.encode('utf-8')).hexdigest()
+
+    def get(self, access_token):
+        """Return cached payload for 'access_token', or None."""
+        if not self.is_enabled:
+            return None
+        key = self.make_key(access_token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            deadline, user_id, payload = entry
+            if deadline <= monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def set(self, access_token, user_id, expires_at, payload):
+        """Cache 'payload' for 'access_token', never beyond 'expires_at' (naive UTC)."""
+        if not self.is_enabled:
+            return
+        remaining = (expires_at - datetime.utcnow()).total_seconds()
+        if remaining <= 0:
+            return
+        deadline = monotonic() + min(self.ttl, remaining)
+        key = self.make_key(access_token)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (deadline, user_id, payload)
+            self._keys_by_user_id.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_token(self, access_token):
+        """Drop cached payload for 'access_token'."""
+        with self._lock:
+            self._remove(self.make_key(access_token))
+
+    def invalidate_user(self, user_id):
+        """Drop all cached payloads for tokens owned by 'user_id'."""
+        with self._lock:
+            for key in list(self._keys_by_user_id.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        """Drop everything."""
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user_id.clear()
+
+    def __len__(self):
+        """Return number of cached entries (including not yet purged expired ones)."""
+        return len(self._entries)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            user_keys = self._keys_by_user_id.get(entry[1])
+            if user_keys is not None:
+                user_keys.discard(key)
+                if not user_keys:
+                    del self._keys_by_user_id[entry[1]]
+
+
+verify_cache = VerifyCache()
+
+
+@on_commit({Collection: None, Permission: None, Token: None, User: None})
+def _evict_affected_users(_, changes):
+    """Evict cached payloads for users touched by the committed transaction."""
+    if changes.of(Collection):
+        verify_cache.clear()
+    else:
+        for user_id in changes.user_ids:
+            verify_cache.invalidate_user(user_id)
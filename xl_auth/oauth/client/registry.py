@@ -0,0 +1,136 @@
+"""Process-wide registry of OAuth2 clients, for the token and authorize flows."""
+
+
+from threading import RLock
+from time import monotonic
+
+from ...invalidation import on_commit
+from ...user.models import User
+from .models import Client
+
+
+class ClientRecord(object):
+    """Immutable snapshot of a Client row, with redirect URIs and scopes split up front.
+
+    Implements the parts of the client interface flask-oauthlib relies on, including
+    'validate_redirect_uri' and 'validate_scopes', so no string splitting happens per request.
+    """
+
+    __slots__ = ('client_id', 'client_secret', 'user_id', 'is_confidential', 'name',
+                 'description', 'redirect_uris', 'default_scopes', '_redirect_uri_set',
+                 '_scope_set')
+
+    def __init__(self, client):
+        """Create instance from 'client'."""
+        set_ = super(ClientRecord, self).__setattr__
+        set_('client_id', client.client_id)
+        set_('client_secret', client.client_secret)
+        set_('user_id', client.user_id)
+        set_('is_confidential', client.is_confidential)
+        set_('name', client.name)
+        set_('description', client.description)
+        set_('redirect_uris', tuple(client.redirect_uris))
+        set_('default_scopes', tuple(client.default_scopes))
+        set_('_redirect_uri_set', frozenset(self.redirect_uris))
+        set_('_scope_set', frozenset(self.default_scopes))
+
+    def __setattr__(self, name, value):
+        """Refuse changes; edit the Client row instead."""
+        raise AttributeError('{!r} is read-only'.format(self))
+
+    @property
+    def client_type(self):
+        """Return client type."""
+        return 'confidential' if self.is_confidential else 'public'
+
+    @property
+    def default_redirect_uri(self):
+        """Return default redirect URI."""
+        return self.redirect_uris[0]
+
+    @property
+    def user(self):
+        """Return bound User (for the 'client_credentials' grant), if any."""
+        return User.get_by_id(self.user_id) if self.user_id else None
+
+    def validate_redirect_uri(self, redirect_uri):
+        """Check if 'redirect_uri' is registered for this client."""
+        return redirect_uri in self._redirect_uri_set
+
+    def validate_scopes(self, scopes):
+        """Check if all of 'scopes' are among the client's default scopes."""
+        return self._scope_set.issuperset(scopes)
+
+    def __repr__(self):
+        """Represent instance as a unique string."""
+        return '<ClientRecord({name!r})>'.format(name=self.name)
+
+
+class ClientRegistry(object):
+    """All clients, loaded in one query on first use and kept for ``XL_AUTH_CLIENT_REGISTRY_TTL``.
+
+    Every worker process holds its own instance. Committed Client writes in this process clear
+    it right away (see the commit subscriber below); other processes reload once the TTL has
+    passed. Client IDs not yet known are looked up individually, so newly registered clients
+    work everywhere immediately. Client authentication uses 'load', never a cached record.
+    """
+
+    def __init__(self, app=None):
+        """Create instance."""
+        self.ttl = 0
+        self._lock = RLock()
+        self._records = None
+        self._deadline = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure from app settings and start out empty."""
+        self.ttl = app.config['XL_AUTH_CLIENT_REGISTRY_TTL']
+        self.clear()
+
+    def get(self, client_id):
+        """Return ``ClientRecord`` for 'client_id', or None."""
+        if not client_id:
+            return None
+        with self._lock:
+            if self._records is None or self._deadline <= monotonic():
+                self._records = {client.client_id: ClientRecord(client)
+                                 for client in Client.query.all()}
+                self._deadline = monotonic() + self.ttl
+            record = self._records.get(client_id)
+            if record is None:
+                client = Client.get_by_id(client_id)
+                if client:
+                    record = self._records[client_id] = ClientRecord(client)
+            return record
+
+    def load(self, client_id):
+        """Return ``ClientRecord`` for 'client_id' straight from the database, or None.
+
+        For authenticating clients, where a record up to TTL old could still carry a replaced
+        'client_secret', or belong to a deleted client. Refreshes the registry along the way.
+        """
+        client = Client.get_by_id(client_id) if client_id else None
+        record = ClientRecord(client) if client else None
+        with self._lock:
+            if self._records is not None:
+                if record:
+                    self._records[client_id] = record
+                else:
+                    self._records.pop(client_id, None)
+        return record
+
+    def clear(self):
+        """Drop everything, so the next lookup reloads."""
+        with self._lock:
+            self._records = None
+
+
+client_registry = ClientRegistry()
+
+
+@on_commit({Client: None})
+def _clear_client_registry(*_):
+    """Reload clients on next use if the committed transaction changed any."""
+    client_registry.clear()
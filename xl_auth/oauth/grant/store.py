@@ -0,0 +1,247 @@
+"""Pluggable storage for authorization code grants, selected by ``XL_AUTH_GRANT_STORE``.
+
+'sql' (the default) keeps grants in the 'grants' table. 'cache' keeps them in the configured
+``cache`` with native expiry instead, taking the write load of login bursts off the database;
+it needs a backend shared by all worker processes (e.g. Redis or memcached), as the code is
+usually redeemed by a different process than the one that issued it.
+"""
+
+
+import hashlib
+from datetime import datetime, timedelta
+
+from flask import current_app, request
+from flask_babel import lazy_gettext as _
+from werkzeug.local import LocalProxy
+
+from ...extensions import cache, db, has_shared_cache
+from ...user.models import User
+from ..client.registry import client_registry
+from ..listing import ListPagination, count_listing, paginate_listing
+from .models import Grant
+
+#: Lifetime of authorization codes, same as the 'grants.expires_at' column default.
+GRANT_TTL = 3600
+
+#: Prefix for grant entries in the ``cache``.
+GRANT_KEY_PREFIX = 'oauth_grant:'
+
+#: Key of the ``cache`` entry listing live grants, for the admin pages only.
+GRANT_INDEX_KEY = 'oauth_grant_index'
+
+
+class SQLGrantStore(object):
+    """Grants as rows in the 'grants' table."""
+
+    @staticmethod
+    def set(client_id, code, redirect_uri, scopes, user_id):
+        """Create grant."""
+        return Grant(client_id=client_id, code=code, redirect_uri=redirect_uri, scopes=scopes,
+                     user_id=user_id, expires_at=None).save()
+
+    @staticmethod
+    def get(client_id, code):
+        """Get grant by 'client_id' and 'code'."""
+        return Grant.query.filter_by(client_id=client_id, code=code).first()
+
+    @staticmethod
+    def get_by_id(grant_id):
+        """Get grant by ID."""
+        return Grant.get_by_id(grant_id)
+
+    @staticmethod
+    def get_all():
+        """Get all grants."""
+        return Grant.query.all()
+
+    @staticmethod
+    def get_page(client_id, email, status, page, per_page):
+        """Return (page of grants matching filters, counts per status)."""
+        return (paginate_listing(Grant, client_id, email, status, page, per_page),
+                count_listing(Grant, client_id, email))
+
+    @staticmethod
+    def get_all_by_user(user):
+        """Get all grants for specified user."""
+        return Grant.get_all_by_user(user)
+
+    @staticmethod
+    def delete_all_by_user(user):
+        """Delete all grants for specified user."""
+        Grant.delete_all_by_user(user)
+
+
+class CachedGrant(object):
+    """A grant kept in the ``cache``, quacking like a Grant row."""
+
+    def __init__(self, grant_id, client_id, code, redirect_uri, scopes, user_id, expires_at):
+        """Create instance."""
+        self.id = grant_id
+        self.client_id = client_id
+        self.code = code
+        self.redirect_uri = redirect_uri
+        self.scopes = scopes
+        self.user_id = user_id
+        self.expires_at = expires_at
+
+    @property
+    def user(self):
+        """Return User."""
+        return User.get_by_id(self.user_id)
+
+    @property
+    def client(self):
+        """Return ClientRecord."""
+        return client_registry.get(self.client_id)
+
+    @property
+    def expires(self):
+        """Return 'expires_at'."""
+        return self.expires_at
+
+    @property
+    def display_value(self):
+        """Return one-line description, e.g. for deletion confirmations."""
+        return f"{self.user.email}: {_('Client').lower()} {self.client.name}, " \
+            f"{_('Expires At').lower()} {self.expires_at}"
+
+    def delete(self, commit=True):
+        """Remove grant; it may already have been claimed by 'CacheGrantStore.get'."""
+        CacheGrantStore.delete(self.id)
+
+    def __repr__(self):
+        """Represent instance as a unique string."""
+        return '<CachedGrant({user_id!r},{client_id!r})>'.format(user_id=self.user_id,
+                                                                 client_id=self.client_id)
+
+
+class CacheGrantStore(object):
+    """Grants as ``cache`` entries, expiring on their own and deleted atomically on use.
+
+    The admin pages list grants from an index entry, which is updated without locking and may
+    therefore miss grants issued concurrently; lookups by code never depend on it.
+    """
+
+    @staticmethod
+    def make_id(client_id, code):
+        """Return grant ID for 'client_id' and 'code', so raw codes never end up in keys."""
+        return hashlib.sha256('{} {}'.format(client_id, code).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def set(client_id, code, redirect_uri, scopes, user_id):
+        """Create grant."""
+        entry = dict(grant_id=CacheGrantStore.make_id(client_id, code), client_id=client_id,
+                     code=code, redirect_uri=redirect_uri, scopes=list(scopes), user_id=user_id,
+                     expires_at=datetime.utcnow() + timedelta(seconds=GRANT_TTL))
+        cache.set(GRANT_KEY_PREFIX + entry['grant_id'], entry, timeout=GRANT_TTL)
+        grant = CachedGrant(**entry)
+        index = CacheGrantStore._get_index()
+        index[grant.id] = (user_id, grant.expires_at)
+        cache.set(GRANT_INDEX_KEY, index, timeout=GRANT_TTL)
+        return grant
+
+    @staticmethod
+    def get(client_id, code):
+        """Get grant by 'client_id' and 'code', claiming it so that it can only be redeemed once.
+
+        The token endpoint looks the grant up several times per request, hence the claimed
+        grant is remembered for the rest of the request.
+        """
+        grant_id = CacheGrantStore.make_id(client_id, code)
+        claimed = request.environ.setdefault('xl_auth.claimed_grants', dict())
+        if grant_id not in claimed:
+            grant = CacheGrantStore.get_by_id(grant_id)
+            # Only one request gets to delete the entry.
+            if grant and grant.code == code and CacheGrantStore.delete(grant_id):
+                claimed[grant_id] = grant
+            else:
+                return None
+        return claimed[grant_id]
+
+    @staticmethod
+    def get_by_id(grant_id):
+        """Get grant by ID."""
+        grant = cache.get(GRANT_KEY_PREFIX + grant_id)
+        return CachedGrant(**grant) if grant else None
+
+    @staticmethod
+    def get_all():
+        """Get all live grants."""
+        index = CacheGrantStore._get_index()
+        grants = cache.get_many(*(GRANT_KEY_PREFIX + grant_id for grant_id in index))
+        return [CachedGrant(**grant) for grant in grants if grant]
+
+    @staticmethod
+    def get_page(client_id, email, status, page, per_page):
+        """Return (page of live grants matching filters, counts per status).
+
+        Grants are filtered and sorted in memory, there being no more of them than were issued
+        within 'GRANT_TTL'; only users on the returned page are loaded, in one query.
+        """
+        grants = CacheGrantStore.get_all()
+        if client_id:
+            grants = [grant for grant in grants if grant.client_id == client_id]
+        if email:
+            user_ids = {user_id for user_id, in db.session.query(User.id).filter(
+                User.normalized_email.startswith(User.normalize_email(email), autoescape=True))}
+            grants = [grant for grant in grants if grant.user_id in user_ids]
+        counts = {'': len(grants), 'active': len(grants), 'expired': 0}
+        if status == 'expired':
+            grants = []
+        grants.sort(key=lambda grant: grant.expires_at, reverse=True)
+        pagination = ListPagination(page=page, per_page=per_page, max_per_page=None,
+                                    error_out=False, items=grants)
+        # Load this page's users into the identity map, for 'CachedGrant.user'.
+        User.query.filter(User.id.in_({grant.user_id for grant in pagination.items})).all()
+        return pagination, counts
+
+    @staticmethod
+    def get_all_by_user(user):
+        """Get all live grants for specified user."""
+        return sorted((grant for grant in CacheGrantStore.get_all() if grant.user_id == user.id),
+                      key=lambda grant: grant.expires_at, reverse=True)
+
+    @staticmethod
+    def delete_all_by_user(user):
+        """Delete all grants for specified user."""
+        for grant in CacheGrantStore.get_all_by_user(user):
+            CacheGrantStore.delete(grant.id)
+
+    @staticmethod
+    def delete(grant_id):
+        """Delete grant, returning whether it was still there."""
+        deleted = cache.delete(GRANT_KEY_PREFIX + grant_id)
+        index = CacheGrantStore._get_index()
+        if index.pop(grant_id, None):
+            cache.set(GRANT_INDEX_KEY, index, timeout=GRANT_TTL)
+        return bool(deleted)
+
+    @staticmethod
+    def _get_index():
+        """Return mapping of live grant IDs to (user ID, expiry), pruning expired ones."""
+        now = datetime.utcnow()
+        return {grant_id: (user_id, expires_at)
+                for grant_id, (user_id, expires_at) in (cache.get(GRANT_INDEX_KEY) or {}).items()
+                if expires_at > now}
+
+
+GRANT_STORES = {'sql': SQLGrantStore, 'cache': CacheGrantStore}
+
+
+def check_grant_store(app):
+    """Refuse keeping grants in a cache that other worker processes can't read.
+
+    With e.g. the default 'SimpleCache', a code issued by one process would be unknown to the
+    process the client happens to redeem it at.
+    """
+    if app.config['XL_AUTH_GRANT_STORE'] == 'cache' and not has_shared_cache(app):
+        raise RuntimeError('XL_AUTH_GRANT_STORE="cache" requires a shared CACHE_TYPE, '
+                           'e.g. "RedisCache", for codes to be redeemable at all worker processes')
+
+
+def get_grant_store():
+    """Return grant store selected by ``XL_AUTH_GRANT_STORE``."""
+    return GRANT_STORES[current_app.config['XL_AUTH_GRANT_STORE']]
+
+
+grant_store = LocalProxy(get_grant_store)
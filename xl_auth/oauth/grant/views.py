@@ -1,11 +1,13 @@
 """OAuth Grant views."""
 
 
-from flask import Blueprint, abort, flash, redirect, render_template, url_for
+from flask import Blueprint, abort, flash, redirect, url_for
 from flask_babel import lazy_gettext as _
 from flask_login import current_user, login_required
 
-from .models import Grant
+from ...utils import get_page_args, stream_template
+from ..listing import get_listing_clients, get_listing_filters
+from .store import grant_store
 
 blueprint = Blueprint('oauth_grant', __name__, url_prefix='/oauth/grants',
                       static_folder='../../static')
@@ -14,23 +16,27 @@ blueprint = Blueprint('oauth_grant', __name__, url_prefix='/oauth/grants',
 @blueprint.route('/')
 @login_required
 def home():
-    """Grant landing page."""
+    """Grant landing page, paginated and filterable by 'client', 'user' and 'status'."""
     if not current_user.is_admin:
         abort(403)
 
-    grants = Grant.query.all()
+    client_id, email, status = get_listing_filters()
+    page, per_page = get_page_args()
+    pagination, counts = grant_store.get_page(client_id, email, status, page, per_page)
 
-    return render_template('oauth/grants/home.html', grants=grants)
+    return stream_template('oauth/grants/home.html', pagination=pagination, counts=counts,
+                           clients=get_listing_clients(), client_id=client_id, email=email,
+                           status=status)
 
 
-@blueprint.route('/delete/<int:grant_id>', methods=['GET', 'DELETE'])
+@blueprint.route('/delete/<string:grant_id>', methods=['GET', 'DELETE'])
 @login_required
 def delete(grant_id):
     """Delete grant."""
     if not current_user.is_admin:
         abort(403)
 
-    grant = Grant.get_by_id(grant_id)
+    grant = grant_store.get_by_id(grant_id)
     if not grant:
         abort(404)
     else:
@@ -0,0 +1,74 @@
+"""Paginated, filterable admin listings of tokens and grants."""
+
+
+from datetime import datetime
+
+from flask import request
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import case, func
+from sqlalchemy.orm import contains_eager, joinedload
+
+from ..extensions import db
+from ..user.models import User
+from .client.models import Client
+
+#: Listing filters on expiry, by 'status' query argument.
+LISTING_STATUSES = ('active', 'expired')
+
+
+def get_listing_filters():
+    """Return ('client', 'user' email prefix, 'status') filters from query string."""
+    status = request.args.get('status', '')
+    return (request.args.get('client', ''), request.args.get('user', '').strip(),
+            status if status in LISTING_STATUSES else '')
+
+
+def get_listing_clients():
+    """Return (client ID, name) pairs for the client filter, without loading Client rows."""
+    return db.session.query(Client.client_id, Client.name).order_by(Client.name).all()
+
+
+def filter_listing(query, model, client_id='', email='', status=''):
+    """Apply listing filters to 'query' on 'model', which must join 'model.user'."""
+    if client_id:
+        query = query.filter(model.client_id == client_id)
+    if email:
+        query = query.filter(User.normalized_email.startswith(User.normalize_email(email),
+                                                              autoescape=True))
+    if status == 'active':
+        query = query.filter(model.expires_at > datetime.utcnow())
+    elif status == 'expired':
+        query = query.filter(model.expires_at <= datetime.utcnow())
+    return query
+
+
+def paginate_listing(model, client_id, email, status, page, per_page):
+    """Return page of 'model' rows, newest first, with 'user' and 'client' loaded alongside."""
+    query = filter_listing(model.query.join(model.user).options(
+        contains_eager(model.user).lazyload(User.permissions), joinedload(model.client)),
+        model, client_id, email, status)
+    return (query.order_by(model.id.desc())
+            .paginate(page=page, per_page=per_page, error_out=False))
+
+
+def count_listing(model, client_id, email):
+    """Return number of 'model' rows per 'status' filter, in one query."""
+    is_active = model.expires_at > datetime.utcnow()
+    query = filter_listing(db.session.query(func.count(model.id),
+                                            func.sum(case((is_active, 1), else_=0)))
+                           .select_from(model).join(model.user), model, client_id, email)
+    total, active = query.one()
+    return {'': total, 'active': active or 0, 'expired': total - (active or 0)}
+
+
+class ListPagination(Pagination):
+    """Pagination over an in-memory list, for stores that can't be queried with SQL."""
+
+    def _query_items(self):
+        """Return the current page of 'items'."""
+        items = self._query_args['items']
+        return items[(self.page - 1) * self.per_page:self.page * self.per_page]
+
+    def _query_count(self):
+        """Return number of 'items'."""
+        return len(self._query_args['items'])
@@ -0,0 +1,83 @@
+"""Issuing and revoking signed access tokens, when ``XL_AUTH_SIGNED_ACCESS_TOKENS`` is set.
+
+Signed tokens are still stored in the 'tokens' table, for refreshing and administration, but
+'tokengetter' validates them from their signature alone. Tokens deleted or replaced before they
+expire are put on a revocation list in the configured ``cache``, once the deletion is
+committed. That list must be visible to every worker process, so the app refuses to start with
+signed tokens and a per-process ``CACHE_TYPE`` (e.g. 'SimpleCache'); use Redis or memcached.
+"""
+
+
+from time import time
+
+from flask import current_app
+from oauthlib.common import generate_token
+
+from ..extensions import cache, has_shared_cache
+from ..offline_verification import (InvalidAccessTokenError, compact_permissions, dump_access_token,
+                                    is_signed_access_token, load_access_token, load_claims)
+from ..permission.models import AuthorizationDocument
+
+#: Length of 'tokens.access_token'; longer signed tokens fall back to opaque ones.
+ACCESS_TOKEN_MAX_LENGTH = 2048
+
+#: Prefix for revocation list entries in the ``cache``.
+REVOCATION_KEY_PREFIX = 'revoked_access_token:'
+
+
+def check_revocation_list(app):
+    """Refuse signed access tokens if revocations wouldn't reach other worker processes."""
+    if app.config['XL_AUTH_SIGNED_ACCESS_TOKENS'] and not has_shared_cache(app):
+        raise RuntimeError('XL_AUTH_SIGNED_ACCESS_TOKENS requires a shared CACHE_TYPE, '
+                           'e.g. "RedisCache", for revoking tokens across worker processes')
+
+
+def get_signing_key():
+    """Return key for signing access tokens; prefer a dedicated one over 'SECRET_KEY'."""
+    config = current_app.config
+    return config['XL_AUTH_SIGNED_ACCESS_TOKEN_KEY'] or config['SECRET_KEY']
+
+
+def generate_access_token(request):
+    """Create access token for oauthlib 'request', see ``OAUTH2_PROVIDER_TOKEN_GENERATOR``."""
+    if not current_app.config['XL_AUTH_SIGNED_ACCESS_TOKENS']:
+        return generate_token()
+    if not (request.user and request.client):
+        return generate_token()
+
+    document = AuthorizationDocument.get_by_user_id(request.user.id).document
+    access_token = dump_access_token({
+        'jti': generate_token(16),
+        'sub': request.user.id,
+        'cid': request.client.client_id,
+        'scp': list(request.scopes),
+        'exp': int(time()) + request.expires_in,
+        'prm': compact_permissions(document['permissions'])
+    }, get_signing_key())
+    if len(access_token) > ACCESS_TOKEN_MAX_LENGTH:
+        return generate_token()
+    return access_token
+
+
+def is_revoked(claims):
+    """Check if token with 'claims' is on the revocation list."""
+    return bool(cache.get(REVOCATION_KEY_PREFIX + claims['jti']))
+
+
+def load_signed_access_token(access_token):
+    """Return claims for signed 'access_token', leaving expiry and scopes to the caller."""
+    return load_claims(access_token, get_signing_key(), is_revoked=is_revoked)
+
+
+def revoke_access_token(access_token):
+    """Put signed 'access_token' on the revocation list until it expires; ignore opaque ones."""
+    if not is_signed_access_token(access_token):
+        return
+    try:
+        claims = load_access_token(access_token, get_signing_key())
+    except InvalidAccessTokenError:
+        return  # Already unusable.
+    if claims['exp'] < time():
+        return  # Already expired, e.g. when purged.
+    cache.set(REVOCATION_KEY_PREFIX + claims['jti'], True,
+              timeout=int(claims['exp'] - time()) + 1)
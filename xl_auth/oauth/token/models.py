@@ -6,8 +6,13 @@ from datetime import datetime, timedelta
 from six import string_types
 from sqlalchemy import desc
 from sqlalchemy.ext.hybrid import hybrid_property
+from werkzeug.local import LocalProxy
 
 from ...database import Column, Model, SurrogatePK, db, reference_col, relationship
+from ...invalidation import on_commit
+from ...user.models import User
+from ..client.registry import client_registry
+from ..signed_tokens import ACCESS_TOKEN_MAX_LENGTH, revoke_access_token
 
 from flask_babel import lazy_gettext as _
 
@@ -24,7 +29,7 @@ class Token(SurrogatePK, Model):
 
     token_type = Column(db.String(40), nullable=False, default='Bearer')
 
-    access_token = Column(db.String(256), nullable=False, unique=True)
+    access_token = Column(db.String(ACCESS_TOKEN_MAX_LENGTH), nullable=False, unique=True)
     refresh_token = Column(db.String(256), unique=True)
 
     expires_at = Column(db.DateTime, nullable=False,
@@ -80,3 +85,44 @@ class Token(SurrogatePK, Model):
         """Represent instance as a unique string."""
         return '<Token({user!r},{client!r})>'.format(user=self.user.email,
                                                      client=self.client.name)
+
+
+@on_commit({Token: ('access_token',)})
+def _revoke_replaced_access_tokens(_, changes):
+    """Revoke signed access tokens of Tokens refreshed or deleted, once that is committed."""
+    for change in changes:
+        if 'access_token' in change.old_values:
+            revoke_access_token(change.old_values['access_token'])
+
+
+class SignedToken(object):
+    """A verified signed access token, standing in for its Token row without loading it."""
+
+    def __init__(self, access_token, claims):
+        """Create instance."""
+        self.access_token = access_token
+        self.user_id = claims['sub']
+        self.client_id = claims['cid']
+        self.scopes = claims['scp']
+        self.expires_at = datetime.utcfromtimestamp(claims['exp'])
+        # Only hit the database if someone actually looks at these.
+        self.user = LocalProxy(lambda: User.get_by_id(self.user_id))
+        self.client = LocalProxy(lambda: client_registry.get(self.client_id))
+
+    @property
+    def expires(self):
+        """Return 'expires_at'."""
+        return self.expires_at
+
+    def delete(self, commit=True):
+        """Remove the Token row, which revokes the token once committed, or just revoke it."""
+        token = Token.query.filter_by(access_token=self.access_token).first()
+        if token:
+            token.delete(commit=commit)
+        else:
+            revoke_access_token(self.access_token)
+
+    def __repr__(self):
+        """Represent instance as a unique string."""
+        return '<SignedToken({user_id!r},{client_id!r})>'.format(user_id=self.user_id,
+                                                                 client_id=self.client_id)
@@ -1,10 +1,12 @@
 """OAuth Token views."""
 
 
-from flask import Blueprint, abort, flash, redirect, render_template, url_for
+from flask import Blueprint, abort, flash, redirect, url_for
 from flask_babel import lazy_gettext as _
 from flask_login import current_user, login_required
 
+from ...utils import get_page_args, stream_template
+from ..listing import count_listing, get_listing_clients, get_listing_filters, paginate_listing
 from .models import Token
 
 blueprint = Blueprint('oauth_token', __name__, url_prefix='/oauth/tokens',
@@ -14,13 +16,18 @@ blueprint = Blueprint('oauth_token', __name__, url_prefix='/oauth/tokens',
 @blueprint.route('/')
 @login_required
 def home():
-    """Token landing page."""
+    """Token landing page, paginated and filterable by 'client', 'user' and 'status'."""
     if not current_user.is_admin:
         abort(403)
 
-    tokens = Token.query.all()
+    client_id, email, status = get_listing_filters()
+    page, per_page = get_page_args()
+    pagination = paginate_listing(Token, client_id, email, status, page, per_page)
 
-    return render_template('oauth/tokens/home.html', tokens=tokens)
+    return stream_template('oauth/tokens/home.html', pagination=pagination,
+                           counts=count_listing(Token, client_id, email),
+                           clients=get_listing_clients(), client_id=client_id, email=email,
+                           status=status)
 
 
 @blueprint.route('/delete/<int:token_id>', methods=['GET', 'DELETE'])
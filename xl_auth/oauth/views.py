@@ -1,46 +1,69 @@
 """OAuth2 views."""
 
 
+import hashlib
+from collections import namedtuple
 from datetime import datetime, timedelta
+from functools import wraps
 
 from flask import Blueprint, current_app, jsonify, render_template, request, session
 from flask_login import current_user, login_required
 from oauthlib.oauth2 import OAuth2Error
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
 
-from ..extensions import csrf_protect, oauth_provider
+from ..extensions import csrf_protect, db, oauth_provider
+from ..offline_verification import InvalidAccessTokenError, is_signed_access_token
+from ..permission.models import AuthorizationDocument
 from ..user.models import User
-from .client.models import Client
+from .cache import verify_cache
+from .client.registry import client_registry
 from .forms import AuthorizeForm
-from .grant.models import Grant
-from .token.models import Token
+from .grant.store import grant_store
+from .signed_tokens import load_signed_access_token
+from .token.models import SignedToken, Token
 
 blueprint = Blueprint('oauth', __name__, url_prefix='/oauth', static_folder='../static')
 
+#: Scopes accepted by '/oauth/verify' and '/oauth/verify/batch'; any one of them will do.
+VERIFY_SCOPES = ('read', 'write')
+
+
+#: Endpoints authenticating clients, which must see secret changes and deletions right away.
+CLIENT_AUTHENTICATION_ENDPOINTS = ('oauth.create_access_token', 'oauth.revoke_access_token')
+
 
 @oauth_provider.clientgetter
 def get_client(client_id):
-    """Return Client object."""
-    return Client.get_by_id(client_id)
+    """Return ClientRecord object, fresh from the database when authenticating the client.
+
+    flask-oauthlib asks several times per token request, so what was loaded is remembered for
+    the rest of the request.
+    """
+    if request.endpoint in CLIENT_AUTHENTICATION_ENDPOINTS:
+        loaded = request.environ.setdefault('xl_auth.loaded_clients', dict())
+        if client_id not in loaded:
+            loaded[client_id] = client_registry.load(client_id)
+        return loaded[client_id]
+    return client_registry.get(client_id)
 
 
 @oauth_provider.grantsetter
 def set_grant(client_id, code, request_, **_):
     """Create Grant object."""
-    expires_at = None
-    return Grant(
+    return grant_store.set(
         client_id=client_id,
         code=code['code'],
         redirect_uri=request_.redirect_uri,
         scopes=request_.scopes,
-        user_id=current_user.id,
-        expires_at=expires_at
-    ).save()
+        user_id=current_user.id
+    )
 
 
 @oauth_provider.grantgetter
 def get_grant(client_id, code):
     """Return Grant object."""
-    return Grant.query.filter_by(client_id=client_id, code=code).first()
+    return grant_store.get(client_id, code)
 
 
 @oauth_provider.tokensetter
@@ -65,6 +88,14 @@ def set_token(new_token, request_, **_):
             # TODO: this should ideally happen before the call to set_token.
             raise OAuth2Error(status_code=400, description='No user bound to client')
 
+        live_token = _get_reusable_token(request_.client.client_id, user_id, new_token['scope'])
+        if live_token:
+            # Response is rendered from 'new_token' after this, so swap in the existing one.
+            new_token['access_token'] = live_token.access_token
+            new_token['expires_in'] = \
+                int((live_token.expires_at - datetime.utcnow()).total_seconds())
+            return live_token
+
         token = Token(
             access_token=new_token['access_token'],
             refresh_token=new_token.get('refresh_token', None),
@@ -88,6 +119,18 @@ def set_token(new_token, request_, **_):
     return token.save()
 
 
+def _get_reusable_token(client_id, user_id, scope):
+    """Return live client_credentials token to hand out again, if reuse is enabled."""
+    min_lifetime = current_app.config['XL_AUTH_CLIENT_CREDENTIALS_TOKEN_REUSE_MIN_LIFETIME']
+    if not min_lifetime:
+        return None
+    return Token.query.filter(
+        Token.client_id == client_id, Token.user_id == user_id, Token._scopes == scope,
+        Token.refresh_token.is_(None),
+        Token.expires_at > datetime.utcnow() + timedelta(seconds=min_lifetime)
+    ).order_by(Token.expires_at.desc()).first()
+
+
 def _get_user_id(request_):
     if request_.user and request_.user.id:
         return request_.user.id
@@ -100,10 +143,18 @@ def _get_user_id(request_):
 @oauth_provider.tokengetter
 def get_token(access_token=None, refresh_token=None):
     """Return Token object."""
+    if access_token and is_signed_access_token(access_token):
+        try:
+            return SignedToken(access_token, load_signed_access_token(access_token))
+        except InvalidAccessTokenError:
+            return None
+
+    # Token validation only needs the user row; permissions are loaded on demand.
+    query = Token.query.options(joinedload(Token.user).lazyload(User.permissions))
     if access_token:
-        return Token.query.filter_by(access_token=access_token).first()
+        return query.filter_by(access_token=access_token).first()
     if refresh_token:
-        return Token.query.filter_by(refresh_token=refresh_token).first()
+        return query.filter_by(refresh_token=refresh_token).first()
     return None
 
 
@@ -121,8 +172,7 @@ def authorize(*_, **kwargs):
     authorize_form = AuthorizeForm(request.form)
     if request.method == 'GET':
         client_id = kwargs.get('client_id')
-        client = Client.query.filter_by(client_id=client_id).first()
-        kwargs['client'] = client
+        kwargs['client'] = client_registry.get(client_id)
         has_authorized_scopes = session.get('has_authorized_scopes', False)
         if has_authorized_scopes:
             return True
@@ -144,30 +194,186 @@ def create_access_token():
     return {'app_version': current_app.config['APP_VERSION']}
 
 
+def _get_bearer_token():
+    """Return access token from 'Authorization: Bearer ...' header or 'access_token', if any.
+
+    The 'access_token' query string or form parameter is accepted as a fallback, like
+    flask-oauthlib's 'require_oauth' did.
+    """
+    auth_type, _, access_token = request.headers.get('Authorization', '').partition(' ')
+    if auth_type.lower() == 'bearer' and access_token:
+        return access_token.strip()
+    return request.values.get('access_token')
+
+
+def _verify_cached(view):
+    """Answer straight from the verify cache when a still valid payload is available."""
+    @wraps(view)
+    def decorated(*args, **kwargs):
+        access_token = _get_bearer_token()
+        cached = access_token and verify_cache.get(access_token)
+        if cached:
+            email, expires_at, etag, body = cached
+            response = current_app.response_class(body, mimetype='application/json')
+            response.headers['X-Username'] = email
+            return _make_conditional(response, etag, expires_at)
+        return view(*args, **kwargs)
+    return decorated
+
+
+def _get_verify_etag(access_token, expires_at, modified_at):
+    """Return strong ETag for a verify response, changing whenever its body would."""
+    parts = (current_app.config['APP_VERSION'], access_token, expires_at.isoformat(),
+             modified_at.isoformat())
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _make_conditional(response, etag, expires_at):
+    """Tag 'response', let clients cache it until the token expires, and honor If-None-Match."""
+    remaining = (expires_at - datetime.utcnow()).total_seconds()
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = \
+        max(0, min(current_app.config['XL_AUTH_VERIFY_MAX_AGE'], int(remaining)))
+    return response.make_conditional(request)
+
+
+VerifyResult = namedtuple('VerifyResult',
+                          ['message', 'expires_at', 'user_document', 'modified_at'])
+
+
+def _get_verify_results(access_tokens):
+    """Return mapping of each of 'access_tokens' to a ``VerifyResult``, without ORM objects.
+
+    Opaque tokens and their users' authorization documents come from a single statement. Signed
+    tokens are validated from their signature, so only their documents need fetching. Validation
+    and error messages match flask-oauthlib's 'validate_bearer_token'.
+    """
+    tokens, documents = Token.__table__, AuthorizationDocument.__table__
+    found, messages, user_documents = dict(), dict(), dict()
+
+    opaque_access_tokens = set()
+    for access_token in access_tokens:
+        if is_signed_access_token(access_token):
+            try:
+                claims = load_signed_access_token(access_token)
+            except InvalidAccessTokenError as err:
+                messages[access_token] = str(err)
+            else:
+                found[access_token] = (datetime.utcfromtimestamp(claims['exp']), claims['scp'],
+                                       claims['sub'])
+        else:
+            opaque_access_tokens.add(access_token)
+
+    if opaque_access_tokens:
+        for row in db.session.execute(
+                select(tokens.c.access_token, tokens.c.expires_at, tokens.c._scopes,
+                       tokens.c.user_id, documents.c.document, documents.c.modified_at)
+                .select_from(tokens.outerjoin(documents, documents.c.user_id == tokens.c.user_id))
+                .where(tokens.c.access_token.in_(opaque_access_tokens))):
+            found[row.access_token] = (row.expires_at, row._scopes.split(' '), row.user_id)
+            if row.document is not None:
+                user_documents[row.user_id] = (row.document, row.modified_at)
+
+    def select_documents(user_ids):
+        return {row.user_id: (row.document, row.modified_at) for row in db.session.execute(
+            select(documents.c.user_id, documents.c.document, documents.c.modified_at)
+            .where(documents.c.user_id.in_(user_ids)))}
+
+    missing_user_ids = {user_id for _, _, user_id in found.values()} - set(user_documents)
+    if missing_user_ids:
+        user_documents.update(select_documents(missing_user_ids))
+        missing_user_ids -= set(user_documents)
+    if missing_user_ids:
+        # Not stored (yet); built in one go without writing, like 'get_by_user_id' does.
+        now = datetime.utcnow()
+        user_documents.update((user_id, (document, now)) for user_id, document in
+                              AuthorizationDocument.build(db.session.connection(),
+                                                          missing_user_ids).items())
+
+    now = datetime.utcnow()
+    results = dict()
+    for access_token in access_tokens:
+        expires_at, scopes, user_id = found.get(access_token, (None, None, None))
+        if access_token in messages:
+            message = messages[access_token]
+        elif not expires_at:
+            message = 'Bearer token not found.'
+        elif now > expires_at:
+            message = 'Bearer token is expired.'
+        elif not set(scopes) & set(VERIFY_SCOPES):
+            message = 'Bearer token scope not valid.'
+        elif user_id not in user_documents:
+            message = 'Bearer token not found.'  # User deleted since, e.g. signed tokens.
+        else:
+            results[access_token] = VerifyResult(None, expires_at, *user_documents[user_id])
+            continue
+        results[access_token] = VerifyResult(message, None, None, None)
+    return results
+
+
+def _get_verify_payload(expires_at, user_document):
+    """Return '/oauth/verify' response details for a valid token."""
+    return {'expires_at': expires_at.isoformat() + 'Z', 'user': user_document}
+
+
 @blueprint.route('/verify', methods=['GET'])
-@oauth_provider.require_oauth('read', 'write')
+@_verify_cached
 def verify():
-    """Verify access token is valid and return a bunch of user details."""
-    # noinspection PyUnresolvedReferences
-    oauth = request.oauth
-    assert isinstance(oauth.user, User)
-
-    return jsonify(
+    """Verify access token is valid and return a bunch of user details.
+
+    Responses carry a strong ETag and 'Cache-Control: private, max-age=...' (never beyond the
+    token's expiry), so resource servers can revalidate with 'If-None-Match' and get a 304.
+    """
+    access_token = _get_bearer_token()
+    if not access_token:
+        return jsonify(app_version=current_app.config['APP_VERSION'],
+                       message='Bearer token not found.'), 401
+
+    result = _get_verify_results([access_token])[access_token]
+    if result.message:
+        return jsonify(app_version=current_app.config['APP_VERSION'],
+                       message=result.message), 401
+
+    email = result.user_document['email']
+    etag = _get_verify_etag(access_token, result.expires_at, result.modified_at)
+    if request.if_none_match.contains(etag):
+        # Unchanged since the client last asked; skip serializing altogether.
+        response = current_app.response_class()
+        response.headers['X-Username'] = email
+        return _make_conditional(response, etag, result.expires_at)
+
+    response = jsonify(
         app_version=current_app.config['APP_VERSION'],
-        expires_at=oauth.access_token.expires_at.isoformat() + 'Z',
-        user={
-            'full_name': oauth.user.full_name,
-            'email': oauth.user.email,
-            'id': oauth.user.id,
-            'permissions': [{'code': permission.collection.code,
-                             'friendly_name': permission.collection.friendly_name,
-                             'cataloger': permission.cataloger,
-                             'registrant': permission.registrant,
-                             'global_registrant': permission.global_registrant}
-                            for permission in oauth.user.permissions
-                            if permission.collection.is_active]
-        }
+        **_get_verify_payload(result.expires_at, result.user_document)
     )
+    response.headers['X-Username'] = email
+    verify_cache.set(access_token, result.user_document['id'], result.expires_at,
+                     (email, result.expires_at, etag, response.get_data()))
+    return _make_conditional(response, etag, result.expires_at)
+
+
+@csrf_protect.exempt
+@blueprint.route('/verify/batch', methods=['POST'])
+def verify_batch():
+    """Verify a list of access tokens at once, returning one result per token, in order."""
+    access_tokens = (request.get_json(silent=True) or {}).get('access_tokens')
+    if not isinstance(access_tokens, list) or \
+            not all(isinstance(access_token, str) for access_token in access_tokens):
+        return jsonify(app_version=current_app.config['APP_VERSION'],
+                       message='Expected JSON object with an "access_tokens" list.'), 400
+    max_tokens = current_app.config['XL_AUTH_VERIFY_BATCH_MAX_TOKENS']
+    if len(access_tokens) > max_tokens:
+        return jsonify(app_version=current_app.config['APP_VERSION'],
+                       message='At most {} access tokens per request.'.format(max_tokens)), 400
+
+    results = _get_verify_results(access_tokens)
+    return jsonify(app_version=current_app.config['APP_VERSION'],
+                   results=[{'message': results[access_token].message}
+                            if results[access_token].message else
+                            _get_verify_payload(results[access_token].expires_at,
+                                                results[access_token].user_document)
+                            for access_token in access_tokens])
 
 
 @blueprint.route('/revoke', methods=['POST'])
@@ -0,0 +1,91 @@
+"""Self-contained, HMAC-signed access tokens that resource servers can verify offline.
+
+This module only depends on ``itsdangerous``, so resource servers sharing the signing key
+(``XL_AUTH_SIGNED_ACCESS_TOKEN_KEY``) can import it without pulling in the rest of xl_auth::
+
+    from xl_auth.offline_verification import (InvalidAccessTokenError, expand_permissions,
+                                              load_access_token)
+
+    try:
+        claims = load_access_token(access_token, key, scopes=('read', 'write'))
+    except InvalidAccessTokenError as err:
+        abort(401, str(err))
+    user_id, permissions = claims['sub'], expand_permissions(claims)
+
+Claims reflect the user's permissions at the time the token was issued. Tokens revoked early
+are only rejected if the caller passes an ``is_revoked`` callback backed by the same revocation
+list as xl_auth (see ``xl_auth.oauth.signed_tokens``, which issues the tokens).
+"""
+
+
+from time import time
+
+from itsdangerous import BadSignature, URLSafeSerializer
+
+#: Namespaces signatures, so that other data signed with the same key is never accepted.
+SALT = 'xl_auth.access_token'
+
+#: Bit flags used for the compact permission summary in the 'prm' claim.
+PERMISSION_FLAGS = (('registrant', 1), ('cataloger', 2), ('global_registrant', 4))
+
+
+class InvalidAccessTokenError(Exception):
+    """Access token can't be used; message mirrors what '/oauth/verify' responds with."""
+
+
+def is_signed_access_token(access_token):
+    """Tell signed tokens apart from opaque ones, which are strictly alphanumeric."""
+    return '.' in access_token
+
+
+def compact_permissions(permissions):
+    """Return 'prm' claim for a list of '/oauth/verify' style permission dicts."""
+    return [[permission['code'], sum(flag for name, flag in PERMISSION_FLAGS if permission[name])]
+            for permission in permissions]
+
+
+def expand_permissions(claims):
+    """Return list of permission dicts (sans 'friendly_name') from the 'prm' claim."""
+    permissions = []
+    for code, flags in claims.get('prm', []):
+        permission = {'code': code}
+        for name, flag in PERMISSION_FLAGS:
+            permission[name] = bool(flags & flag)
+        permissions.append(permission)
+    return permissions
+
+
+def dump_access_token(claims, key):
+    """Sign 'claims' and return them as a URL-safe access token string."""
+    return URLSafeSerializer(key, salt=SALT).dumps(claims)
+
+
+def load_claims(access_token, key, is_revoked=None):
+    """Return claims of 'access_token' after checking signature and revocation only.
+
+    :param is_revoked: Optional callable taking the claims, returning True for revoked tokens.
+    :raises InvalidAccessTokenError: If the token is forged or revoked.
+    """
+    try:
+        claims = URLSafeSerializer(key, salt=SALT).loads(access_token)
+    except BadSignature:
+        raise InvalidAccessTokenError('Bearer token not found.')
+    if is_revoked and is_revoked(claims):
+        raise InvalidAccessTokenError('Bearer token not found.')
+    return claims
+
+
+def load_access_token(access_token, key, scopes=None, is_revoked=None, now=None):
+    """Verify 'access_token' and return its claims.
+
+    :param scopes: If given, the token must carry at least one of these.
+    :param is_revoked: Optional callable taking the claims, returning True for revoked tokens.
+    :param now: Current UNIX time, for testing.
+    :raises InvalidAccessTokenError: If the token is forged, expired, out of scope or revoked.
+    """
+    claims = load_claims(access_token, key, is_revoked=is_revoked)
+    if (now or time()) > claims['exp']:
+        raise InvalidAccessTokenError('Bearer token is expired.')
+    if scopes and not set(claims['scp']) & set(scopes):
+        raise InvalidAccessTokenError('Bearer token scope not valid.')
+    return claims
@@ -3,7 +3,16 @@
 
 from datetime import datetime
 
+from sqlalchemy import and_, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from ..collection.models import Collection
 from ..database import Column, Model, SurrogatePK, db, or_, reference_col, relationship
+from ..invalidation import on_flush
+from ..user.models import User, drop_authorization_index
+
+#: 'INSERT ... ON CONFLICT' constructs, for databases that have it.
+_DIALECT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
 
 
 class Permission(SurrogatePK, Model):
@@ -54,3 +63,129 @@ class Permission(SurrogatePK, Model):
         """Represent instance as a unique string."""
         return '<Permission({user!r}@{collection!r})>'.format(user=self.user,
                                                               collection=self.collection)
+
+
+class AuthorizationDocument(Model):
+    """Precomputed '/oauth/verify' user details, one row per user.
+
+    Kept up to date by the flush subscriber below whenever a User, Permission or Collection
+    write is flushed, so that verify reads a single row instead of walking the permission graph.
+    """
+
+    __tablename__ = 'authorization_documents'
+    user_id = reference_col('users', primary_key=True, ondelete='CASCADE')
+    document = Column(db.JSON, nullable=False)
+
+    modified_at = Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow,
+                         nullable=False)
+
+    @staticmethod
+    def get_by_user_id(user_id):
+        """Get document for 'user_id', or build an unsaved one if missing; None for no user.
+
+        Never writes, so it's safe to use from read-only requests like '/oauth/verify'.
+        """
+        authorization_document = AuthorizationDocument.query.get(user_id)
+        if authorization_document is None:
+            documents = AuthorizationDocument.build(db.session.connection(), {user_id})
+            if user_id in documents:
+                authorization_document = AuthorizationDocument(
+                    user_id=user_id, document=documents[user_id], modified_at=datetime.utcnow())
+        return authorization_document
+
+    @staticmethod
+    def build(connection, user_ids):
+        """Return mapping of user ID to document, built in a single query on 'connection'."""
+        users, permissions, collections = \
+            User.__table__, Permission.__table__, Collection.__table__
+        rows = connection.execute(
+            select(users.c.id, users.c.email, users.c.full_name,
+                   collections.c.code, collections.c.friendly_name,
+                   permissions.c.cataloger, permissions.c.registrant,
+                   permissions.c.global_registrant)
+            .select_from(
+                users
+                .outerjoin(permissions, permissions.c.user_id == users.c.id)
+                .outerjoin(collections, and_(collections.c.id == permissions.c.collection_id,
+                                             collections.c.is_active.is_(True))))
+            .where(users.c.id.in_(user_ids))
+            .order_by(users.c.id, permissions.c.id))
+
+        documents = dict()
+        for row in rows:
+            if row.id not in documents:
+                documents[row.id] = {'full_name': row.full_name, 'email': row.email,
+                                     'id': row.id, 'permissions': []}
+            if row.code is not None:
+                documents[row.id]['permissions'].append({
+                    'code': row.code,
+                    'friendly_name': row.friendly_name,
+                    'cataloger': row.cataloger,
+                    'registrant': row.registrant,
+                    'global_registrant': row.global_registrant
+                })
+        return documents
+
+    @staticmethod
+    def refresh(connection, user_ids):
+        """Rebuild and store documents for 'user_ids' on 'connection', and return them.
+
+        Existing rows are updated in place (an upsert where the database supports it), so that
+        concurrent refreshes of the same user don't collide on inserting it.
+        """
+        table = AuthorizationDocument.__table__
+        documents = AuthorizationDocument.build(connection, user_ids)
+        gone_user_ids = set(user_ids) - set(documents)
+        if gone_user_ids:
+            connection.execute(table.delete().where(table.c.user_id.in_(gone_user_ids)))
+        if not documents:
+            return documents
+
+        now = datetime.utcnow()
+        rows = [{'user_id': user_id, 'document': document, 'modified_at': now}
+                for user_id, document in documents.items()]
+        dialect_insert = _DIALECT_INSERTS.get(connection.dialect.name)
+        if dialect_insert:
+            statement = dialect_insert(table)
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=[table.c.user_id],
+                set_={'document': statement.excluded.document,
+                      'modified_at': statement.excluded.modified_at}), rows)
+        else:
+            existing_user_ids = set(connection.execute(
+                select(table.c.user_id).where(table.c.user_id.in_(documents))).scalars())
+            for row in rows:
+                if row['user_id'] in existing_user_ids:
+                    connection.execute(table.update().where(table.c.user_id == row['user_id'])
+                                       .values(document=row['document'], modified_at=now))
+            new_rows = [row for row in rows if row['user_id'] not in existing_user_ids]
+            if new_rows:
+                connection.execute(table.insert(), new_rows)
+        return documents
+
+    def __repr__(self):
+        """Represent instance as a unique string."""
+        return '<AuthorizationDocument({user_id!r})>'.format(user_id=self.user_id)
+
+
+@on_flush({User: ('email', 'full_name'), Permission: None,
+           Collection: ('code', 'friendly_name', 'is_active')})
+def _refresh_authorization_documents(session, changes):
+    """Rebuild documents for users affected by the flush, inside the same transaction."""
+    user_ids = changes.user_ids
+    collection_ids = changes.keys(Collection)
+    if collection_ids:
+        permissions = Permission.__table__
+        user_ids.update(session.connection().execute(
+            select(permissions.c.user_id).where(permissions.c.collection_id.in_(collection_ids))
+        ).scalars())
+    if user_ids:
+        AuthorizationDocument.refresh(session.connection(), user_ids)
+
+
+@on_flush({User: None, Permission: None, Collection: None})
+def _drop_authorization_indexes(session, _):
+    """Rebuild authorization indexes after writes, e.g. to a permission or collection."""
+    for instance in session.identity_map.values():
+        if isinstance(instance, User):
+            drop_authorization_index(instance)
@@ -1,34 +1,136 @@
 """Permission views."""
 
 
-from flask import Blueprint, abort, flash, redirect, render_template, request, url_for
+import csv
+from io import StringIO
+
+from flask import (Blueprint, Response, abort, flash, redirect, render_template, request,
+                   stream_with_context, url_for)
 from flask_babel import lazy_gettext as _
 from flask_login import current_user, login_required
-from sqlalchemy.orm import contains_eager
-
 from six.moves.urllib_parse import quote
+from sqlalchemy import tuple_
+from sqlalchemy.orm import contains_eager
 
+from ..collection.models import COLLECTION_CATEGORIES, Collection
+from ..extensions import db
 from ..user.models import User
-from ..utils import flash_errors, get_redirect_target
+from ..utils import KeysetPage, flash_errors, get_page_args, get_redirect_target, stream_template
 from .forms import DeleteForm, EditForm, RegisterForm
 from .models import Permission
 
 blueprint = Blueprint('permission', __name__, url_prefix='/permissions', static_folder='../static')
 
 
+#: Permissions' overview role filters, by 'role' query argument.
+PERMISSION_ROLES = ('registrant', 'cataloger', 'cataloging_admin', 'global_registrant')
+
+#: Permissions' overview order, also the key for keyset pagination.
+PERMISSION_ORDER = (User.normalized_email, Collection.code)
+
+#: Columns written by '/permissions/export.csv', by header.
+PERMISSION_EXPORT_COLUMNS = (
+    ('email', User.email),
+    ('full_name', User.full_name),
+    ('collection', Collection.code),
+    ('collection_name', Collection.friendly_name),
+    ('category', Collection.category),
+    ('collection_is_active', Collection.is_active),
+    ('registrant', Permission.registrant),
+    ('cataloger', Permission.cataloger),
+    ('cataloging_admin', Permission.cataloging_admin),
+    ('global_registrant', Permission.global_registrant),
+    ('created_at', Permission.created_at),
+    ('modified_at', Permission.modified_at)
+)
+
+#: Rows fetched per round trip by '/permissions/export.csv'.
+PERMISSION_EXPORT_BATCH_SIZE = 1000
+
+
+def get_permission_filters():
+    """Return ('collection', 'category', 'role') filters from query string, unknown ones empty."""
+    category = request.args.get('category', '')
+    role = request.args.get('role', '')
+    return (request.args.get('collection', '').strip(),
+            category if category in COLLECTION_CATEGORIES else '',
+            role if role in PERMISSION_ROLES else '')
+
+
+def filter_permissions(query, collection='', category='', role=''):
+    """Apply permission filters to 'query', which must join users and collections."""
+    if collection:
+        query = query.filter(Collection.code == collection)
+    if category:
+        query = query.filter(Collection.category == category)
+    if role:
+        query = query.filter(getattr(Permission, role).is_(True))
+    return query
+
+
 @blueprint.route('/')
 @login_required
 def home():
-    """Permissions' overview landing page."""
+    """Permissions' overview landing page.
+
+    Uses keyset pagination on (user email, collection code): 'after_email' and 'after_code' are
+    the last row of the previous page, so later pages don't read and skip earlier ones the way
+    ``OFFSET`` does. Also filters on 'collection', 'category' and 'role'.
+    """
     if not current_user.is_admin:
         abort(403)
 
-    permissions = Permission.query.join(Permission.user).join(Permission.collection).options(
-        contains_eager(Permission.user),
-        contains_eager(Permission.collection)
-    ).order_by(User.email).all()
+    collection, category, role = get_permission_filters()
+    per_page = get_page_args()[1]
+    query = filter_permissions(
+        Permission.query.join(Permission.user).join(Permission.collection).options(
+            # Streamed from the cursor, which joined collections can't be.
+            contains_eager(Permission.user).lazyload(User.permissions),
+            contains_eager(Permission.collection).lazyload(Collection.permissions)
+        ), collection, category, role)
+    after = (request.args.get('after_email'), request.args.get('after_code'))
+    if all(after):
+        query = query.filter(tuple_(*PERMISSION_ORDER) > after)
+    permissions = KeysetPage(query.order_by(*PERMISSION_ORDER), per_page,
+                             lambda last: dict(after_email=last.user.normalized_email,
+                                               after_code=last.collection.code))
+
+    return stream_template('permissions/home.html', permissions=permissions,
+                           is_first_page=not all(after),
+                           collection=collection, category=category, role=role)
+
+
+@blueprint.route('/export.csv')
+@login_required
+def export():
+    """Stream all permissions matching the overview's filters as CSV.
+
+    Rows come from a server-side cursor, 'PERMISSION_EXPORT_BATCH_SIZE' at a time, and are
+    written out as they arrive, so memory use doesn't grow with the number of permissions.
+    """
+    if not current_user.is_admin:
+        abort(403)
+
+    query = filter_permissions(
+        db.session.query(*(column for _header, column in PERMISSION_EXPORT_COLUMNS))
+        .select_from(Permission).join(Permission.user).join(Permission.collection),
+        *get_permission_filters())
+    rows = query.order_by(*PERMISSION_ORDER).yield_per(PERMISSION_EXPORT_BATCH_SIZE)
+
+    def generate():
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([header for header, _column in PERMISSION_EXPORT_COLUMNS])
+        for i, row in enumerate(rows, start=1):
+            writer.writerow(row)
+            if i % PERMISSION_EXPORT_BATCH_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
 
-    return render_template('permissions/home.html', permissions=permissions)
+    return Response(stream_with_context(generate()), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=permissions.csv'})
 
 
 @blueprint.route('/register/', methods=['GET', 'POST'],
@@ -61,7 +163,7 @@ def register(user_id, collection_id):
             flash_errors(register_permission_form)
 
     if request.referrer and url_for('user.register') in request.referrer:
-        user_id = User.query.filter_by(created_by=current_user).order_by(-User.id).all()[0].id
+        user_id = User.query.filter_by(created_by_id=current_user.id).order_by(-User.id).all()[0].id
     register_permission_form.set_defaults(user_id, collection_id)
     return render_template('permissions/register.html',
                            register_permission_form=register_permission_form,
@@ -93,7 +195,8 @@ def edit(permission_id):
             flash_errors(edit_permission_form)
 
     if request.referrer and url_for('user.register') in request.referrer:
-        new_user_id = User.query.filter_by(created_by=current_user).order_by(-User.id).all()[0].id
+        new_user_id = (User.query.filter_by(created_by_id=current_user.id)
+                       .order_by(-User.id).all()[0].id)
         edit_permission_form.set_defaults(permission, new_user_id=new_user_id)
     else:
         edit_permission_form.set_defaults(permission)
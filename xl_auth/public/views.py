@@ -1,16 +1,18 @@
 """Public section, including homepage and signup."""
 
 
-from flask import (Blueprint, current_app, flash, make_response, redirect, render_template, request,
-                   session, url_for)
+from flask import (Blueprint, abort, current_app, flash, jsonify, make_response, redirect,
+                   render_template, request, session, url_for)
 from flask_babel import lazy_gettext as _
 from flask_login import current_user, login_required, login_user, logout_user
 
 from six.moves.urllib_parse import quote
 
-from ..extensions import login_manager
+from ..extensions import bcrypt, login_manager
+from ..login_throttle import login_throttle
 from ..public.forms import ForgotPasswordForm, LoginForm, ResetPasswordForm
-from ..user.models import FailedLoginAttempt, PasswordReset, User
+from ..user.models import PasswordReset, User
+from ..user.snapshot import get_user_snapshot
 from ..utils import flash_errors, get_redirect_target, get_remote_addr
 
 blueprint = Blueprint('public', __name__, static_folder='../static')
@@ -18,7 +20,9 @@ blueprint = Blueprint('public', __name__, static_folder='../static')
 
 @login_manager.user_loader
 def load_user(user_id):
-    """Load user by ID."""
+    """Load user by ID, as a cached snapshot if enabled."""
+    if current_app.config['XL_AUTH_USER_CACHE_TTL']:
+        return get_user_snapshot(int(user_id))
     user = User.get_by_id(int(user_id))
     if user is not None and (user.is_deleted or not user.is_active):
         return None
@@ -38,7 +42,7 @@ def home():
     username = login_form.username.data
     # Handle logging in.
     if request.method == 'POST':
-        if username and FailedLoginAttempt.too_many_recent_failures_for(username):
+        if username and login_throttle.is_throttled(username, get_remote_addr()):
             response = make_response(render_template('429.html'), 429)
             response.headers['X-Username'] = username
             return response
@@ -54,7 +58,7 @@ def home():
                     url_for('user.approve_tos') + '?next={}'.format(quote(redirect_url)))
         else:
             if username:
-                FailedLoginAttempt(username, get_remote_addr()).save()
+                login_throttle.record_failure(username, get_remote_addr())
             flash_errors(login_form)
 
     response = make_response(render_template('public/home.html', login_form=login_form,
@@ -121,3 +125,13 @@ def logout():
 def about():
     """About page."""
     return render_template('public/about.html', version=current_app.config['APP_VERSION'])
+
+
+@blueprint.route('/status/bcrypt/')
+@login_required
+def bcrypt_status():
+    """Bcrypt pool queue depth and hashing latency of this worker process, for monitoring."""
+    if not current_user.is_admin:
+        abort(403)
+
+    return jsonify(bcrypt.get_stats())
@@ -0,0 +1,123 @@
+"""Deleting expired and aged-out rows in small batches, see ``XL_AUTH_PURGE_*`` settings."""
+
+
+import os
+import threading
+from datetime import datetime, timedelta
+from time import monotonic
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from .extensions import db
+from .oauth.grant.models import Grant
+from .oauth.token.models import Token
+from .user.models import FailedLoginAttempt, PasswordReset
+
+#: Purged tables, and the timestamp column that retention is counted from.
+PURGE_TABLES = (('tokens', Token.__table__.c.expires_at),
+                ('grants', Grant.__table__.c.expires_at),
+                ('password_resets', PasswordReset.__table__.c.expires_at),
+                ('failed_login_attempts', FailedLoginAttempt.__table__.c.created_at))
+
+
+def get_cutoffs(now=None):
+    """Return mapping of table name to (timestamp column, cutoff) for rows to purge."""
+    now = now or datetime.utcnow()
+    retention = current_app.config['XL_AUTH_PURGE_RETENTION']
+    cutoffs = dict()
+    for name, column in PURGE_TABLES:
+        seconds = retention[name]
+        if name == 'failed_login_attempts':
+            # Never drop attempts that still count against a login.
+            seconds = max(seconds, current_app.config['XL_AUTH_FAILED_LOGIN_TIMEFRAME'])
+        cutoffs[name] = (column, now - timedelta(seconds=seconds))
+    return cutoffs
+
+
+def count_expired(now=None):
+    """Return mapping of table name to number of rows that would be purged."""
+    with db.engine.connect() as connection:
+        return {name: connection.execute(
+            select(func.count()).select_from(column.table).where(column < cutoff)).scalar()
+            for name, (column, cutoff) in get_cutoffs(now).items()}
+
+
+def delete_expired(name, batch_size=None, now=None):
+    """Delete expired rows from table 'name', one short transaction per batch.
+
+    Each batch picks at most 'batch_size' primary keys, then deletes just those, so locks on
+    busy tables like 'tokens' are only ever held for a single batch. Goes straight to the
+    database, without ORM events; rows this old are no longer cached or revocable anyway.
+
+    :return: Number of rows deleted.
+    """
+    column, cutoff = get_cutoffs(now)[name]
+    table = column.table
+    batch_size = batch_size or current_app.config['XL_AUTH_PURGE_BATCH_SIZE']
+    deleted = 0
+    while True:
+        with db.engine.begin() as connection:
+            ids = connection.execute(
+                select(table.c.id).where(column < cutoff).limit(batch_size)).scalars().all()
+            if ids:
+                connection.execute(table.delete().where(table.c.id.in_(ids)))
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            return deleted
+
+
+def purge_expired(batch_size=None, now=None, echo=None):
+    """Purge all tables, reporting progress to 'echo'; return mapping of name to rows deleted."""
+    deleted = dict()
+    for name, _ in PURGE_TABLES:
+        started = monotonic()
+        deleted[name] = delete_expired(name, batch_size=batch_size, now=now)
+        if echo:
+            echo('{}: deleted {} rows in {:.2f} s'.format(name, deleted[name],
+                                                          monotonic() - started))
+    return deleted
+
+
+class PurgeJob(object):
+    """Run 'purge_expired' every ``XL_AUTH_PURGE_INTERVAL`` seconds in a daemon thread.
+
+    Started lazily on the first request of each worker process, as threads started in the
+    Gunicorn master (``preload_app``) don't survive forking. Concurrent runs in several workers
+    are harmless, as each batch only deletes rows that are still there.
+    """
+
+    def __init__(self, app=None):
+        """Create instance."""
+        self.app = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Start with the first request, if enabled."""
+        self.app = app
+        if app.config['XL_AUTH_PURGE_INTERVAL']:
+            app.before_request(self.ensure_started)
+
+    def ensure_started(self):
+        """Start thread for this process, unless already running."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name='purge-expired', daemon=True).start()
+
+    def _run(self):
+        interval, sleeper = self.app.config['XL_AUTH_PURGE_INTERVAL'], threading.Event()
+        while not sleeper.wait(interval):
+            with self.app.app_context():
+                try:
+                    purge_expired(echo=self.app.logger.info)
+                except Exception:  # noqa: B902  # Keep going; retried on the next run.
+                    self.app.logger.exception('Purging expired rows failed')
+                finally:
+                    db.session.remove()
+
+
+purge_job = PurgeJob()
@@ -30,9 +30,62 @@ class Config(object):
     EMAIL_PORT = int(os.environ.get('EMAIL_PORT', '25'))
     EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', '5'))
     OAUTH2_PROVIDER_TOKEN_EXPIRES_IN = 36000
+    OAUTH2_PROVIDER_TOKEN_GENERATOR = 'xl_auth.oauth.signed_tokens.generate_access_token'
+    OAUTH2_PROVIDER_REFRESH_TOKEN_GENERATOR = \
+        'oauthlib.oauth2.rfc6749.tokens.random_token_generator'
+    XL_AUTH_SIGNED_ACCESS_TOKENS = bool(os.environ.get('XL_AUTH_SIGNED_ACCESS_TOKENS', ''))
+    XL_AUTH_SIGNED_ACCESS_TOKEN_KEY = os.environ.get('XL_AUTH_SIGNED_ACCESS_TOKEN_KEY', None)
     XL_AUTH_MAX_ACTIVE_PASSWORD_RESETS = 2
+    # Rows per page in the admin listings by default, and at most ('per_page' query argument).
+    XL_AUTH_PAGE_SIZE = 100
+    XL_AUTH_MAX_PAGE_SIZE = 1000
+    # Failed logins are counted in the cache. With a per-process CACHE_TYPE (e.g. 'SimpleCache')
+    # each worker process counts separately, allowing up to MAX_ATTEMPTS times workers in total.
     XL_AUTH_FAILED_LOGIN_TIMEFRAME = 60 * 60
     XL_AUTH_FAILED_LOGIN_MAX_ATTEMPTS = 7
+    XL_AUTH_FAILED_LOGIN_MAX_ATTEMPTS_PER_ADDRESS = int(
+        os.environ.get('XL_AUTH_FAILED_LOGIN_MAX_ATTEMPTS_PER_ADDRESS', '100'))
+    # Write failed logins to 'failed_login_attempts' 'async' (background thread), 'sync' or ''.
+    XL_AUTH_FAILED_LOGIN_AUDIT = os.environ.get('XL_AUTH_FAILED_LOGIN_AUDIT', 'async')
+    # Per worker process, so a token revoked through another process keeps verifying for up to
+    # XL_AUTH_VERIFY_CACHE_TTL seconds; 0 is off.
+    XL_AUTH_VERIFY_CACHE_SIZE = int(os.environ.get('XL_AUTH_VERIFY_CACHE_SIZE', '10000'))
+    XL_AUTH_VERIFY_CACHE_TTL = int(os.environ.get('XL_AUTH_VERIFY_CACHE_TTL', '5'))
+    XL_AUTH_VERIFY_BATCH_MAX_TOKENS = 100
+    XL_AUTH_VERIFY_MAX_AGE = int(os.environ.get('XL_AUTH_VERIFY_MAX_AGE', '30'))
+    # 'sql' or 'cache', the latter needs a shared CACHE_TYPE (e.g. Redis), see oauth/grant/store.py.
+    XL_AUTH_GRANT_STORE = os.environ.get('XL_AUTH_GRANT_STORE', 'sql')
+    XL_AUTH_CLIENT_REGISTRY_TTL = int(os.environ.get('XL_AUTH_CLIENT_REGISTRY_TTL', '60'))
+    # Seconds to cache users loaded for Flask-Login (0 loads them from the database every time).
+    # Needs a shared CACHE_TYPE (e.g. Redis), so that changes to users reach every worker process.
+    XL_AUTH_USER_CACHE_TTL = int(os.environ.get('XL_AUTH_USER_CACHE_TTL', '0'))
+    # Bcrypt worker processes per app process (0 hashes on the request thread), and how many
+    # operations may be running or waiting before logins are turned away with a 429.
+    XL_AUTH_BCRYPT_POOL_SIZE = int(os.environ.get('XL_AUTH_BCRYPT_POOL_SIZE', '2'))
+    XL_AUTH_BCRYPT_QUEUE_LIMIT = int(os.environ.get('XL_AUTH_BCRYPT_QUEUE_LIMIT', '16'))
+    # Calibrate bcrypt cost at startup to hash in about this many milliseconds (0 is off,
+    # using BCRYPT_LOG_ROUNDS); existing hashes are upgraded on the next successful login.
+    XL_AUTH_BCRYPT_TARGET_MS = int(os.environ.get('XL_AUTH_BCRYPT_TARGET_MS', '0'))
+    XL_AUTH_BCRYPT_MIN_LOG_ROUNDS = 10
+    # Hand out the same client_credentials token again while it has at least this many seconds
+    # left, instead of issuing a new one on every request; 0 is off.
+    XL_AUTH_CLIENT_CREDENTIALS_TOKEN_REUSE_MIN_LIFETIME = \
+        int(os.environ.get('XL_AUTH_CLIENT_CREDENTIALS_TOKEN_REUSE_MIN_LIFETIME', '0'))
+    # Seconds to keep rows past 'expires_at' (or 'created_at' for failed login attempts).
+    # Expired tokens can still be refreshed, hence the generous default.
+    XL_AUTH_PURGE_RETENTION = {
+        'tokens': 30 * 24 * 60 * 60,
+        'grants': 24 * 60 * 60,
+        'password_resets': 7 * 24 * 60 * 60,
+        'failed_login_attempts': 30 * 24 * 60 * 60
+    }
+    XL_AUTH_PURGE_BATCH_SIZE = 5000
+    XL_AUTH_PURGE_INTERVAL = int(os.environ.get('XL_AUTH_PURGE_INTERVAL', '0'))  # 0 is off.
+    # Seconds between writes of buffered 'last_login_at' timestamps (0 writes on every login),
+    # or sooner once that many logins are buffered.
+    XL_AUTH_LAST_LOGIN_FLUSH_INTERVAL = int(
+        os.environ.get('XL_AUTH_LAST_LOGIN_FLUSH_INTERVAL', '5'))
+    XL_AUTH_LAST_LOGIN_FLUSH_SIZE = 500
 
 
 class ProdConfig(Config):
@@ -68,4 +121,7 @@ class TestConfig(Config):
     # For faster tests; needs at least 4 to avoid "ValueError: Invalid rounds".
     BCRYPT_LOG_ROUNDS = 4
     WTF_CSRF_ENABLED = False  # Allows form testing.
+    XL_AUTH_BCRYPT_POOL_SIZE = 0
+    XL_AUTH_FAILED_LOGIN_AUDIT = 'sync'
+    XL_AUTH_LAST_LOGIN_FLUSH_INTERVAL = 0
     EMAIL_BACKEND = 'flask_emails.backends.DummyBackend'
@@ -3,6 +3,7 @@
 
 import hashlib
 from binascii import hexlify
+from collections import namedtuple
 from datetime import datetime, timedelta
 from os import urandom
 import uuid
@@ -11,10 +12,13 @@ from flask import current_app, url_for
 from flask_babel import lazy_gettext as _
 from flask_emails import Message
 from flask_login import UserMixin
-from sqlalchemy import desc
+from sqlalchemy import desc, event, func
 from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import validates
+from sqlalchemy.orm.attributes import set_committed_value
 
-from ..database import Column, Model, SurrogatePK, db, or_, reference_col, relationship
+from ..database import (Column, Model, SurrogatePK, db, get_user_instance, or_, reference_col,
+                        relationship)
 from ..extensions import bcrypt
 from ..utils import get_remote_addr
 
@@ -40,6 +44,9 @@ class PasswordReset(SurrogatePK, Model):
     """Password reset token for a user."""
 
     __tablename__ = 'password_resets'
+    __table_args__ = (db.Index('ix_password_resets_user_id_is_active_created_at',
+                               'user_id', 'is_active', 'created_at'),
+                      SurrogatePK.__table_args__)
     user_id = reference_col('users', nullable=True)
     user = relationship('User', back_populates='password_resets')
     code = Column(db.String(32), unique=True, nullable=False)
@@ -57,9 +64,19 @@ class PasswordReset(SurrogatePK, Model):
     @staticmethod
     def get_by_email_and_code(email, code):
         """Get by `(email, code)` pair."""
-        user = User.get_by_email(email)
-        if user:
-            return PasswordReset.query.filter_by(code=code, user=user).first()
+        if email:
+            return (PasswordReset.query.join(PasswordReset.user)
+                    .filter(PasswordReset.code == code,
+                            User.normalized_email == User.normalize_email(email))
+                    .first())
+
+    @staticmethod
+    def count_active_and_recent_by_user(user):
+        """Count active password resets created recently for specified user."""
+        return (db.session.query(func.count(PasswordReset.id))
+                .filter_by(user_id=user.id, is_active=True)
+                .filter(PasswordReset.is_recent)
+                .scalar())
 
     @staticmethod
     def delete_all_by_user(user):
@@ -181,19 +198,6 @@ class FailedLoginAttempt(SurrogatePK, Model):
         """Create instance."""
         db.Model.__init__(self, username=username, remote_addr=remote_addr)
 
-    @staticmethod
-    def too_many_recent_failures_for(username):
-        """Determine if a login attempt is allowed or not."""
-        timeframe = current_app.config['XL_AUTH_FAILED_LOGIN_TIMEFRAME']
-        from_timestamp = datetime.utcnow() - timedelta(seconds=timeframe)
-        attempts = FailedLoginAttempt.query.filter(
-            FailedLoginAttempt.username.ilike(username),
-            FailedLoginAttempt.created_at >= from_timestamp).all()
-        if len(attempts) >= current_app.config['XL_AUTH_FAILED_LOGIN_MAX_ATTEMPTS']:
-            return True
-        else:
-            return False
-
     @staticmethod
     def get_all_by_user(user):
         """Get all failed login attempts for specified user."""
@@ -213,12 +217,60 @@ class FailedLoginAttempt(SurrogatePK, Model):
         return '<FailedLoginAttempt({id}:{username!r})>'.format(id=self.id, username=self.username)
 
 
+#: Marks passwords that were never set; bcrypt hashes start with '$'.
+UNUSABLE_PASSWORD_PREFIX = b'!'
+
+
+AuthorizationRoles = namedtuple('AuthorizationRoles', ['cataloger', 'registrant',
+                                                       'cataloging_admin', 'global_registrant',
+                                                       'collection_is_active'])
+
+
+class AuthorizationIndex(object):
+    """A user's roles per collection ID, and aggregates, answering permission checks in O(1).
+
+    Templates and forms ask the same questions of the logged in user many times per request;
+    ``User`` builds this from its permissions on first use, and drops it whenever they may
+    have changed (see listeners below).
+    """
+
+    def __init__(self, roles):
+        """Create instance from mapping of collection ID to ``AuthorizationRoles``."""
+        self.roles = roles
+        self.cataloging_admin_collection_ids = frozenset(
+            collection_id for collection_id, role in roles.items() if role.cataloging_admin)
+        self.is_cataloging_admin = bool(self.cataloging_admin_collection_ids)
+        self.is_global_registrant = any(role.global_registrant and role.collection_is_active
+                                        for role in roles.values())
+
+    @classmethod
+    def from_permissions(cls, permissions):
+        """Create instance from ``Permission`` instances."""
+        return cls({permission.collection.id: AuthorizationRoles(
+            permission.cataloger, permission.registrant, permission.cataloging_admin,
+            permission.global_registrant, permission.collection.is_active)
+            for permission in permissions})
+
+    def is_cataloging_admin_for(self, *collections):
+        """Check for 'cataloging_admin' permissions for all 'collections'."""
+        if not collections:
+            return False  # Can't be cataloging admin for nothing
+        return all(collection.id in self.cataloging_admin_collection_ids
+                   for collection in collections)
+
+    def has_any_permission_for(self, collection):
+        """Check for any permission on 'collection'."""
+        return collection.id in self.roles
+
+
 class User(UserMixin, SurrogatePK, Model):
     """A user of the app."""
 
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
     email = Column(db.String(255), unique=True, nullable=False)
+    # Lower-cased 'email', kept in sync by 'set_normalized_email', for case-insensitive lookups.
+    normalized_email = Column(db.String(255), unique=True, index=True, nullable=False)
     full_name = Column(db.String(255), unique=False, nullable=False)
     password = Column(db.LargeBinary(128), nullable=False)
     last_login_at = Column(db.DateTime, default=None)
@@ -246,12 +298,25 @@ class User(UserMixin, SurrogatePK, Model):
         if password:
             self.set_password(password)
         else:
-            self.set_password(hexlify(urandom(16)))
+            self.set_unusable_password()
+
+    @staticmethod
+    def normalize_email(email):
+        """Return 'email' as stored in 'normalized_email'."""
+        return email.lower()
 
     @staticmethod
     def get_by_email(email):
-        """Get by email."""
-        return User.query.filter(User.email.ilike(email)).first()
+        """Get by email, ignoring case."""
+        if not email:
+            return None
+        return User.query.filter_by(normalized_email=User.normalize_email(email)).first()
+
+    @validates('email')
+    def set_normalized_email(self, _, email):
+        """Update 'normalized_email' along with 'email'."""
+        self.normalized_email = User.normalize_email(email)
+        return email
 
     @staticmethod
     def get_modified_and_created_by_user(user):
@@ -261,22 +326,24 @@ class User(UserMixin, SurrogatePK, Model):
                 .filter(User.id != user.id)
                 .all())
 
+    @property
+    def authorization_index(self):
+        """Return roles per collection, built once per request, see ``AuthorizationIndex``."""
+        index = self.__dict__.get('_authorization_index')
+        if index is None:
+            index = AuthorizationIndex.from_permissions(self.permissions)
+            self.__dict__['_authorization_index'] = index
+        return index
+
     @hybrid_property
     def is_cataloging_admin(self):
         """Return 'cataloging_admin' status."""
-        for permission in self.permissions:
-            if permission.cataloging_admin:
-                return True
-        return False
+        return self.authorization_index.is_cataloging_admin
 
     @hybrid_property
     def is_global_registrant(self):
         """Return 'global_registrant' status."""
-        return any(
-            permission.global_registrant and
-            permission.collection.is_active
-            for permission in self.permissions
-        )
+        return self.authorization_index.is_global_registrant
 
     @hybrid_property
     def can_see_global_registrant(self):
@@ -285,17 +352,11 @@ class User(UserMixin, SurrogatePK, Model):
 
     def is_cataloging_admin_for(self, *collections):
         """Check if user has 'cataloging_admin' permissions for all 'collections'."""
-        collections = set(collections)
-        if not collections:
-            return False  # Can't be cataloging admin for nothing
-        admin_permission_collections = set(_.collection for _ in self.permissions
-                                           if _.cataloging_admin)
-        return collections.issubset(admin_permission_collections)
+        return self.authorization_index.is_cataloging_admin_for(*collections)
 
     def has_any_permission_for(self, collection):
         """Check for any permission on a specific collection."""
-        return any([permission for permission in self.permissions
-                    if permission.collection == collection])
+        return self.authorization_index.has_any_permission_for(collection)
 
     def set_password(self, password):
         """Set password."""
@@ -305,23 +366,49 @@ class User(UserMixin, SurrogatePK, Model):
         """Set email."""
         self.email = email
 
+    def set_unusable_password(self):
+        """Set a password nothing matches, until one is set with 'set_password', e.g. on reset.
+
+        Costs no hashing; the random part just keeps these values from looking all alike.
+        """
+        self.password = UNUSABLE_PASSWORD_PREFIX + hexlify(urandom(16))
+
+    @property
+    def has_usable_password(self):
+        """Check if a password has been set, see 'set_unusable_password'."""
+        return not self.password.startswith(UNUSABLE_PASSWORD_PREFIX)
+
     def check_password(self, value):
-        """Check password."""
-        return bcrypt.check_password_hash(self.password, value)
+        """Check password, upgrading the hash to the current cost factor if it matches.
+
+        The upgraded hash is committed with whatever is saved next, e.g. by 'update_last_login'.
+        """
+        if not self.has_usable_password:
+            return False
+        if not bcrypt.check_password_hash(self.password, value):
+            return False
+        if bcrypt.needs_rehash(self.password):
+            self.set_password(value)
+        return True
 
     def update_last_login(self):
         self.update_last_login_internal(remote_address=get_remote_addr())
 
     def update_last_login_internal(self, remote_address, commit=True):
-        """Remove failed login attempts for username/IP."""
-        (FailedLoginAttempt.query.filter(FailedLoginAttempt.username.ilike(self.email),
-                                         FailedLoginAttempt.remote_addr == remote_address)
-                                 .delete(synchronize_session=False))
-
-        """Set 'last_login_at' to current datetime."""
-        self.last_login_at = datetime.utcnow()
-        if commit:
+        """Set 'last_login_at' to now, and remove failed login attempts for username/IP.
+
+        Both are written behind, see ``LastLoginBuffer``; 'commit' only saves other pending
+        changes, e.g. a password hash upgraded by 'check_password'.
+        """
+        from ..last_login import last_login_buffer  # Imports this module.
+        from ..login_throttle import login_throttle  # Imports this module.
+        login_throttle.reset(self.email, remote_address)
+        last_login_at = datetime.utcnow()
+        # Not marking the instance as modified; it is written by the buffer.
+        set_committed_value(self, 'last_login_at', last_login_at)
+        if commit and db.session.is_modified(self):
             self.save(commit=True, preserve_modified=True)
+        last_login_buffer.add(self.id, self.email, remote_address, last_login_at)
 
     def set_tos_approved(self, commit=True):
         """Set 'tos_approved_at' to current datetime."""
@@ -350,14 +437,8 @@ class User(UserMixin, SurrogatePK, Model):
         if current_user == self or current_user.is_admin:
             return self.permissions
         else:
-            def current_user_is_cataloging_admin_for(collection):
-                for permission in current_user.permissions:
-                    if permission.collection == collection and permission.cataloging_admin:
-                        return True
-                return False
-
             return [perm for perm in self.permissions
-                    if current_user_is_cataloging_admin_for(perm.collection)]
+                    if current_user.is_cataloging_admin_for(perm.collection)]
 
     def get_cataloging_admin_permissions(self):
         """Return all cataloging admin permissions for this user."""
@@ -365,7 +446,9 @@ class User(UserMixin, SurrogatePK, Model):
 
     def get_active_and_recent_password_resets(self):
         """Return a list of active and recent password resets for this user."""
-        return [reset for reset in self.password_resets if reset.is_active and reset.is_recent]
+        return (PasswordReset.query.filter_by(user_id=self.id, is_active=True)
+                .filter(PasswordReset.is_recent)
+                .all())
 
     @property
     def display_name(self):
@@ -375,6 +458,7 @@ class User(UserMixin, SurrogatePK, Model):
 
     def save_as(self, current_user, commit=True, preserve_modified=False):
         """Save instance as 'current_user'."""
+        current_user = get_user_instance(current_user)
         if current_user and not self.created_at:
             self.created_by = current_user
         if current_user and not preserve_modified:
@@ -398,3 +482,12 @@ class User(UserMixin, SurrogatePK, Model):
     def __repr__(self):
         """Represent instance as a unique string."""
         return '<User({email!r})>'.format(email=self.email)
+
+
+@event.listens_for(User, 'expire')
+@event.listens_for(User.permissions, 'append')
+@event.listens_for(User.permissions, 'remove')
+def drop_authorization_index(user, *_):
+    """Rebuild authorization index once permissions are reloaded or changed."""
+    if user is not None:  # Already garbage collected.
+        user.__dict__.pop('_authorization_index', None)
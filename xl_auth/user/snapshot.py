@@ -0,0 +1,202 @@
+"""Cached, read-only snapshots of users, for loading the logged in user on every request."""
+
+
+from uuid import uuid4
+
+from flask import current_app
+
+from ..collection.models import Collection
+from ..extensions import cache, has_shared_cache
+from ..invalidation import on_commit
+from ..permission.models import Permission
+from .models import AuthorizationIndex, AuthorizationRoles, User
+
+#: Prefix for cached snapshots, followed by user ID and version stamps.
+SNAPSHOT_KEY_PREFIX = 'user_snapshot:'
+
+#: Prefix for per-user version stamps, followed by user ID.
+VERSION_KEY_PREFIX = 'user_version:'
+
+#: Version stamp shared by all users, bumped when any collection changes.
+ALL_USERS_VERSION_KEY = 'user_version'
+
+
+class UserSnapshot(object):
+    """Read-only stand-in for ``User``, built from cached plain values.
+
+    Answers what nearly every request asks of ``current_user`` (ID, email, roles) without a
+    query. The few other things views use, listed in 'FORWARDED_ATTRIBUTES', are taken from
+    the ``User`` instance, loaded on first use. Writes need that instance itself, e.g. for
+    'modified_by'; ``CRUDMixin.save_as`` gets it through 'get_user'.
+    """
+
+    #: ``User`` attributes available through the snapshot, anything else is an AttributeError.
+    FORWARDED_ATTRIBUTES = frozenset(('permissions', 'get_cataloging_admin_permissions',
+                                      'set_tos_approved', 'update_last_login', 'display_name',
+                                      'last_login_at'))
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, data):
+        """Create instance."""
+        object.__setattr__(self, '_data', data)
+        object.__setattr__(self, '_user', None)
+        object.__setattr__(self, 'authorization_index', AuthorizationIndex(
+            {collection_id: AuthorizationRoles(*roles)
+             for collection_id, roles in data['permissions']}))
+
+    @staticmethod
+    def get_data(user):
+        """Return what a snapshot of 'user' is built from."""
+        return dict(id=user.id, email=user.email, full_name=user.full_name,
+                    is_active=user.is_active, is_deleted=user.is_deleted, is_admin=user.is_admin,
+                    tos_approved_at=user.tos_approved_at,
+                    permissions=[(collection_id, tuple(roles)) for collection_id, roles
+                                 in user.authorization_index.roles.items()])
+
+    def get_id(self):
+        """Return ID for Flask-Login."""
+        return str(self._data['id'])
+
+    @property
+    def id(self):
+        """Return user ID."""
+        return self._data['id']
+
+    @property
+    def email(self):
+        """Return email."""
+        return self._data['email']
+
+    @property
+    def full_name(self):
+        """Return full name."""
+        return self._data['full_name']
+
+    @property
+    def is_active(self):
+        """Return 'is_active' status."""
+        return self._data['is_active']
+
+    @property
+    def is_deleted(self):
+        """Return 'is_deleted' status."""
+        return self._data['is_deleted']
+
+    @property
+    def is_admin(self):
+        """Return 'is_admin' status."""
+        return self._data['is_admin']
+
+    @property
+    def tos_approved_at(self):
+        """Return when ToS were approved."""
+        return self._data['tos_approved_at']
+
+    @property
+    def is_cataloging_admin(self):
+        """Return 'cataloging_admin' status."""
+        return self.authorization_index.is_cataloging_admin
+
+    @property
+    def is_global_registrant(self):
+        """Return 'global_registrant' status."""
+        return self.authorization_index.is_global_registrant
+
+    @property
+    def can_see_global_registrant(self):
+        """Check if the user is allowed to see 'global_registrant' status."""
+        return self.is_admin or self.is_global_registrant
+
+    is_cataloging_admin_for = User.is_cataloging_admin_for
+    has_any_permission_for = User.has_any_permission_for
+    get_gravatar_url = User.get_gravatar_url
+
+    def get_user(self):
+        """Return the ``User`` instance, loading it on first use."""
+        if self._user is None:
+            object.__setattr__(self, '_user', User.get_by_id(self._data['id']))
+        return self._user
+
+    def __getattr__(self, name):
+        """Fall back to the ``User`` instance for 'FORWARDED_ATTRIBUTES'."""
+        if name not in self.FORWARDED_ATTRIBUTES:
+            raise AttributeError('{0!r} has no attribute {1!r}, use get_user() for '
+                                 'more'.format(self, name))
+        return getattr(self.get_user(), name)
+
+    def __setattr__(self, name, value):
+        """Refuse changes, they belong on the ``User`` instance."""
+        raise AttributeError('UserSnapshot is read-only, change User.get_by_id({0}) '
+                             'instead'.format(self._data['id']))
+
+    def __eq__(self, other):
+        """Compare by user ID, also to ``User`` instances."""
+        return isinstance(other, (User, UserSnapshot)) and other.id == self.id
+
+    def __ne__(self, other):
+        """Compare by user ID, also to ``User`` instances."""
+        return not self == other
+
+    def __hash__(self):
+        """Hash by user ID."""
+        return hash(self.id)
+
+    def __repr__(self):
+        """Represent instance as a unique string."""
+        return '<UserSnapshot({email!r})>'.format(email=self.email)
+
+
+def check_snapshot_cache(app):
+    """Refuse caching users if changes wouldn't reach other worker processes.
+
+    Version stamps are only replaced in the process making the change, so with e.g. the
+    default 'SimpleCache' other processes would keep serving deactivated users or revoked
+    admin rights until their snapshots expire.
+    """
+    if app.config['XL_AUTH_USER_CACHE_TTL'] and not has_shared_cache(app):
+        raise RuntimeError('XL_AUTH_USER_CACHE_TTL requires a shared CACHE_TYPE, '
+                           'e.g. "RedisCache", for changes to users to reach all worker processes')
+
+
+def _get_snapshot_key(user_id):
+    """Return cache key for the current snapshot of 'user_id', creating version stamps if needed."""
+    version_keys = (VERSION_KEY_PREFIX + str(user_id), ALL_USERS_VERSION_KEY)
+    versions = cache.get_many(*version_keys)
+    for i, version_key in enumerate(version_keys):
+        if versions[i] is None:
+            cache.add(version_key, uuid4().hex, timeout=0)
+            versions[i] = cache.get(version_key)
+    return '{0}{1}:{2}:{3}'.format(SNAPSHOT_KEY_PREFIX, user_id, *versions)
+
+
+def get_user_snapshot(user_id):
+    """Return snapshot of active, not deleted user 'user_id', or None.
+
+    Snapshots are cached for ``XL_AUTH_USER_CACHE_TTL`` seconds, under a key including version
+    stamps that the commit subscriber below replaces once a change to the user, their
+    permissions or any collection is committed. Stamps are random rather than counters, so that
+    an evicted stamp can never bring back an outdated snapshot.
+    """
+    key = _get_snapshot_key(user_id)
+    data = cache.get(key)
+    if data is None:
+        user = User.get_by_id(user_id)
+        if user is None:
+            return None
+        data = UserSnapshot.get_data(user)
+        cache.set(key, data, timeout=current_app.config['XL_AUTH_USER_CACHE_TTL'])
+    if data['is_deleted'] or not data['is_active']:
+        return None
+    return UserSnapshot(data)
+
+
+@on_commit({Collection: None, Permission: None, User: None})
+def _bump_affected_users(_, changes):
+    """Replace version stamps of users touched by the committed transaction."""
+    if changes.of(Collection):
+        cache.set(ALL_USERS_VERSION_KEY, uuid4().hex, timeout=0)
+    if changes.user_ids:
+        cache.set_many({VERSION_KEY_PREFIX + str(user_id): uuid4().hex
+                        for user_id in changes.user_ids}, timeout=0)
@@ -4,28 +4,95 @@
 from flask import Blueprint, abort, flash, redirect, render_template, request, url_for
 from flask_babel import lazy_gettext as _
 from flask_login import current_user, login_required
+from sqlalchemy import func
+from sqlalchemy.orm import noload
 
 from ..collection.models import Collection
+from ..extensions import db
 from ..oauth.client.models import Client
-from ..oauth.grant.models import Grant
+from ..oauth.grant.store import grant_store
 from ..oauth.token.models import Token
 from ..permission.models import Permission
-from ..utils import flash_errors, get_redirect_target
-from .forms import AdministerForm, ApproveToSForm, ChangePasswordForm, EditDetailsForm, RegisterForm, ChangeEmailForm, DeleteUserForm
-from .models import PasswordReset, User, FailedLoginAttempt
+from ..utils import flash_errors, get_page_args, get_redirect_target, stream_template
+from .forms import (AdministerForm, ApproveToSForm, ChangeEmailForm, ChangePasswordForm,
+                    DeleteUserForm, EditDetailsForm, RegisterForm)
+from .models import FailedLoginAttempt, PasswordReset, User
 
 blueprint = Blueprint('user', __name__, url_prefix='/users', static_folder='../static')
 
 
+#: Users' overview filters, by 'status' query argument.
+USER_STATUS_FILTERS = {
+    '': User.is_deleted.is_(False),
+    'active': User.is_active.is_(True) & User.is_deleted.is_(False),
+    'inactive': User.is_active.is_(False) & User.is_deleted.is_(False),
+    'deleted': User.is_deleted.is_(True)
+}
+
+#: Users' overview sort orders, by 'sort' query argument.
+USER_SORT_ORDERS = {
+    'email': User.email.asc(),
+    '-email': User.email.desc(),
+    'full_name': User.full_name.asc(),
+    '-full_name': User.full_name.desc(),
+    'last_login_at': User.last_login_at.asc(),
+    '-last_login_at': User.last_login_at.desc(),
+    'created_at': User.created_at.asc(),
+    '-created_at': User.created_at.desc()
+}
+
+
+def get_user_status_counts():
+    """Return number of users per 'USER_STATUS_FILTERS' key, in one GROUP BY query."""
+    counts = dict.fromkeys(USER_STATUS_FILTERS, 0)
+    for is_active, is_deleted, count in (db.session.query(User.is_active, User.is_deleted,
+                                                          func.count(User.id))
+                                         .group_by(User.is_active, User.is_deleted)):
+        if is_deleted:
+            counts['deleted'] += count
+        else:
+            counts[''] += count
+            counts['active' if is_active else 'inactive'] += count
+    return counts
+
+
 @blueprint.route('/')
 @login_required
 def home():
-    """Users' overview landing page."""
-    active_users = User.query.filter_by(is_active=True).order_by('email').all()
-    inactive_users = User.query.filter_by(is_active=False, is_deleted=False).order_by('email').all()
-
-    return render_template('users/home.html', active_users=active_users,
-                           inactive_users=inactive_users)
+    """Users' overview landing page, paginated, sortable and filterable.
+
+    Query arguments: 'status' (see 'USER_STATUS_FILTERS'), 'admin', 'email' (prefix), 'sort'
+    (see 'USER_SORT_ORDERS'), 'page' and 'per_page'. Permission counts come from a grouped
+    subquery; permissions themselves are not loaded.
+    """
+    status = request.args.get('status', '')
+    if status not in USER_STATUS_FILTERS:
+        status = ''
+    sort = request.args.get('sort', 'email')
+    if sort not in USER_SORT_ORDERS:
+        sort = 'email'
+    email = request.args.get('email', '').strip()
+    admin = bool(request.args.get('admin'))
+
+    permission_counts = (db.session.query(Permission.user_id,
+                                          func.count(Permission.id).label('count'))
+                         .group_by(Permission.user_id)
+                         .subquery())
+    query = (db.session.query(User, func.coalesce(permission_counts.c.count, 0))
+             .outerjoin(permission_counts, permission_counts.c.user_id == User.id)
+             .options(noload(User.permissions))
+             .filter(USER_STATUS_FILTERS[status]))
+    if admin:
+        query = query.filter(User.is_admin.is_(True))
+    if email:
+        query = query.filter(User.normalized_email.startswith(User.normalize_email(email),
+                                                              autoescape=True))
+    page, per_page = get_page_args()
+    pagination = (query.order_by(USER_SORT_ORDERS[sort], User.id)
+                  .paginate(page=page, per_page=per_page, error_out=False))
+
+    return stream_template('users/home.html', pagination=pagination, status=status, sort=sort,
+                           email=email, admin=admin, status_counts=get_user_status_counts())
 
 
 @blueprint.route('/approve_tos', methods=['GET', 'POST'])
@@ -266,7 +333,7 @@ def delete_user(user_id):
     if delete_user_form.validate_on_submit():
         old_email = user.email
         Token.delete_all_by_user(user)
-        Grant.delete_all_by_user(user)
+        grant_store.delete_all_by_user(user)
         FailedLoginAttempt.delete_all_by_user(user)
         user.soft_delete()
 
@@ -277,7 +344,7 @@ def delete_user(user_id):
         flash_errors(delete_user_form)
 
         tokens = Token.get_all_by_user(user)
-        grants = Grant.get_all_by_user(user)
+        grants = grant_store.get_all_by_user(user)
         failed_login_attempts = FailedLoginAttempt.get_all_by_user(user)
         permissions = user.permissions
         password_resets = user.password_resets
@@ -1,14 +1,22 @@
 """Helper utilities and decorators."""
 
 
-from flask import flash, request
+from flask import Response, current_app, flash, get_flashed_messages, request, url_for
+from flask.templating import stream_template as flask_stream_template
+from jinja2.environment import TemplateStream
 
 try:
     # noinspection PyCompatibility
-    from urlparse import urlparse, urljoin
+    from urlparse import urljoin, urlparse
 except ImportError:
     # noinspection PyCompatibility
-    from urllib.parse import urlparse, urljoin
+    from urllib.parse import urljoin, urlparse
+
+#: Template output chunks gathered per write by 'stream_template'.
+STREAM_BUFFER_SIZE = 100
+
+#: Rows fetched per round trip when iterating a 'KeysetPage'.
+KEYSET_BATCH_SIZE = 100
 
 
 def flash_errors(form, category='warning'):
@@ -37,3 +45,62 @@ def get_remote_addr():
         return request.headers['X-Real-IP']
     else:
         return request.remote_addr
+
+
+def get_page_args(page_arg='page'):
+    """Return (page, 'per_page') from query string, within sane bounds."""
+    page = request.args.get(page_arg, 1, type=int)
+    per_page = request.args.get('per_page', current_app.config['XL_AUTH_PAGE_SIZE'], type=int)
+    return max(page, 1), min(max(per_page, 1), current_app.config['XL_AUTH_MAX_PAGE_SIZE'])
+
+
+def url_for_page(page, page_arg='page'):
+    """Return URL for current view and query string, but on another 'page'."""
+    args = dict(request.view_args or {}, **request.args.to_dict())
+    args[page_arg] = page
+    return url_for(request.endpoint, **args)
+
+
+def stream_template(template_name, **context):
+    """Render template as a streamed response, sent while the template is still being rendered.
+
+    For list views, where rendering a large page would otherwise be held in memory in full and
+    delay the first byte until the last row is done; pass rows as a lazy iterable (e.g. a
+    'KeysetPage') to also keep them from being loaded up front. Output of Flask's own
+    'stream_template' is sent 'STREAM_BUFFER_SIZE' template writes at a time.
+
+    The session is saved before the body is sent, so flashed messages are taken from it here,
+    and streamed templates must not otherwise touch it (e.g. by rendering CSRF tokens).
+    """
+    get_flashed_messages()  # Kept on the request, for the layout to show.
+    chunks = flask_stream_template(template_name, **context)
+    stream = TemplateStream(chunks)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    response = Response(stream, mimetype='text/html')
+    response.call_on_close(chunks.close)  # E.g. when the client hangs up half way.
+    return response
+
+
+class KeysetPage(object):
+    """Up to 'per_page' rows of 'query', read from the cursor as they are iterated over.
+
+    Once iterated, 'next_key' holds 'get_key' of the last row if there are more rows after it,
+    and None otherwise.
+    """
+
+    def __init__(self, query, per_page, get_key):
+        """Create instance."""
+        self.query = query.limit(per_page + 1)
+        self.per_page = per_page
+        self.get_key = get_key
+        self.next_key = None
+
+    def __iter__(self):
+        """Yield rows, noting 'next_key' on finding the one after the last."""
+        last = None
+        for i, row in enumerate(self.query.yield_per(KEYSET_BATCH_SIZE)):
+            if i < self.per_page:
+                last = row
+                yield row
+            else:
+                self.next_key = self.get_key(last)